@@ -1,18 +1,41 @@
+import json
+import re
 import time
+from collections import Counter
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 from dataclasses import dataclass
-from typing import Any, Union
+from typing import Any, Awaitable, Callable, List, Optional, Union
 import aiosqlite
 import logfire
-import win32com.client
 from typing_extensions import TypeAlias
-from pydantic_ai import Agent, ModelRetry, RunContext
-from models import Success, InvalidRequest
+from pydantic_ai import Agent, ModelRetry, RunContext, capture_run_messages
+from pydantic_ai.exceptions import UnexpectedModelBehavior
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart
+from models import RequirementBatch, RequirementRecord, InvalidRequest
 from llms import model
+from doc_extractor import extract_text, DocExtractionError
+from db_pool import get_pool
+from metrics import registry, metric_labels
+from usage_tracker import record_usage
+from batch_controller import get_batch_controller
+from json_stream import parse_json_objects
 
 logfire.configure(token="your logfire token")
 
+# 分批模式配置
+DOC_BATCH_CONFIG = {
+    "max_batches": 6,  # 最大批次数（自适应模式下按最小批次放宽）
+    "adaptive_batching": True,  # 根据截断和耗时自动调整每批条数（AIMD）
+    "min_batch_size": 5,
+    "max_adaptive_batch_size": 60,
+    "max_truncation_retries": 3,  # 同一批次因截断缩小后重试的次数
+    "target_latency": 60,  # 批次耗时超过该值（秒）时缩小批次
+    "continuation": True,  # 输出被截断时保留完整的需求并从最后一条续写（关闭时按固定批次重新生成）
+    "max_continuations": 10,  # 最多续写轮数
+    "continuation_summary_chars": 1200,  # 续写提示中已完成需求摘要的最大长度
+}
+
 DB_SCHEMA = """
 CREATE TABLE test_requirements (
     ID INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -26,7 +49,20 @@ CREATE TABLE test_requirements (
 """
 
 
+DEFAULT_DOC_PATH = r'C:\develop\developfile\PythonProjects\Agent_testcase\doc\ERP（资源协同）管理平台需求说明书（商品管理部分）.doc'
+
+
 def extract_text_from_doc(file_path):
+    """
+    提取需求文档文本
+    优先使用纯 Python 解析器（结果按文件缓存，每次重试/分批不会重复解析），
+    仅在原生解析失败且本机安装了 WPS 时回退到 COM 自动化
+    """
+    try:
+        return extract_text(file_path)
+    except DocExtractionError as e:
+        print(f"原生解析文档失败: {e}，尝试使用 WPS 读取")
+    import win32com.client
     try:
         word = win32com.client.Dispatch("Wps.Application")
     except:
@@ -40,211 +76,480 @@ def extract_text_from_doc(file_path):
 
 @dataclass
 class DBConnection:
-    conn: aiosqlite.Connection
+    conn: Optional[aiosqlite.Connection] = None  # 智能体本身不访问数据库，需求由 RequirementStore 写入
 
 
-Response: TypeAlias = Union[Success, InvalidRequest]
+Response: TypeAlias = Union[RequirementBatch, InvalidRequest]
 agent: Agent = Agent(model=model, result_type=Response, deps_type=DBConnection)
 
 
 @agent.system_prompt
 async def system_prompt(ctx: RunContext[DBConnection]) -> str:
-    doc_path = r'C:\develop\developfile\PythonProjects\Agent_testcase\doc\ERP（资源协同）管理平台需求说明书（商品管理部分）.doc'
+    doc_path = getattr(ctx.deps, 'doc_path', None) or DEFAULT_DOC_PATH
     text = extract_text_from_doc(doc_path)
-    # 从 ctx.deps 获取 ID 起始值
-    start_id = getattr(ctx.deps, 'start_id', 1)
     return f"""
 你是一名高级软件测试工程师，请根据如下的软件测试需求说明书，生成专业的、高覆盖的测试用例需求列表。
 确保测试需求覆盖所有功能点，逻辑清晰，易于执行，且符合软件测试最佳实践。
-最终编写出符合用户请求的sql语句，将需求写入数据库。
 当前的时间为：{time.strftime('%Y-%m-%d')}
 
-重要：ID 生成规则
-- ID 必须从 {start_id} 开始，连续递增
-- 每条 INSERT 语句的 ID 字段必须严格按照此规则递增：{start_id}, {start_id+1}, {start_id+2}, ...
+输出要求：
+- 只需返回结构化的需求列表，每条需求包含：requirements（需求内容）、importance（重要程度：高/中/低）、
+  moduleName（模块名称）、submitter（提交人）
+- 不要编写 SQL，也不要生成 ID、日期和完成状态，这些字段由程序在写入数据库时统一分配
 - 请根据需求说明书的内容，生成合适数量的测试需求
 
-数据库模式如下：
+需求最终写入的数据库模式如下（仅供参考字段含义）：
 {DB_SCHEMA}
 
 需求说明书如下：
 {text}
-
-请生成标准的 INSERT 语句，确保 ID 字段严格按照指定规则递增。
 """
 
 
 @agent.result_validator
-async def validate_result(ctx: RunContext[DBConnection], result: Response):
+async def validate_result(ctx: RunContext[DBConnection], result: Response) -> Response:
     if isinstance(result, InvalidRequest):
-        return
+        return result
+
+    # 续写时返回空列表表示说明书中的需求已全部覆盖
+    if not result.requirements and not getattr(ctx.deps, 'continuation', False):
+        raise ModelRetry('需求列表为空，请根据需求说明书生成测试需求')
 
-    if not result.sql_query.upper().startswith('INSERT'):
-        raise ModelRetry('请创建一个 INSERT 插入')
+    empty = [i for i, record in enumerate(result.requirements, 1) if not record.requirements.strip()]
+    if empty:
+        raise ModelRetry(f'第 {empty} 条需求内容为空，请补充完整')
+    # 校验阶段不写数据库，避免重试时部分写入
+    return result
 
+
+INSERT_REQUIREMENT_SQL = """
+INSERT INTO test_requirements (ID, requirements, tag, date, submitter, importance, moduleName)
+VALUES (?, ?, 0, ?, ?, ?, ?)
+"""
+
+
+async def insert_requirements(conn: aiosqlite.Connection, records: List[RequirementRecord], start_id: int) -> List[dict]:
+    """
+    将一批需求写入数据库
+    ID 从 start_id 与表中最大 ID + 1 中较大者开始连续分配（调用方持有写连接，分配与写入之间不会有其他写入），
+    不会覆盖已有的需求（包括之前运行写入的需求）；整批通过一次 executemany 在同一事务中写入，
+    失败时回滚到保存点，不会留下部分写入的数据
+    Args:
+        conn: 数据库连接（写连接）
+        records: 需求列表
+        start_id: 最小起始 ID
+    Returns:
+        写入的需求行（含实际分配的 ID）
+    """
+    async with conn.execute('SELECT MAX(ID) FROM test_requirements') as cursor:
+        max_id = (await cursor.fetchone())[0]
+    first_id = max(start_id, (max_id or 0) + 1)
+    if first_id != start_id:
+        print(f"ID {start_id} 起已有需求，本批从 ID {first_id} 开始写入")
+    today = time.strftime('%Y-%m-%d')
+    rows = [
+        {
+            'ID': first_id + i,
+            'requirements': record.requirements,
+            'tag': 0,
+            'date': today,
+            'submitter': record.submitter,
+            'importance': record.importance,
+            'moduleName': record.moduleName,
+        }
+        for i, record in enumerate(records)
+    ]
+    await conn.execute('SAVEPOINT insert_requirements')
     try:
-        await ctx.deps.conn.executescript(result.sql_query)
-    except aiosqlite.Error as e:
-        raise ModelRetry(f'无效的插入: {e}') from e
-    else:
-        return
+        await conn.executemany(INSERT_REQUIREMENT_SQL, [
+            (row['ID'], row['requirements'], row['date'], row['submitter'], row['importance'], row['moduleName'])
+            for row in rows
+        ])
+    except aiosqlite.Error:
+        await conn.execute('ROLLBACK TO SAVEPOINT insert_requirements')
+        await conn.execute('RELEASE SAVEPOINT insert_requirements')
+        raise
+    await conn.execute('RELEASE SAVEPOINT insert_requirements')
+    await conn.commit()
+    return rows
 
 
 @asynccontextmanager
 async def connect_database(database: str) -> AsyncGenerator[Any, None]:
-    # 完全移除span的使用
-    conn = await aiosqlite.connect(database)
-    try:
+    # 从共享连接池借出写连接（WAL 模式，连接在流水线各阶段间复用，首次打开时自动迁移）
+    async with get_pool(database).writer() as conn:
         yield conn
-    finally:
-        await conn.close()
 
 
-def is_output_truncated(sql_query: str, expected_min_count: int = 5) -> bool:
+class RequirementStore:
+    """
+    按批次写入需求：只在写入时借用共享写连接，调用大模型期间不占用，
+    其他任务（流水线模式下的查询和测试用例阶段）可以同时写入检查点
+    """
+
+    def __init__(self, database: str):
+        self.database = database
+
+    async def insert(self, records: List[RequirementRecord], start_id: int) -> List[dict]:
+        """写入一批需求，见 insert_requirements"""
+        async with connect_database(self.database) as conn:
+            return await insert_requirements(conn, records, start_id)
+
+
+def is_output_truncated(raw_output: str) -> bool:
     """
-    检测输出是否被截断
+    检测结构化输出是否被截断
     Args:
-        sql_query: SQL查询字符串
-        expected_min_count: 预期最少条数
+        raw_output: 模型返回的原始结果参数（JSON 文本）
     Returns:
         是否被截断
     """
-    if not sql_query:
+    if not raw_output:
         return True
     
-    # 检查是否以完整的分号结尾
-    if not sql_query.strip().endswith(';') and not sql_query.strip().endswith(')'):
+    raw_output = raw_output.strip()
+    # 检查是否以完整的对象结尾
+    if not raw_output.endswith('}'):
         return True
     
-    # 检查INSERT语句数量是否过少
-    insert_count = sql_query.count('INSERT INTO')
-    if insert_count < expected_min_count:
-        return False  # 数量少但可能是正常的
-    
-    # 检查最后一条INSERT是否完整
-    last_insert_pos = sql_query.rfind('INSERT INTO')
-    if last_insert_pos != -1:
-        remaining = sql_query[last_insert_pos:]
-        if not (remaining.count('(') == remaining.count(')') and remaining.endswith(';')):
-            return True
-    
+    try:
+        json.loads(raw_output)
+    except json.JSONDecodeError:
+        return True
     return False
 
 
-async def run_agent(prompt: str, start_id: int = 1, max_batch_size: int = 20):
+def last_response_output(messages: list) -> str:
+    """取最后一条模型响应的原始输出（结果工具参数或文本）"""
+    for message in reversed(messages):
+        if isinstance(message, ModelResponse):
+            for part in message.parts:
+                if isinstance(part, ToolCallPart):
+                    return part.args_as_json_str()
+                if isinstance(part, TextPart):
+                    return part.content
+    return ''
+
+
+def salvage_requirements(raw_output: str) -> List[RequirementRecord]:
+    """
+    从被截断的结构化输出中取出所有完整的需求记录
+    Args:
+        raw_output: 模型返回的原始结果参数（JSON 文本）
+    Returns:
+        完整且有效的需求记录（被截断的最后一条会被丢弃）
+    """
+    start = raw_output.find('[')
+    if start < 0:
+        return []
+    objects, _ = parse_json_objects(raw_output[start:])
+    records = []
+    for item in objects:
+        try:
+            record = RequirementRecord(**item)
+        except Exception:
+            continue
+        if record.requirements.strip():
+            records.append(record)
+    return records
+
+
+def _normalize_requirement(text: str) -> str:
+    return re.sub(r'\s+', '', text)
+
+
+def describe_committed(rows: List[dict], max_chars: int) -> str:
     """
-    运行文档需求分析智能体，支持智能分批
+    已写入需求的精简描述（各模块条数 + 最近若干条的摘要），用于续写提示
+    Args:
+        rows: 已写入的需求行
+        max_chars: 描述的最大长度
+    Returns:
+        描述文本
+    """
+    modules = Counter(row['moduleName'] for row in rows)
+    header = "已覆盖的模块：" + "、".join(f"{name}（{count} 条）" for name, count in modules.items())
+    lines = []
+    length = len(header)
+    for row in reversed(rows):
+        line = f"- ID {row['ID']} [{row['moduleName']}] {row['requirements'][:30]}"
+        if length + len(line) + 1 > max_chars:
+            break
+        lines.append(line)
+        length += len(line) + 1
+    omitted = len(rows) - len(lines)
+    summary = [header, "已写入的需求（最近的在最后）："]
+    if omitted:
+        summary.append(f"- ……（更早的 {omitted} 条从略）")
+    return "\n".join(summary + lines[::-1])
+
+
+async def commit_batch(checkpoint, on_rows: Optional[Callable[[List[dict]], Awaitable[Any]]], batch_num: int,
+                       rows: List[dict], final: bool):
+    """记录一个已写入数据库的批次：写入检查点，并交给下游阶段（流水线模式）"""
+    if checkpoint:
+        await checkpoint.save_batch("doc", batch_num, {"rows": rows, "final": final})
+    if on_rows and rows:
+        await on_rows(rows)
+
+
+async def continue_generation(store: RequirementStore, prompt: str, rows: List[dict], start_id: int,
+                              doc_path: str = None, checkpoint=None, batch_num: int = 1, on_rows=None) -> List[dict]:
+    """
+    续写模式：从最后一条已写入的需求之后继续生成，直到说明书中的需求全部覆盖
+    每轮提示中带上已完成需求的精简描述；再次被截断时同样保留完整的记录并继续；
+    与已写入需求内容相同的记录会被跳过，不会重复写入
+    Args:
+        store: 需求写入
+        prompt: 用户提示
+        rows: 已写入的需求行（会被原地扩展）
+        start_id: 整个运行的起始 ID
+        doc_path: 需求文档路径
+        checkpoint: 运行检查点
+        batch_num: 已完成的最后一个批次编号（检查点编号）
+        on_rows: 每轮新写入的需求行的回调
+    Returns:
+        全部需求行
+    """
+    seen = {_normalize_requirement(row['requirements']) for row in rows}
+    stalled = 0
+    for round_num in range(1, DOC_BATCH_CONFIG["max_continuations"] + 1):
+        batch_start_time = time.time()
+        batch_num += 1
+        next_id = rows[-1]['ID'] + 1 if rows else start_id
+        description = describe_committed(rows, DOC_BATCH_CONFIG["continuation_summary_chars"]) if rows else "尚未写入任何需求。"
+        continuation_prompt = (
+            f"{prompt}\n\n这是续写请求：之前的输出因长度限制被截断，已有 {len(rows)} 条需求写入数据库。\n"
+            f"{description}\n"
+            f"请按需求说明书的顺序，从最后一条之后继续生成尚未覆盖的需求（将从 ID {next_id} 开始编号），"
+            f"不要重复上面已有的需求；如果说明书中的需求已全部覆盖，返回空的需求列表。"
+        )
+        deps = DBConnection()
+        deps.start_id = next_id
+        deps.doc_path = doc_path
+        deps.continuation = True
+
+        truncated = False
+        with capture_run_messages() as messages, metric_labels(stage="doc", batch=batch_num):
+            try:
+                result = await agent.run(continuation_prompt, deps=deps)
+                record_usage("doc", result.usage())
+                records = extract_requirements_from_result(result)
+            except UnexpectedModelBehavior as e:
+                raw_output = last_response_output(messages)
+                if not is_output_truncated(raw_output):
+                    registry.inc("llm_parse_failures_total", stage="doc", batch=batch_num)
+                    print(f"第 {round_num} 轮续写结构化输出解析失败: {e}，结束续写")
+                    break
+                registry.inc("llm_truncations_total", stage="doc", batch=batch_num)
+                records = salvage_requirements(raw_output)
+                truncated = True
+
+        new_records = []
+        for record in records:
+            key = _normalize_requirement(record.requirements)
+            if key not in seen:
+                seen.add(key)
+                new_records.append(record)
+        if len(new_records) < len(records):
+            print(f"第 {round_num} 轮续写跳过 {len(records) - len(new_records)} 条重复需求")
+        batch_rows = await store.insert(new_records, next_id) if new_records else []
+        rows.extend(batch_rows)
+        # 没有被截断说明模型已经输出了剩余的全部需求
+        finished = not truncated
+        await commit_batch(checkpoint, on_rows, batch_num, batch_rows, finished)
+        print(f"第 {round_num} 轮续写完成，新增 {len(batch_rows)} 条，累计 {len(rows)} 条，耗时 {time.time() - batch_start_time:.2f} 秒")
+        if finished:
+            break
+        stalled = 0 if batch_rows else stalled + 1
+        if stalled >= 2:
+            print("连续两轮续写没有新增需求，结束续写")
+            break
+    else:
+        print("达到最大续写轮数，结束续写")
+    return rows
+
+
+async def run_agent(prompt: str, start_id: int = 1, max_batch_size: int = 20, doc_path: str = None,
+                    db_path: str = '.chat_app_db.sqlite', checkpoint=None,
+                    on_rows: Optional[Callable[[List[dict]], Awaitable[Any]]] = None):
+    """
+    运行文档需求分析智能体，优先一次性生成；输出被截断时默认保留完整的需求并续写（续写关闭时智能分批）
     Args:
         prompt: 用户提示
         start_id: ID 起始值
         max_batch_size: 单批最大条数（用于分批时）
+        doc_path: 需求文档路径（为空时使用默认文档）
+        db_path: 数据库路径
+        checkpoint: 运行检查点（checkpoint_store.RunCheckpoint），每个批次完成后记录，续跑时从最后一个批次之后继续
+        on_rows: 每个批次写入数据库后调用（协程），流水线模式下把需求行交给查询阶段；续跑时恢复的批次同样会交出
     Returns:
-        生成的 SQL 语句列表
+        写入数据库的需求行列表
     """
     start_time = time.time()
     
-    async with connect_database('.chat_app_db.sqlite') as conn:
+    store = RequirementStore(db_path)
+    # 续跑：恢复检查点中已完成的批次，不再重复调用大模型
+    saved_batches = await checkpoint.load_batches("doc") if checkpoint else {}
+    if saved_batches:
+        all_rows = [row for payload in saved_batches.values() for row in payload["rows"]]
+        print(f"从检查点恢复 {len(saved_batches)} 个批次，共 {len(all_rows)} 条需求")
+        if on_rows:
+            for payload in saved_batches.values():
+                if payload["rows"]:
+                    await on_rows(payload["rows"])
+        if saved_batches[max(saved_batches)]["final"]:
+            return all_rows
+    else:
         # 第一次尝试：一次性生成全部
-        deps = DBConnection(conn)
+        deps = DBConnection()
         deps.start_id = start_id
+        deps.doc_path = doc_path
+    
+        with capture_run_messages() as messages, metric_labels(stage="doc", batch=1):
+            try:
+                result = await agent.run(prompt, deps=deps)
+                record_usage("doc", result.usage())
+                print("agent.run data:", result.data)
+                records = extract_requirements_from_result(result)
+            except UnexpectedModelBehavior:
+                # 检查是否是输出被截断导致结构化参数无法解析，其他错误直接抛出
+                raw_output = last_response_output(messages)
+                if not is_output_truncated(raw_output):
+                    registry.inc("llm_parse_failures_total", stage="doc", batch=1)
+                    raise
+                registry.inc("llm_truncations_total", stage="doc", batch=1)
+                records = None
+    
+        if records is not None:
+            if not records:
+                print("未获取到需求列表")
+                return []
+            rows = await store.insert(records, start_id)
+            await commit_batch(checkpoint, on_rows, 1, rows, True)
+            elapsed = time.time() - start_time
+            print(f"一次性生成完成，共 {len(rows)} 条，耗时 {elapsed:.2f} 秒")
+            return rows
+    
+        all_rows = []
+        if DOC_BATCH_CONFIG["continuation"]:
+            # 续写模式：保留截断输出中的完整需求，从最后一条之后继续
+            print("检测到输出被截断，保留已完成的需求并启动续写模式...")
+            salvaged = salvage_requirements(raw_output)
+            if salvaged:
+                all_rows = await store.insert(salvaged, start_id)
+            await commit_batch(checkpoint, on_rows, 1, all_rows, False)
+        else:
+            print("检测到输出可能被截断，启动分批模式...")
+    
+    if DOC_BATCH_CONFIG["continuation"]:
+        all_rows = await continue_generation(store, prompt, all_rows, start_id, doc_path, checkpoint,
+                                             batch_num=max(saved_batches) if saved_batches else 1, on_rows=on_rows)
+        print(f"续写模式完成，总共生成 {len(all_rows)} 条，总耗时 {time.time() - start_time:.2f} 秒")
+        return all_rows
+    
+    # 分批处理模式
+    current_id = all_rows[-1]['ID'] + 1 if all_rows else start_id
+    batch_num = max(saved_batches) if saved_batches else 1
+    truncation_retries = 0
+    
+    controller = None
+    max_batches = DOC_BATCH_CONFIG["max_batches"]
+    if DOC_BATCH_CONFIG["adaptive_batching"]:
+        controller = get_batch_controller(
+            "doc",
+            initial=max_batch_size,
+            owner=checkpoint,
+            min_size=DOC_BATCH_CONFIG["min_batch_size"],
+            max_size=DOC_BATCH_CONFIG["max_adaptive_batch_size"],
+            target_latency=DOC_BATCH_CONFIG["target_latency"],
+        )
+        # 批次可能被缩小，按最小批次能覆盖的条数放宽批次上限
+        max_batches = controller.max_rounds(max_batches * max_batch_size, max_batches)
+    
+    while True:
+        batch_start_time = time.time()
+        batch_size = controller.next_size() if controller else max_batch_size
+        # 简化批次提示词，避免复杂的上下文
+        batch_prompt = f"{prompt}，请生成第 {len(all_rows) + 1} 条开始的 {batch_size} 条需求记录。"
         
-        result = await agent.run(prompt, deps=deps)
-        print("agent.run result:", result)
-        print("agent.run data:", result.data)
+        deps = DBConnection()
+        deps.start_id = current_id
+        deps.batch_size = batch_size
+        deps.doc_path = doc_path
         
-        # 提取 SQL 查询
-        sql_query = await extract_sql_from_result(result)
+        with capture_run_messages() as batch_messages:
+            try:
+                with metric_labels(stage="doc", batch=batch_num + 1):
+                    result = await agent.run(batch_prompt, deps=deps)
+                record_usage("doc", result.usage())
+                records = extract_requirements_from_result(result)
+            except UnexpectedModelBehavior as e:
+                truncated = is_output_truncated(last_response_output(batch_messages))
+                if (controller and truncated and batch_size > controller.min_size
+                        and truncation_retries < DOC_BATCH_CONFIG["max_truncation_retries"]):
+                    # 输出被截断：缩小批次后重试同一批
+                    registry.inc("llm_truncations_total", stage="doc", batch=batch_num + 1)
+                    controller.observe(batch_size, 0, time.time() - batch_start_time, truncated=True)
+                    truncation_retries += 1
+                    print(f"第 {batch_num} 批次输出被截断，缩小批次后重试")
+                    continue
+                registry.inc("llm_parse_failures_total", stage="doc", batch=batch_num + 1)
+                print(f"第 {batch_num} 批次结构化输出解析失败: {e}，结束分批")
+                break
         
-        if not sql_query:
-            print("未获取到 sql_query 字段")
-            return []
+        batch_elapsed = time.time() - batch_start_time
+        truncation_retries = 0
         
-        # 检查是否被截断
-        if not is_output_truncated(sql_query):
-            # 输出完整，直接返回
-            sqls = [s.strip() for s in sql_query.split(';') if s.strip()]
-            elapsed = time.time() - start_time
-            print(f"一次性生成完成，共 {len(sqls)} 条，耗时 {elapsed:.2f} 秒")
-            return sqls
+        if not records:
+            print(f"第 {batch_num} 批次未获取到数据，结束分批")
+            break
         
-        print("检测到输出可能被截断，启动分批模式...")
+        batch_rows = await store.insert(records, current_id)
+        all_rows.extend(batch_rows)
+        current_id = batch_rows[-1]['ID'] + 1
+        await commit_batch(checkpoint, on_rows, batch_num + 1, batch_rows, len(batch_rows) < batch_size)
         
-        # 分批处理模式
-        all_sqls = []
-        current_id = start_id
-        batch_num = 1
+        print(f"第 {batch_num} 批次完成，生成 {len(batch_rows)} 条，累计 {len(all_rows)} 条，耗时 {batch_elapsed:.2f} 秒")
         
-        while True:
-            batch_start_time = time.time()
-            # 简化批次提示词，避免复杂的上下文
-            batch_prompt = f"{prompt}，请生成从ID {current_id} 开始的 {max_batch_size} 条记录。"
-            
-            deps = DBConnection(conn)  # 复用同一个连接
-            deps.start_id = current_id
-            deps.batch_size = max_batch_size
-            
-            result = await agent.run(batch_prompt, deps=deps)
-            sql_query = await extract_sql_from_result(result)
-            
-            batch_elapsed = time.time() - batch_start_time
-            
-            if not sql_query:
-                print(f"第 {batch_num} 批次未获取到数据，结束分批")
-                break
-            
-            batch_sqls = [s.strip() for s in sql_query.split(';') if s.strip()]
-            if not batch_sqls:
-                print(f"第 {batch_num} 批次无有效SQL，结束分批")
-                break
-            
-            all_sqls.extend(batch_sqls)
-            current_id += len(batch_sqls)
-            
-            print(f"第 {batch_num} 批次完成，生成 {len(batch_sqls)} 条，累计 {len(all_sqls)} 条，耗时 {batch_elapsed:.2f} 秒")
-            
-            # 如果本批次生成数量少于预期，说明已经生成完毕
-            if len(batch_sqls) < max_batch_size:
-                print("本批次数量少于预期，推测已生成完毕")
-                break
-            
-            batch_num += 1
-            
-            # 防止无限循环，减少最大批次限制
-            if batch_num > 6:
-                print("达到最大批次限制，结束分批")
-                break
+        # 如果本批次生成数量少于预期，说明已经生成完毕
+        if len(batch_rows) < batch_size:
+            print("本批次数量少于预期，推测已生成完毕")
+            break
+        
+        if controller:
+            controller.observe(batch_size, len(batch_rows), batch_elapsed)
         
-        total_elapsed = time.time() - start_time
-        print(f"分批模式完成，总共生成 {len(all_sqls)} 条，总耗时 {total_elapsed:.2f} 秒")
-        return all_sqls
+        batch_num += 1
+        
+        # 防止无限循环
+        if batch_num > max_batches:
+            print("达到最大批次限制，结束分批")
+            break
+    
+    total_elapsed = time.time() - start_time
+    print(f"分批模式完成，总共生成 {len(all_rows)} 条，总耗时 {total_elapsed:.2f} 秒")
+    return all_rows
 
 
-async def extract_sql_from_result(result) -> str:
+def extract_requirements_from_result(result) -> List[RequirementRecord]:
     """
-    从 PydanticAI 结果中提取 SQL 查询
+    从 PydanticAI 结果中提取结构化需求列表
     """
-    sql_query = None
     output = result.data
     
-    if output and hasattr(output, 'sql_query'):
-        sql_query = output.sql_query
-    elif output and isinstance(output, dict) and 'sql_query' in output:
-        sql_query = output['sql_query']
-    else:
-        # 如果 data 是 None，尝试从 tool call 中提取
-        for message in result._all_messages:
-            if hasattr(message, 'parts'):
-                for part in message.parts:
-                    if hasattr(part, 'tool_name') and 'Success' in part.tool_name and hasattr(part, 'args'):
-                        try:
-                            import json
-                            args_data = json.loads(part.args)
-                            if 'sql_query' in args_data:
-                                sql_query = args_data['sql_query']
-                                break
-                        except:
-                            continue
-            if sql_query:
-                break
+    if isinstance(output, InvalidRequest):
+        print(f"模型认为请求无效: {output.error_message}")
+        return []
+    if isinstance(output, RequirementBatch):
+        return output.requirements
     
-    return sql_query
\ No newline at end of file
+    # 如果 data 为空，尝试从 tool call 中提取
+    for message in result.all_messages():
+        for part in getattr(message, 'parts', []):
+            if 'RequirementBatch' in getattr(part, 'tool_name', '') and hasattr(part, 'args_as_dict'):
+                try:
+                    return RequirementBatch(**part.args_as_dict()).requirements
+                except Exception:
+                    continue
+    return []
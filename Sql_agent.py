@@ -1,14 +1,22 @@
 import asyncio
+import json
+import os
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 from dataclasses import dataclass
-from typing import Any, Union, List
+from typing import Any, Union, List, Optional
 import aiosqlite
 import logfire
 from typing_extensions import TypeAlias
 from pydantic_ai import Agent, ModelRetry, RunContext
 from models import Success, InvalidRequest
 from llms import model
+from sql_plan_cache import SqlPlanCache
+from sql_intent import RequirementFilterParser
+from db_pool import get_pool
+from metrics import metric_labels
+from usage_tracker import record_usage
+from db_migrations import fts_tokenizer, describe_schema, FTS_TABLE, LATEST_VERSION
 
 logfire.configure(token="your logfire token")
 
@@ -25,6 +33,14 @@ CREATE TABLE test_requirements (
 """
 
 
+# 查询计划缓存：归一化请求文本 + 表结构哈希 -> 已校验的 SQL
+plan_cache = SqlPlanCache(os.environ.get("SQL_PLAN_CACHE_PATH", ".sql_plan_cache.sqlite"),
+                          f"{DB_SCHEMA}\n-- schema version {LATEST_VERSION}")
+
+# 常见筛选请求的规则解析器（快速通道，不调用大模型）
+filter_parser = RequirementFilterParser()
+
+
 @dataclass
 class DBConnection:
     conn: aiosqlite.Connection  # SQLite 数据库连接
@@ -38,6 +54,7 @@ async def system_prompt(ctx: RunContext[DBConnection]) -> str:
     # 从 ctx.deps 获取 ID 相关参数
     start_id = getattr(ctx.deps, 'start_id', 1)
     filter_text = getattr(ctx.deps, 'filter', '')
+    tokenizer = getattr(ctx.deps, 'fts_tokenizer', None)
     return f'''
 你是SQL专家。请根据用户请求，生成只包含SELECT的SQL查询，并返回如下JSON格式：
 {{
@@ -46,16 +63,8 @@ async def system_prompt(ctx: RunContext[DBConnection]) -> str:
   "requirements_list": []
 }}
 
-数据库模式：
-CREATE TABLE test_requirements (
-    ID INTEGER PRIMARY KEY AUTOINCREMENT,
-    requirements TEXT NOT NULL,
-    tag INTEGER DEFAULT 0,
-    date TEXT NOT NULL,
-    submitter TEXT NOT NULL,
-    importance TEXT NOT NULL,
-    moduleName TEXT NOT NULL
-);
+数据库模式：{DB_SCHEMA}
+{describe_schema(tokenizer)}
 
 重要规则：
 1. 只允许SELECT，禁止分号、注释、union等危险语句
@@ -91,14 +100,176 @@ async def execute_sql(ctx: RunContext[DBConnection], result: Response) -> List:
 @asynccontextmanager
 async def connect_database(database: str) -> AsyncGenerator[Any, None]:
     with logfire.span('连接数据库'):
-        conn = await aiosqlite.connect(database)
-        try:
+        # 从共享连接池借出读连接，WAL 模式下不会被写入阻塞
+        async with get_pool(database).reader() as conn:
             yield conn
-        finally:
-            await conn.close()
 
 
-async def run_agent(prompt: str, db_path: str = None, filter: str = None, start_id: int = 1):
+def plan_cache_key(prompt: str, filter_text: str, start_id: int) -> str:
+    """
+    计算查询计划缓存键
+    只有请求涉及 ID 筛选时 start_id 才会影响生成的 SQL，因此仅在这种情况下参与计算
+    """
+    parts = [prompt or '', filter_text or '']
+    if 'id' in f"{prompt} {filter_text}".lower():
+        parts.append(str(start_id))
+    return plan_cache.make_key(*parts)
+
+
+async def fetch_requirements(conn: aiosqlite.Connection, sql_query: str, params: tuple = ()) -> List[str]:
+    """
+    执行查询并返回需求文本列表
+    Args:
+        conn: 数据库连接
+        sql_query: SELECT 查询
+        params: 查询参数
+    Returns:
+        需求文本列表
+    """
+    cursor = await conn.execute(sql_query, params)
+    rows = await cursor.fetchall()
+    await cursor.close()
+    
+    # 将查询结果转换为需求列表
+    requirements_list = []
+    for row in rows:
+        # 假设表结构：ID, requirements, tag, date, submitter, importance, moduleName
+        requirement_data = {
+            'ID': row[0],
+            'requirements': row[1],
+            'tag': row[2],
+            'date': row[3],
+            'submitter': row[4],
+            'importance': row[5],
+            'moduleName': row[6]
+        }
+        requirements_list.append(requirement_data)
+    
+    print(f"查询到 {len(requirements_list)} 条需求数据")
+    
+    # 为了向后兼容，返回需求文本列表
+    return [req['requirements'] for req in requirements_list]
+
+
+@dataclass
+class QueryPlan:
+    """已校验的需求查询"""
+    sql: str
+    params: tuple = ()
+    source: str = "llm"  # fast_path：规则快速通道 / plan_cache：查询计划缓存 / llm：大模型生成
+    cache_key: str = ""
+
+
+async def plan_query(conn: aiosqlite.Connection, prompt: str, filter: str = None, start_id: int = 1,
+                     use_plan_cache: bool = True, use_fast_path: bool = True) -> Optional[QueryPlan]:
+    """
+    生成需求查询（不执行）：依次尝试规则快速通道、查询计划缓存和大模型
+    查询只依赖表结构，因此可以在需求写入数据库之前生成（流水线模式与需求提取同时进行）
+    Args:
+        conn: 数据库连接
+        prompt: 用户提示
+        filter: 查询过滤条件
+        start_id: ID 起始值（用于提示模型当前数据范围）
+        use_plan_cache: 是否使用查询计划缓存（命中时不调用大模型）
+        use_fast_path: 是否先用规则解析常见筛选条件（解析成功时不调用大模型）
+    Returns:
+        查询计划，大模型未给出 SQL 时返回 None
+    """
+    tokenizer = await fts_tokenizer(conn)
+    # 规则快速通道的全文检索写法依赖 trigram 子串匹配
+    filter_parser.fts_table = FTS_TABLE if tokenizer == "trigram" else None
+    
+    if use_fast_path:
+        parsed = filter_parser.parse(prompt, filter)
+        stats = filter_parser.stats()
+        if parsed:
+            sql_query, params = parsed
+            print(f"规则快速通道生成SQL: {sql_query} 参数: {params}（命中率 {stats['hit_rate']:.0%}）")
+            return QueryPlan(sql_query, tuple(params), "fast_path")
+        print(f"规则快速通道无法解析，使用大模型生成（命中率 {stats['hit_rate']:.0%}）")
+    
+    cache_key = plan_cache_key(prompt, filter, start_id)
+    if use_plan_cache:
+        cached_sql = plan_cache.get(cache_key)
+        if cached_sql:
+            print(f"命中查询计划缓存: {cached_sql}")
+            try:
+                await conn.execute(f'EXPLAIN QUERY PLAN {cached_sql}')
+                return QueryPlan(cached_sql, (), "plan_cache", cache_key)
+            except aiosqlite.Error as e:
+                print(f"缓存的SQL执行失败: {e}，重新生成")
+                plan_cache.invalidate(cache_key)
+    
+    # 创建带 ID 信息的依赖对象
+    deps = DBConnection(conn)
+    deps.filter = filter
+    deps.start_id = start_id
+    deps.fts_tokenizer = tokenizer
+    
+    with metric_labels(stage="sql"):
+        result = await agent.run(prompt, deps=deps)
+    record_usage("sql", result.usage())
+    print("agent.run result:", result)
+    print("agent.run data:", result.data)
+    
+    # 尝试多种方式获取 sql_query
+    sql_query = None
+    output = result.data
+    
+    if output and hasattr(output, 'sql_query'):
+        sql_query = output.sql_query
+    elif output and isinstance(output, dict) and 'sql_query' in output:
+        sql_query = output['sql_query']
+    else:
+        # 如果 data 是 None，尝试从 tool call 中提取
+        for message in result._all_messages:
+            if hasattr(message, 'parts'):
+                for part in message.parts:
+                    if hasattr(part, 'tool_name') and 'Success' in part.tool_name and hasattr(part, 'args'):
+                        try:
+                            import json
+                            args_data = json.loads(part.args)
+                            if 'sql_query' in args_data:
+                                sql_query = args_data['sql_query']
+                                break
+                        except:
+                            continue
+            if sql_query:
+                break
+    
+    if not sql_query:
+        print("未获取到 sql_query 字段，data:", output)
+        return None
+    
+    print(f"生成的SQL查询: {sql_query}")
+    return QueryPlan(sql_query, (), "llm", cache_key)
+
+
+def remember_plan(plan: QueryPlan, prompt: str, filter: str = None):
+    """大模型生成的 SQL 执行成功后写入查询计划缓存"""
+    if plan.source == "llm" and plan.cache_key:
+        plan_cache.put(plan.cache_key, f"{prompt}\n{filter or ''}", plan.sql)
+
+
+async def fetch_requirements_between(conn: aiosqlite.Connection, plan: QueryPlan, first_id: int, last_id: int) -> List[str]:
+    """
+    只在 ID 范围 [first_id, last_id] 内执行查询（流水线模式按需求批次筛选）
+    查询结果的列与 test_requirements 一致（见 fetch_requirements），作为子查询再按 ID 过滤
+    """
+    return await fetch_requirements(conn, f"SELECT * FROM ({plan.sql}) WHERE ID BETWEEN ? AND ?",
+                                    tuple(plan.params) + (first_id, last_id))
+
+
+async def fetch_requirements_in(conn: aiosqlite.Connection, plan: QueryPlan, ids: List[int]) -> List[str]:
+    """只在给定的需求 ID 中执行查询（逐阶段模式只查询本次运行写入的需求）"""
+    if not ids:
+        return []
+    return await fetch_requirements(conn, f"SELECT * FROM ({plan.sql}) WHERE ID IN (SELECT value FROM json_each(?))",
+                                    tuple(plan.params) + (json.dumps(ids),))
+
+
+async def run_agent(prompt: str, db_path: str = None, filter: str = None, start_id: int = 1, use_plan_cache: bool = True,
+                    use_fast_path: bool = True, ids: Optional[List[int]] = None):
     """
     运行 SQL 查询智能体
     Args:
@@ -106,77 +277,31 @@ async def run_agent(prompt: str, db_path: str = None, filter: str = None, start_
         db_path: 数据库路径
         filter: 查询过滤条件
         start_id: ID 起始值（用于提示模型当前数据范围）
+        use_plan_cache: 是否使用查询计划缓存（命中时不调用大模型）
+        use_fast_path: 是否先用规则解析常见筛选条件（解析成功时不调用大模型）
+        ids: 只在这些需求 ID 中查询（为空时查询整张表）
     Returns:
         查询结果的需求列表
     """
     async with connect_database(db_path) as conn:
-        # 创建带 ID 信息的依赖对象
-        deps = DBConnection(conn)
-        deps.filter = filter
-        deps.start_id = start_id
-        
-        result = await agent.run(prompt, deps=deps)
-        print("agent.run result:", result)
-        print("agent.run data:", result.data)
-        
-        # 尝试多种方式获取 sql_query
-        sql_query = None
-        output = result.data
-        
-        if output and hasattr(output, 'sql_query'):
-            sql_query = output.sql_query
-        elif output and isinstance(output, dict) and 'sql_query' in output:
-            sql_query = output['sql_query']
-        else:
-            # 如果 data 是 None，尝试从 tool call 中提取
-            for message in result._all_messages:
-                if hasattr(message, 'parts'):
-                    for part in message.parts:
-                        if hasattr(part, 'tool_name') and 'Success' in part.tool_name and hasattr(part, 'args'):
-                            try:
-                                import json
-                                args_data = json.loads(part.args)
-                                if 'sql_query' in args_data:
-                                    sql_query = args_data['sql_query']
-                                    break
-                            except:
-                                continue
-                if sql_query:
-                    break
-        
-        if not sql_query:
-            print("未获取到 sql_query 字段，data:", output)
+        plan = await plan_query(conn, prompt, filter, start_id, use_plan_cache, use_fast_path)
+        if plan is None:
             return []
-        
-        print(f"生成的SQL查询: {sql_query}")
+        if ids is not None:
+            execute = fetch_requirements_in(conn, plan, ids)
+        else:
+            execute = fetch_requirements(conn, plan.sql, plan.params)
+        if plan.source == "fast_path":
+            return await execute
         
         # 执行 SQL 查询获取实际数据
         try:
-            cursor = await conn.execute(sql_query)
-            rows = await cursor.fetchall()
-            await cursor.close()
-            
-            # 将查询结果转换为需求列表
-            requirements_list = []
-            for row in rows:
-                # 假设表结构：ID, requirements, tag, date, submitter, importance, moduleName
-                requirement_data = {
-                    'ID': row[0],
-                    'requirements': row[1],
-                    'tag': row[2],
-                    'date': row[3],
-                    'submitter': row[4],
-                    'importance': row[5],
-                    'moduleName': row[6]
-                }
-                requirements_list.append(requirement_data)
-            
-            print(f"查询到 {len(requirements_list)} 条需求数据")
-            
-            # 为了向后兼容，返回需求文本列表
-            requirement_texts = [req['requirements'] for req in requirements_list]
-            return requirement_texts
-            
+            requirement_texts = await execute
         except Exception as e:
             print(f"执行SQL查询失败: {e}")
-            return []
\ No newline at end of file
+            return []
+        
+        # 只缓存校验通过且执行成功的 SQL
+        if use_plan_cache:
+            remember_plan(plan, prompt, filter)
+        return requirement_texts
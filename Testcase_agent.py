@@ -10,13 +10,21 @@
 import json
 import os
 import asyncio
-from typing import List, Dict
+import inspect
+from dataclasses import dataclass
+from typing import List, Dict, Callable, Optional, Any, Tuple, Awaitable
 import pandas as pd
 import logfire
 from openpyxl.reader.excel import load_workbook
 from pydantic_ai import Agent, RunContext
+from pydantic_ai.usage import Usage
 from models import TestcaseAgentDeps
-from llms import model
+from llms import model, http_transport, MAX_CONNECTIONS
+from json_stream import JSONObjectStream, ParseReport, parse_json_objects
+from excel_sink import ExcelSink, EXCEL_CONFIG, TESTCASE_COLUMNS, standardize
+from metrics import registry, metric_labels
+from usage_tracker import record_usage, session_usage
+from batch_controller import get_batch_controller
 from openai import InternalServerError, APITimeoutError, RateLimitError
 
 logfire.configure(token="your logfire token")
@@ -28,58 +36,28 @@ BATCH_CONFIG = {
     "max_batch_limit": 6,  # 减少最大批次数量
     "performance_warning_threshold": 30,  # 批次时间警告阈值（秒）
     "target_completion_ratio": 0.8,  # 目标完成度（80%即认为完成）
+    "max_concurrency": 4,  # 并发分批模式下同时进行的批次数（不超过 HTTP 连接池上限）
+    "adaptive_batching": True,  # 根据截断、产出和耗时自动调整批次大小（AIMD）
+    "min_batch_size": 3,  # 自适应模式下的最小批次
+    "max_adaptive_batch_size": 40,  # 自适应模式下的最大批次
+    "speculative": False,  # 投机模式：一次性生成与前几个批次同时开始，取先达标的一方
+    "speculative_max_batches": 2,  # 投机模式下与一次性生成并行的最多批次数
+    "speculative_token_budget": 8000,  # 投机批次的额外 token 预算（按估算值控制投机批次数量）
 }
 
-class BatchPerformanceMonitor:
-    """批次性能监控器"""
-    def __init__(self):
-        self.batch_times = []
-        self.batch_sizes = []
-        self.total_start_time = None
-    
-    def start_total_timing(self):
-        """开始总计时"""
-        import time
-        self.total_start_time = time.time()
-    
-    def record_batch(self, batch_num: int, batch_size: int, elapsed_time: float):
-        """记录批次性能"""
-        self.batch_times.append(elapsed_time)
-        self.batch_sizes.append(batch_size)
-        
-        # 计算平均时间和趋势
-        if len(self.batch_times) > 1:
-            avg_time = sum(self.batch_times) / len(self.batch_times)
-            recent_avg = sum(self.batch_times[-3:]) / min(3, len(self.batch_times))
-            
-            if recent_avg > avg_time * 1.5:
-                print(f"⚠️  警告：第 {batch_num} 批次处理时间 ({elapsed_time:.2f}s) 明显超出平均时间 ({avg_time:.2f}s)")
-            elif elapsed_time > BATCH_CONFIG["performance_warning_threshold"]:
-                print(f"⚠️  警告：第 {batch_num} 批次处理时间过长 ({elapsed_time:.2f}s)")
-    
-    def get_summary(self):
-        """获取性能总结"""
-        if not self.batch_times:
-            return "无批次数据"
-        
-        import time
-        total_time = time.time() - self.total_start_time if self.total_start_time else 0
-        avg_batch_time = sum(self.batch_times) / len(self.batch_times)
-        max_time = max(self.batch_times)
-        min_time = min(self.batch_times)
-        
-        return f"""
-📊 批次性能总结:
-   - 总批次数: {len(self.batch_times)}
-   - 总耗时: {total_time:.2f} 秒
-   - 平均批次时间: {avg_batch_time:.2f} 秒
-   - 最快批次: {min_time:.2f} 秒
-   - 最慢批次: {max_time:.2f} 秒
-   - 时间趋势: {'递增' if len(self.batch_times) > 2 and self.batch_times[-1] > self.batch_times[0] else '稳定'}
-        """
-
-# 全局性能监控器
-performance_monitor = BatchPerformanceMonitor()
+# 估算投机批次 token 开销时的默认值（会话内已有测试用例阶段的用量时按实际平均值估算）
+DEFAULT_PROMPT_TOKENS = 1500
+DEFAULT_TOKENS_PER_CASE = 250
+
+def record_batch(batch_num: int, case_count: int, elapsed_time: float):
+    """记录批次耗时与产出，批次明显变慢时打印警告"""
+    previous = registry.quantiles("batch_seconds", stage="testcase")
+    registry.observe("batch_seconds", elapsed_time, stage="testcase", batch=batch_num)
+    registry.inc("batch_cases_total", case_count, stage="testcase", batch=batch_num)
+    if previous["count"] and elapsed_time > previous["p50"] * 1.5:
+        print(f"⚠️  警告：第 {batch_num} 批次处理时间 ({elapsed_time:.2f}s) 明显超出中位数 ({previous['p50']:.2f}s)")
+    elif elapsed_time > BATCH_CONFIG["performance_warning_threshold"]:
+        print(f"⚠️  警告：第 {batch_num} 批次处理时间过长 ({elapsed_time:.2f}s)")
 
 async def retry_with_backoff(func, max_retries=2, base_delay=1):
     """
@@ -98,9 +76,11 @@ async def retry_with_backoff(func, max_retries=2, base_delay=1):
             if attempt == max_retries:
                 print(f"重试 {max_retries} 次后仍然失败: {e}")
                 raise
+            registry.inc("llm_retries_total")
             
-            # 使用线性退避而不是指数退避，避免后续批次等待过久
-            delay = base_delay * (attempt + 1)  # 线性退避：1, 2, 3...
+            # 限流由 llms.py 中的令牌桶统一处理（已按 Retry-After 暂停），这里无需再额外等待
+            # 其他错误使用线性退避而不是指数退避，避免后续批次等待过久
+            delay = 0 if isinstance(e, RateLimitError) else base_delay * (attempt + 1)  # 线性退避：1, 2, 3...
             print(f"API调用失败 (尝试 {attempt + 1}/{max_retries + 1}): {e}")
             print(f"等待 {delay} 秒后重试...")
             await asyncio.sleep(delay)
@@ -178,20 +158,89 @@ async def generate_requirements(ctx: RunContext[TestcaseAgentDeps]) -> str:
 '''
 
 
-async def write_test_cases_to_excel(test_cases: List[Dict], file_path: str):
-    # 确保测试用例按照标准字段顺序
-    standard_columns = ["模块名称", "功能项", "用例说明", "前置条件", "输入", "执行步骤", "预期结果", "重要程度"]
-    
-    # 重新组织数据，确保字段顺序正确
-    standardized_cases = []
-    for case in test_cases:
-        standardized_case = {}
-        for col in standard_columns:
-            standardized_case[col] = case.get(col, "")
-        standardized_cases.append(standardized_case)
-    
-    # 将测试用例列表转换为DataFrame，指定列顺序
-    df = pd.DataFrame(standardized_cases, columns=standard_columns)
+class ExcelWriteError(RuntimeError):
+    """测试用例写入 Excel 失败：已写入条数和检查点都不前进，续跑时重新写入"""
+
+
+@dataclass
+class StreamedTestcaseResult:
+    """流式运行的结果，与 RunResult 一样通过 data 取得完整的响应文本"""
+    data: str
+    cases: List[Dict]
+    _usage: Usage
+
+    def usage(self) -> Usage:
+        return self._usage
+
+
+async def emit_case(on_case: Optional[Callable[[Dict], Any]], case: Dict):
+    """推送单条测试用例（on_case 支持普通函数和协程函数）"""
+    if on_case:
+        ret = on_case(case)
+        if inspect.isawaitable(ret):
+            await ret
+
+
+def make_replay_guard(on_case: Optional[Callable[[Dict], Any]]) -> Callable[[], Optional[Callable[[Dict], Any]]]:
+    """
+    为 retry_with_backoff 包裹的流式调用构造回调：每次尝试调用一次，得到本次尝试使用的 on_case
+    失败的尝试已经推送过的条数在重试时跳过，界面和下游不会收到重复的测试用例
+    Args:
+        on_case: 单条测试用例回调
+    Returns:
+        每次尝试调用一次的回调工厂
+    """
+    if on_case is None:
+        return lambda: None
+    emitted = 0
+
+    def attempt_callback():
+        seen = 0
+
+        async def callback(case: Dict):
+            nonlocal emitted, seen
+            seen += 1
+            if seen > emitted:
+                emitted = seen
+                await emit_case(on_case, case)
+
+        return callback
+
+    return attempt_callback
+
+
+async def run_testcase_agent(user_prompt: str, deps: TestcaseAgentDeps, stream: bool = False,
+                             on_case: Optional[Callable[[Dict], Any]] = None):
+    """
+    调用测试用例生成智能体
+    Args:
+        user_prompt: 用户提示
+        deps: 智能体依赖
+        stream: 是否使用流式输出
+        on_case: 流式模式下每解析出一条完整测试用例时的回调（支持普通函数和协程函数）
+    Returns:
+        RunResult 或 StreamedTestcaseResult
+    """
+    if not stream:
+        result = await testcase_agent.run(user_prompt, deps=deps)
+        record_usage("testcase", result.usage())
+        return result
+
+    parser = JSONObjectStream()
+    cases = []
+    async with testcase_agent.run_stream(user_prompt, deps=deps) as result:
+        async for delta in result.stream_text(delta=True, debounce_by=None):
+            for case in parser.feed(delta):
+                cases.append(case)
+                await emit_case(on_case, case)
+        data = await result.get_data()
+    record_usage("testcase", result.usage())
+    return StreamedTestcaseResult(data=data, cases=cases, _usage=result.usage())
+
+
+def _append_to_workbook(test_cases: List[Dict], file_path: str):
+    # 将测试用例列表转换为DataFrame，按照标准字段顺序
+    df = pd.DataFrame([standardize(case) for case in test_cases], columns=TESTCASE_COLUMNS)
 
     # 检查文件是否存在
     if os.path.isfile(file_path):
@@ -209,6 +258,22 @@ async def write_test_cases_to_excel(test_cases: List[Dict], file_path: str):
         df.to_excel(file_path, index=False, engine='openpyxl')
 
 
+async def write_test_cases_to_excel(test_cases: List[Dict], file_path: str):
+    """
+    追加写入已有工作簿（EXCEL_CONFIG["mode"] == "append" 时使用；需要加载整个工作簿，文件越大越慢）
+    在线程池中执行，不阻塞事件循环
+    """
+    await asyncio.to_thread(_append_to_workbook, test_cases, file_path)
+
+
+def _last_case_incomplete(test_cases: List[Dict]) -> bool:
+    """最后一条测试用例是否缺少字段（输出在字段之间被截断时 JSON 仍可能是完整的）"""
+    if not test_cases:
+        return True
+    last_case = test_cases[-1]
+    return not isinstance(last_case, dict) or any(not last_case.get(field) for field in TESTCASE_COLUMNS)
+
+
 def is_testcase_output_truncated(test_cases_data, expected_min_count: int = 3) -> bool:
     """
     检测测试用例输出是否被截断
@@ -218,169 +283,276 @@ def is_testcase_output_truncated(test_cases_data, expected_min_count: int = 3) -
     Returns:
         是否被截断
     """
-    try:
-        if isinstance(test_cases_data, str):
-            # 处理 markdown 代码块格式
-            if test_cases_data.strip().startswith('```json'):
-                # 提取 json 内容
-                lines = test_cases_data.strip().split('\n')
-                json_lines = []
-                in_json = False
-                for line in lines:
-                    if line.strip() == '```json':
-                        in_json = True
-                        continue
-                    elif line.strip() == '```' and in_json:
-                        break
-                    elif in_json:
-                        json_lines.append(line)
-                test_cases_data = '\n'.join(json_lines)
-            
-            # 检查JSON字符串是否完整
-            test_cases = json.loads(test_cases_data)
-        elif isinstance(test_cases_data, list):
-            test_cases = test_cases_data
-        else:
-            return True
-        
-        if not test_cases or len(test_cases) == 0:
-            return True
-        
-        # 检查最后一个测试用例是否完整
-        last_case = test_cases[-1]
-        required_fields = ["模块名称", "功能项", "用例说明", "前置条件", "输入", "执行步骤", "预期结果", "重要程度"]
-        
-        for field in required_fields:
-            if field not in last_case or not last_case[field]:
-                return True
-        
-        return False
-        
-    except (json.JSONDecodeError, KeyError, IndexError):
-        return True
+    if isinstance(test_cases_data, str):
+        test_cases, report = parse_json_objects(test_cases_data)
+        return report.truncated or _last_case_incomplete(test_cases)
+    if isinstance(test_cases_data, list):
+        return _last_case_incomplete(test_cases_data)
+    return True
+
+
+def _parse_testcase_text(text: str) -> Tuple[List[Dict], ParseReport]:
+    """容错解析模型输出文本，记录解析失败"""
+    test_cases, report = parse_json_objects(text)
+    if report.failed or (not test_cases and text.strip()):
+        registry.inc("llm_parse_failures_total", stage="testcase")
+        print(f"解析测试用例数据失败: {report.failed} 个对象无法解析，共解析出 {len(test_cases)} 条")
+        print(f"原始数据: {text[:500]}...")  # 打印前500字符用于调试
+    return test_cases, report
 
 
 def extract_testcase_data(test_cases_data):
     """
     提取测试用例数据，支持多种格式
+    字符串输出使用 json_stream 的容错解析：跳过说明文字和 markdown 代码块标记，去掉注释，
+    输出被截断时保留所有完整的测试用例
     Args:
         test_cases_data: 原始数据
     Returns:
         解析后的测试用例列表
     """
-    try:
-        if isinstance(test_cases_data, str):
-            # 处理 markdown 代码块格式
-            if '```json' in test_cases_data:
-                # 提取 json 内容
-                lines = test_cases_data.split('\n')
-                json_lines = []
-                in_json = False
-                for line in lines:
-                    if '```json' in line:
-                        in_json = True
-                        continue
-                    elif line.strip() == '```' and in_json:
-                        break
-                    elif in_json:
-                        # 处理JavaScript风格的注释
-                        if '//' in line:
-                            line = line.split('//')[0].rstrip()
-                        if line.strip():  # 只添加非空行
-                            json_lines.append(line)
-                
-                json_text = '\n'.join(json_lines)
-                
-                # 尝试修复不完整的JSON
-                json_text = json_text.strip()
-                if json_text.endswith(','):
-                    json_text = json_text[:-1]  # 移除末尾的逗号
-                
-                # 如果JSON看起来不完整，尝试添加结束括号
-                if json_text.count('[') > json_text.count(']'):
-                    json_text += ']'
-                
-                test_cases_data = json_text
-            
-            # 如果包含其他文本，尝试提取JSON部分
-            elif '[' in test_cases_data and ']' in test_cases_data:
-                start = test_cases_data.find('[')
-                end = test_cases_data.rfind(']') + 1
-                test_cases_data = test_cases_data[start:end]
-            
-            # 清理可能的JavaScript注释
-            lines = test_cases_data.split('\n')
-            cleaned_lines = []
-            for line in lines:
-                if '//' in line:
-                    line = line.split('//')[0].rstrip()
-                if line.strip():
-                    cleaned_lines.append(line)
-            test_cases_data = '\n'.join(cleaned_lines)
-            
-            # 尝试修复常见的JSON格式问题
-            test_cases_data = fix_json_format(test_cases_data)
-            
-            test_cases = json.loads(test_cases_data)
-        elif isinstance(test_cases_data, list):
-            test_cases = test_cases_data
-        else:
-            test_cases = getattr(test_cases_data, 'data', []) or []
-        
-        return test_cases
-    except Exception as e:
-        print(f"解析测试用例数据失败: {e}")
-        print(f"原始数据: {test_cases_data[:500]}...")  # 打印前500字符用于调试
-        return []
+    if isinstance(test_cases_data, str):
+        return _parse_testcase_text(test_cases_data)[0]
+    if isinstance(test_cases_data, list):
+        return test_cases_data
+    return getattr(test_cases_data, 'data', []) or []
 
 
-def fix_json_format(json_text):
+def parse_testcase_output(test_cases_data) -> Tuple[List[Dict], bool]:
     """
-    修复常见的JSON格式问题
+    解析一次模型输出，并记录输出截断
+    Returns:
+        (测试用例列表, 是否被截断)
     """
-    import re
-    
-    # 修复不完整的字符串（缺少结束引号）
-    lines = json_text.split('\n')
-    fixed_lines = []
-    
-    for line in lines:
-        # 检查是否有不完整的字符串值
-        if ':' in line and line.count('"') % 2 == 1:
-            # 如果引号数量是奇数，可能缺少结束引号
-            if line.strip().endswith(',') or line.strip().endswith('}'):
-                # 在逗号或大括号前添加引号
-                line = re.sub(r'([^"]+)([,}])$', r'\1"\2', line)
-            else:
-                # 在行末添加引号
-                line = line.rstrip() + '"'
-        
-        fixed_lines.append(line)
-    
-    json_text = '\n'.join(fixed_lines)
-    
-    # 修复不完整的对象（缺少结束大括号）
-    open_braces = json_text.count('{')
-    close_braces = json_text.count('}')
-    
-    if open_braces > close_braces:
-        # 添加缺少的结束大括号
-        missing_braces = open_braces - close_braces
-        json_text = json_text.rstrip()
-        if json_text.endswith(','):
-            json_text = json_text[:-1]  # 移除末尾逗号
-        json_text += '\n' + '  }' * missing_braces
-    
-    # 确保数组正确闭合
-    if json_text.count('[') > json_text.count(']'):
-        json_text += ']'
-    
-    return json_text
+    if isinstance(test_cases_data, str):
+        test_cases, report = _parse_testcase_text(test_cases_data)
+        truncated = report.truncated or _last_case_incomplete(test_cases)
+        if report.truncated:
+            print(f"输出在第 {report.offset} 个字符后被截断，保留 {len(test_cases)} 条完整测试用例")
+    else:
+        test_cases = extract_testcase_data(test_cases_data)
+        truncated = is_testcase_output_truncated(test_cases_data)
+    if truncated:
+        registry.inc("llm_truncations_total", stage="testcase")
+    return test_cases, truncated
+
+
+def plan_batches(remaining: int, max_batch_size: int, max_batches: int) -> List[int]:
+    """
+    预先规划剩余批次的大小
+    Args:
+        remaining: 剩余需要生成的数量
+        max_batch_size: 单批最大条数
+        max_batches: 最多批次数
+    Returns:
+        每个批次的条数
+    """
+    sizes = []
+    while remaining > 0 and len(sizes) < max_batches:
+        size = min(max_batch_size, remaining)
+        sizes.append(size)
+        remaining -= size
+    return sizes
 
 
-async def run_agent(prompt: str, db_path: str = None, excel_path: str = None, filter: str = None, start_id: int = 1, target_count: int = 25, max_batch_size: int = 15, requirements_list: list = None) -> list:
+def make_batch_runner(prompt: str, group_count: int, first_batch_num: int, deps_kwargs: Dict,
+                      concurrency: int, stream: bool = False,
+                      on_case: Optional[Callable[[Dict], Any]] = None,
+                      controller=None,
+                      on_batch: Optional[Callable[[int, List[Dict]], Awaitable[Any]]] = None) -> Callable[[int, int], Awaitable[List[Dict]]]:
     """
-    运行测试用例生成智能体，支持智能分批和重试机制
+    构造执行单个批次的协程函数 run_one(index, batch_size)，各批次共享同一个并发信号量，
+    并且都经过连接池的全局信号量（同一事件循环中所有运行合计不超过连接池上限）
+    单个批次失败时返回空列表，不影响其他批次
+    Args:
+        prompt: 用户提示
+        group_count: 批次总数（用于按批次分组需求）
+        first_batch_num: 第一个批次的编号（用于日志）
+        deps_kwargs: 构造 TestcaseAgentDeps 的公共参数
+        concurrency: 最大并发数，会被限制在 HTTP 连接池上限以内
+        stream: 是否流式生成
+        on_case: 流式模式下的单条测试用例回调
+        controller: 自适应批次控制器（AdaptiveBatchSizer），各批次结果会反馈给它
+        on_batch: 批次成功完成后的回调 on_batch(batch_num, cases)，用于记录检查点
+    Returns:
+        执行单个批次的协程函数
+    """
+    import time
+    semaphore = asyncio.Semaphore(max(1, min(concurrency, MAX_CONNECTIONS)))
+    requirements_list = deps_kwargs.get("requirements_list") or []
+
+    async def run_one(index: int, batch_size: int) -> List[Dict]:
+        batch_num = first_batch_num + index
+        # 需求足够多时按批次分组，各批次侧重不同需求，减少并发批次之间的重复用例
+        batch_requirements = requirements_list
+        if len(requirements_list) >= group_count > 1:
+            batch_requirements = requirements_list[index::group_count]
+        batch_prompt = f"{prompt}，请生成 {batch_size} 条不同的测试用例（第 {index + 1}/{group_count} 组）。"
+        replay = make_replay_guard(on_case)
+
+        async def batch_attempt():
+            return await run_testcase_agent(batch_prompt, stream=stream, on_case=replay(), deps=TestcaseAgentDeps(
+                **{**deps_kwargs, "requirements_list": batch_requirements},
+                prompt=batch_prompt,
+                total=batch_size,
+                batch_size=batch_size,
+            ))
+
+        with metric_labels(stage="testcase", batch=batch_num):
+            async with semaphore, http_transport.limiter():
+                batch_start_time = time.time()
+                try:
+                    result = await retry_with_backoff(batch_attempt, max_retries=BATCH_CONFIG["max_retries"], base_delay=BATCH_CONFIG["base_delay"])
+                except Exception as e:
+                    print(f"第 {batch_num} 批次失败: {e}，其他批次继续执行")
+                    return []
+                batch_test_cases, truncated = parse_testcase_output(result.data)
+                batch_elapsed = time.time() - batch_start_time
+            print(f"第 {batch_num} 批次完成，生成 {len(batch_test_cases)} 条，耗时 {batch_elapsed:.2f} 秒")
+            record_batch(batch_num, len(batch_test_cases), batch_elapsed)
+            if controller:
+                controller.observe(batch_size, len(batch_test_cases), batch_elapsed, truncated)
+        if on_batch:
+            await on_batch(batch_num, batch_test_cases)
+        return batch_test_cases
+
+    return run_one
+
+
+async def run_batches_concurrently(prompt: str, batch_sizes: List[int], first_batch_num: int, deps_kwargs: Dict,
+                                   concurrency: int, stream: bool = False,
+                                   on_case: Optional[Callable[[Dict], Any]] = None,
+                                   controller=None,
+                                   on_batch: Optional[Callable[[int, List[Dict]], Awaitable[Any]]] = None) -> List[List[Dict]]:
+    """
+    并发执行已规划好的批次
+    单个批次失败不会影响其他批次，结果按批次顺序返回（失败的批次为空列表）
+    Args:
+        prompt: 用户提示
+        batch_sizes: 每个批次的条数
+        first_batch_num: 第一个批次的编号（用于日志）
+        deps_kwargs: 构造 TestcaseAgentDeps 的公共参数
+        concurrency: 最大并发数，会被限制在 HTTP 连接池上限以内
+        stream: 是否流式生成
+        on_case: 流式模式下的单条测试用例回调
+        controller: 自适应批次控制器（AdaptiveBatchSizer），各批次结果会反馈给它
+        on_batch: 批次成功完成后的回调 on_batch(batch_num, cases)，用于记录检查点
+    Returns:
+        按批次顺序排列的测试用例列表
+    """
+    run_one = make_batch_runner(prompt, len(batch_sizes), first_batch_num, deps_kwargs, concurrency,
+                                stream=stream, on_case=on_case, controller=controller, on_batch=on_batch)
+    return await asyncio.gather(*(run_one(i, size) for i, size in enumerate(batch_sizes)))
+
+
+def estimate_batch_tokens(batch_size: int) -> int:
+    """
+    估算一个批次消耗的 token 数（输入 + 输出）
+    会话内已有测试用例阶段的用量时按实际平均值估算，否则使用默认值
+    Args:
+        batch_size: 批次条数
+    Returns:
+        估算的 token 数
+    """
+    account = session_usage.stages.get("testcase")
+    prompt_tokens = DEFAULT_PROMPT_TOKENS
+    tokens_per_case = DEFAULT_TOKENS_PER_CASE
+    if account and account.requests:
+        prompt_tokens = account.input_tokens / account.requests
+    if account and account.items:
+        tokens_per_case = account.output_tokens / account.items
+    return int(prompt_tokens + tokens_per_case * batch_size)
+
+
+def plan_speculative_batches(target_count: int, batch_size: int, token_budget: int) -> List[int]:
+    """
+    规划与一次性生成并行的投机批次，所有投机批次的预估 token 总和不超过预算
+    Args:
+        target_count: 目标生成数量
+        batch_size: 单批条数
+        token_budget: 额外 token 预算（一次性生成成功时，这部分开销被浪费）
+    Returns:
+        每个投机批次的条数（预算不足时为空列表）
+    """
+    sizes = []
+    spent = 0
+    for size in plan_batches(target_count, batch_size, BATCH_CONFIG["speculative_max_batches"]):
+        cost = estimate_batch_tokens(size)
+        if spent + cost > token_budget:
+            break
+        sizes.append(size)
+        spent += cost
+    return sizes
+
+
+async def race_one_shot_and_batches(one_shot: Callable[[], Awaitable[List[Dict]]],
+                                    batches: List[Callable[[], Awaitable[List[Dict]]]],
+                                    target_count: int) -> Tuple[List[Dict], List[List[Dict]], bool]:
+    """
+    同时执行一次性生成和投机批次，结果按完成顺序合并，不再需要的一方会被取消：
+    - 一次性生成先完成且达到目标完成度：取消所有投机批次，直接采用一次性结果
+    - 一次性生成不足或失败：保留投机批次的结果，由后续分批补齐
+    - 投机批次已完成的条数达到目标：取消一次性生成
+    Args:
+        one_shot: 一次性生成（返回解析后的测试用例，失败时抛出异常）
+        batches: 投机批次（返回测试用例，失败时返回空列表）
+        target_count: 目标生成数量
+    Returns:
+        (一次性生成的测试用例, 按批次顺序的投机批次结果, 一次性生成是否胜出)
+    """
+    one_shot_task = asyncio.create_task(one_shot())
+    batch_tasks = [asyncio.create_task(batch()) for batch in batches]
+    pending = {one_shot_task, *batch_tasks}
+    one_shot_cases: List[Dict] = []
+
+    async def cancel(tasks):
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def landed(task) -> List[Dict]:
+        if not task.done() or task.cancelled() or task.exception() is not None:
+            return []
+        return task.result()
+
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if one_shot_task in done:
+                try:
+                    one_shot_cases = one_shot_task.result()
+                except Exception as e:
+                    print(f"一次性生成失败: {e}，继续使用投机批次")
+                if len(one_shot_cases) >= target_count * BATCH_CONFIG["target_completion_ratio"]:
+                    running = [task for task in batch_tasks if not task.done()]
+                    if running:
+                        print(f"一次性生成已达标，取消 {len(running)} 个未完成的投机批次")
+                    await cancel(running)
+                    registry.inc("speculative_outcomes_total", stage="testcase", outcome="one_shot")
+                    return one_shot_cases, [], True
+            elif not one_shot_task.done():
+                batch_total = sum(len(landed(task)) for task in batch_tasks)
+                if batch_total >= target_count:
+                    print(f"投机批次已生成 {batch_total} 条，取消一次性生成")
+                    pending.discard(one_shot_task)
+                    await cancel([one_shot_task])
+                    await cancel(list(pending))
+                    registry.inc("speculative_outcomes_total", stage="testcase", outcome="batches")
+                    return [], [landed(task) for task in batch_tasks], False
+    finally:
+        # 调用方被取消时不留下后台任务
+        await cancel([task for task in (one_shot_task, *batch_tasks) if not task.done()])
+
+    registry.inc("speculative_outcomes_total", stage="testcase", outcome="merged")
+    return one_shot_cases, [landed(task) for task in batch_tasks], False
+
+
+async def run_agent(prompt: str, db_path: str = None, excel_path: str = None, filter: str = None, start_id: int = 1, target_count: int = 25, max_batch_size: int = 15, requirements_list: list = None,
+                    stream: bool = False, on_case: Optional[Callable[[Dict], Any]] = None, concurrency: int = 1,
+                    speculative: Optional[bool] = None, checkpoint=None, checkpoint_stage: str = "testcase",
+                    sink: Optional[ExcelSink] = None) -> list:
+    """
+    运行测试用例生成智能体，支持智能分批、重试机制和流式输出
     Args:
         prompt: 用户提示
         db_path: 数据库路径
@@ -390,21 +562,71 @@ async def run_agent(prompt: str, db_path: str = None, excel_path: str = None, fi
         target_count: 目标生成数量
         max_batch_size: 单批最大条数（用于分批时）
         requirements_list: 具体需求列表
+        stream: 是否流式生成；开启后每条测试用例解析完成即通过 on_case 推送，且每个批次完成后立即写入Excel
+        on_case: 流式模式下的单条测试用例回调
+        concurrency: 分批模式的并发数，大于 1 时预先规划剩余批次并发执行
+        speculative: 是否使用投机模式（默认取 BATCH_CONFIG["speculative"]）：一次性生成与前几个批次同时开始，
+            先达标的一方胜出，另一方被取消；投机批次数量受 BATCH_CONFIG["speculative_token_budget"] 限制。
+            投机模式下第一轮的测试用例在结果确定后才通过 on_case 推送
+        checkpoint: 运行检查点（checkpoint_store.RunCheckpoint），每个批次完成后记录，续跑时从最后一个批次之后继续
+        checkpoint_stage: 检查点中的阶段名称（流水线模式下每个需求分组各用一个）
+        sink: 共享的 Excel 输出（流水线模式下多个需求分组写入同一组分片），为空时按 excel_path 新建
     Returns:
         生成的测试用例列表
     """
     import time
     start_time = time.time()
+    if speculative is None:
+        speculative = BATCH_CONFIG["speculative"]
     
-    # 初始化性能监控
-    performance_monitor.start_total_timing()
-    
+    # 已写入Excel的测试用例数量（流式模式按批次增量写入）
+    written_count = 0
+    # 分片模式：本次运行的用例写入独立分片，不加载已有工作簿
+    excel_sink = sink or (ExcelSink(excel_path) if excel_path and EXCEL_CONFIG["mode"] == "parts" else None)
+
+    async def flush_to_excel(cases: List[Dict]):
+        nonlocal written_count
+        pending = cases[written_count:target_count]
+        if not excel_path or not pending:
+            return
+        try:
+            if excel_sink:
+                await excel_sink.append(pending)
+            else:
+                await write_test_cases_to_excel(pending, excel_path)
+        except Exception as e:
+            print(f"写入Excel文件失败: {e}")
+            raise ExcelWriteError(f"写入Excel文件失败: {e}") from e
+        written_count += len(pending)
+        print(f"测试用例已成功写入Excel文件: {excel_sink.parts[-1] if excel_sink else excel_path}")
+
+    async def save_checkpoint(batch: int, cases: List[Dict], final: bool = False):
+        # 记录已完成的批次（流式模式下同时记录已写入Excel的条数，续跑时不会重复写入）
+        # 需要落盘的批次总是先 flush_to_excel 再调用；写入失败时抛出 ExcelWriteError，检查点不会前进
+        if checkpoint:
+            await checkpoint.save_batch(checkpoint_stage, batch, {"cases": cases, "written": written_count, "final": final})
+
+    # 自适应批次控制器（同一运行内共享，从 max_batch_size 开始，可增大到 max_adaptive_batch_size）
+    controller = None
+    batch_limit = BATCH_CONFIG["max_batch_limit"]
+    if BATCH_CONFIG["adaptive_batching"]:
+        controller = get_batch_controller(
+            "testcase",
+            initial=max_batch_size,
+            owner=checkpoint,
+            min_size=BATCH_CONFIG["min_batch_size"],
+            max_size=BATCH_CONFIG["max_adaptive_batch_size"],
+            target_latency=BATCH_CONFIG["performance_warning_threshold"],
+        )
+        # 批次可能被缩小，按最小批次放宽批次数上限
+        batch_limit = controller.max_rounds(target_count, BATCH_CONFIG["max_batch_limit"])
+
     # 第一次尝试：一次性生成全部
     enhanced_prompt = f"{prompt}，请生成约 {target_count} 条测试用例，确保覆盖所有重要功能点。"
     
     # 使用重试机制包装API调用
-    async def first_attempt():
-        return await testcase_agent.run(enhanced_prompt, deps=TestcaseAgentDeps(
+    async def first_attempt(case_callback: Optional[Callable[[Dict], Any]] = on_case):
+        return await run_testcase_agent(enhanced_prompt, stream=stream, on_case=case_callback, deps=TestcaseAgentDeps(
             db_path=db_path,
             excel_path=excel_path,
             filter=filter,
@@ -414,88 +636,176 @@ async def run_agent(prompt: str, db_path: str = None, excel_path: str = None, fi
             requirements_list=requirements_list or []  # 传递需求列表
         ))
     
-    try:
-        result = await retry_with_backoff(first_attempt, max_retries=BATCH_CONFIG["max_retries"], base_delay=BATCH_CONFIG["base_delay"])
-        print("testcase_agent.run result:", result)
-        print("testcase_agent.run data:", result.data)
-        
-        # 提取测试用例数据
-        test_cases_data = result.data
-        test_cases = extract_testcase_data(test_cases_data)
-        
-        # 检查是否达到目标数量
-        if len(test_cases) >= target_count * BATCH_CONFIG["target_completion_ratio"]:  # 使用配置的完成度比例
+    deps_kwargs = dict(
+        db_path=db_path,
+        excel_path=excel_path,
+        filter=filter,
+        requirements_list=requirements_list or []
+    )
+    batch_num = 2  # 从第2批开始，因为第1批已经生成了
+
+    # 续跑：恢复检查点中已完成的批次，不再重复调用大模型
+    saved_batches = await checkpoint.load_batches(checkpoint_stage) if checkpoint else {}
+
+    # 投机模式：按额外 token 预算规划与一次性生成并行的批次
+    speculative_sizes = []
+    if speculative and not saved_batches:
+        speculative_sizes = plan_speculative_batches(target_count, controller.next_size() if controller else max_batch_size,
+                                                     BATCH_CONFIG["speculative_token_budget"])
+        if not speculative_sizes:
+            print("额外 token 预算不足以执行投机批次，使用常规模式")
+
+    if saved_batches:
+        test_cases = [case for payload in saved_batches.values() for case in payload["cases"]]
+        written_count = max(payload["written"] for payload in saved_batches.values())
+        batch_num = max(saved_batches) + 1
+        print(f"从检查点恢复 {len(saved_batches)} 个批次，共 {len(test_cases)} 条测试用例")
+        if saved_batches[max(saved_batches)]["final"]:
+            final_test_cases = test_cases[:target_count]
+            await flush_to_excel(final_test_cases)
+            return final_test_cases
+    elif speculative_sizes:
+        print(f"投机模式：一次性生成与 {len(speculative_sizes)} 个批次 {speculative_sizes} 同时开始")
+
+        async def one_shot() -> List[Dict]:
+            with metric_labels(stage="testcase", batch=1):
+                # 结果确定前不推送，避免推送最终被丢弃的测试用例
+                result = await retry_with_backoff(lambda: first_attempt(case_callback=None), max_retries=BATCH_CONFIG["max_retries"], base_delay=BATCH_CONFIG["base_delay"])
+                one_shot_cases, truncated = parse_testcase_output(result.data)
+            if truncated and controller:
+                controller.note_truncation(target_count)
+            return one_shot_cases
+
+        run_one = make_batch_runner(prompt, len(speculative_sizes), batch_num, deps_kwargs, len(speculative_sizes),
+                                    stream=stream, controller=controller)
+        test_cases, batch_results, one_shot_won = await race_one_shot_and_batches(
+            one_shot,
+            [lambda i=i, size=size: run_one(i, size) for i, size in enumerate(speculative_sizes)],
+            target_count,
+        )
+        for batch_test_cases in batch_results:
+            test_cases.extend(batch_test_cases)
+        batch_num += len(speculative_sizes)
+        for case in test_cases[:target_count]:
+            await emit_case(on_case, case)
+
+        if one_shot_won:
             elapsed = time.time() - start_time
             print(f"一次性生成完成，共 {len(test_cases)} 条测试用例，耗时 {elapsed:.2f} 秒")
-            final_test_cases = test_cases[:target_count]  # 截取到目标数量
+            final_test_cases = test_cases[:target_count]
+            await flush_to_excel(final_test_cases)
+            await save_checkpoint(batch_num - 1, final_test_cases, final=True)
+            return final_test_cases
+
+        print(f"投机模式第一轮共生成 {len(test_cases)} 条，目标 {target_count} 条")
+        if stream:
+            await flush_to_excel(test_cases)
+        await save_checkpoint(batch_num - 1, test_cases)
+    else:
+        # 一次性生成和降级重试共用：失败的尝试已推送的条数不再重复推送
+        replay = make_replay_guard(on_case)
+        try:
+            with metric_labels(stage="testcase", batch=1):
+                result = await retry_with_backoff(lambda: first_attempt(case_callback=replay()), max_retries=BATCH_CONFIG["max_retries"], base_delay=BATCH_CONFIG["base_delay"])
             
-            # 写入Excel文件
-            if excel_path and final_test_cases:
-                try:
-                    await write_test_cases_to_excel(final_test_cases, excel_path)
-                    print(f"测试用例已成功写入Excel文件: {excel_path}")
-                except Exception as e:
-                    print(f"写入Excel文件失败: {e}")
+                # 提取测试用例数据
+                test_cases_data = result.data
+                test_cases, truncated = parse_testcase_output(test_cases_data)
+            if truncated and controller:
+                controller.note_truncation(target_count)
+        
+            # 检查是否达到目标数量
+            if len(test_cases) >= target_count * BATCH_CONFIG["target_completion_ratio"]:  # 使用配置的完成度比例
+                elapsed = time.time() - start_time
+                print(f"一次性生成完成，共 {len(test_cases)} 条测试用例，耗时 {elapsed:.2f} 秒")
+                final_test_cases = test_cases[:target_count]  # 截取到目标数量
             
-            return final_test_cases
+                # 写入Excel文件
+                await flush_to_excel(final_test_cases)
+                await save_checkpoint(1, final_test_cases, final=True)
+            
+                return final_test_cases
         
-        print(f"一次性生成了 {len(test_cases)} 条，未达到目标 {target_count} 条，启动分批模式...")
+            print(f"一次性生成了 {len(test_cases)} 条，未达到目标 {target_count} 条，启动分批模式...")
+            if stream:
+                await flush_to_excel(test_cases)
+            await save_checkpoint(1, test_cases)
         
-    except Exception as e:
-        print(f"第一次尝试失败: {e}")
-        print("启动降级模式：使用更简单的提示词重试...")
+        except ExcelWriteError:
+            raise
+        except Exception as e:
+            print(f"第一次尝试失败: {e}")
+            print("启动降级模式：使用更简单的提示词重试...")
         
-        # 降级策略：使用更简单的提示词
-        simple_prompt = f"生成 {min(target_count, 10)} 条商品管理模块的测试用例"
+            # 降级策略：使用更简单的提示词
+            simple_prompt = f"生成 {min(target_count, 10)} 条商品管理模块的测试用例"
         
-        async def fallback_attempt():
-            return await testcase_agent.run(simple_prompt, deps=TestcaseAgentDeps(
-                db_path=db_path,
-                excel_path=excel_path,
-                filter=filter,
-                prompt=simple_prompt,
-                total=min(target_count, 10),
-                batch_size=0,
-                requirements_list=[]  # 降级时不传递需求列表
-            ))
+            async def fallback_attempt():
+                return await run_testcase_agent(simple_prompt, stream=stream, on_case=replay(), deps=TestcaseAgentDeps(
+                    db_path=db_path,
+                    excel_path=excel_path,
+                    filter=filter,
+                    prompt=simple_prompt,
+                    total=min(target_count, 10),
+                    batch_size=0,
+                    requirements_list=[]  # 降级时不传递需求列表
+                ))
         
-        try:
-            result = await retry_with_backoff(fallback_attempt, max_retries=BATCH_CONFIG["max_retries"], base_delay=BATCH_CONFIG["base_delay"])
-            test_cases_data = result.data
-            test_cases = extract_testcase_data(test_cases_data)
-            elapsed = time.time() - start_time
-            print(f"降级模式成功，生成 {len(test_cases)} 条测试用例，耗时 {elapsed:.2f} 秒")
+            try:
+                with metric_labels(stage="testcase", batch="fallback"):
+                    result = await retry_with_backoff(fallback_attempt, max_retries=BATCH_CONFIG["max_retries"], base_delay=BATCH_CONFIG["base_delay"])
+                    test_cases_data = result.data
+                    test_cases, _ = parse_testcase_output(test_cases_data)
+                elapsed = time.time() - start_time
+                print(f"降级模式成功，生成 {len(test_cases)} 条测试用例，耗时 {elapsed:.2f} 秒")
             
-            if excel_path and test_cases:
-                try:
-                    await write_test_cases_to_excel(test_cases, excel_path)
-                    print(f"测试用例已成功写入Excel文件: {excel_path}")
-                except Exception as e:
-                    print(f"写入Excel文件失败: {e}")
+                await flush_to_excel(test_cases)
+                await save_checkpoint(1, test_cases, final=True)
             
-            return test_cases
+                return test_cases
             
-        except Exception as fallback_error:
-            print(f"降级模式也失败了: {fallback_error}")
-            print("返回空列表")
-            return []
+            except ExcelWriteError:
+                raise
+            except Exception as fallback_error:
+                print(f"降级模式也失败了: {fallback_error}")
+                print("返回空列表")
+                return []
     
     # 分批处理模式
     all_test_cases = test_cases.copy() if test_cases else []
-    batch_num = 2  # 从第2批开始，因为第1批已经生成了
+    
+    if concurrency > 1:
+        # 并发模式：一次性规划剩余批次，并发执行后按批次顺序合并
+        batch_sizes = plan_batches(target_count - len(all_test_cases), controller.next_size() if controller else max_batch_size,
+                                   BATCH_CONFIG["max_batch_limit"] - 1)
+        print(f"并发分批模式：共 {len(batch_sizes)} 个批次，并发数 {min(concurrency, MAX_CONNECTIONS)}")
+        batch_results = await run_batches_concurrently(prompt, batch_sizes, batch_num, deps_kwargs, concurrency,
+                                                       stream=stream, on_case=on_case, controller=controller,
+                                                       on_batch=save_checkpoint if checkpoint else None)
+        for batch_test_cases in batch_results:
+            all_test_cases.extend(batch_test_cases)
+        batch_num += len(batch_sizes)
+        if stream:
+            await flush_to_excel(all_test_cases)
+            if checkpoint:
+                # 各批次完成时记录的是落盘前的已写入条数，写入成功后更新最后一个批次的记录
+                await save_checkpoint(batch_num - 1, batch_results[-1])
     
     # 累积所有测试用例，最后一次性写入Excel，避免频繁I/O
-    while len(all_test_cases) < target_count:
+    # 并发模式下若仍未达到目标且批次数未超限，继续按顺序补齐
+    while len(all_test_cases) < target_count and batch_num <= batch_limit:
         batch_start_time = time.time()
         remaining = target_count - len(all_test_cases)
-        batch_size = min(max_batch_size, remaining)
+        batch_size = controller.next_size(remaining) if controller else min(max_batch_size, remaining)
         
         # 简化批次提示词，避免复杂的上下文累积
         batch_prompt = f"{prompt}，请生成 {batch_size} 条不同的测试用例。"
         
-        # 使用重试机制包装批次调用，减少重试次数
+        # 使用重试机制包装批次调用，减少重试次数（重试时不重复推送已推送的测试用例）
+        replay = make_replay_guard(on_case)
+
         async def batch_attempt():
-            return await testcase_agent.run(batch_prompt, deps=TestcaseAgentDeps(
+            return await run_testcase_agent(batch_prompt, stream=stream, on_case=replay(), deps=TestcaseAgentDeps(
                 db_path=db_path,
                 excel_path=excel_path,
                 filter=filter,
@@ -506,13 +816,21 @@ async def run_agent(prompt: str, db_path: str = None, excel_path: str = None, fi
             ))
         
         try:
-            result = await retry_with_backoff(batch_attempt, max_retries=BATCH_CONFIG["max_retries"], base_delay=BATCH_CONFIG["base_delay"])
-            test_cases_data = result.data
-            batch_test_cases = extract_testcase_data(test_cases_data)
+            with metric_labels(stage="testcase", batch=batch_num):
+                result = await retry_with_backoff(batch_attempt, max_retries=BATCH_CONFIG["max_retries"], base_delay=BATCH_CONFIG["base_delay"])
+                test_cases_data = result.data
+                batch_test_cases, truncated = parse_testcase_output(test_cases_data)
             
             batch_elapsed = time.time() - batch_start_time
+            if controller:
+                controller.observe(batch_size, len(batch_test_cases), batch_elapsed, truncated)
             
             if not batch_test_cases:
+                if controller and truncated and batch_size > controller.min_size:
+                    # 输出被截断导致没有完整用例，缩小批次后重试
+                    print(f"第 {batch_num} 批次输出被截断，缩小批次后继续")
+                    batch_num += 1
+                    continue
                 print(f"第 {batch_num} 批次无有效测试用例，结束分批")
                 break
             
@@ -521,7 +839,12 @@ async def run_agent(prompt: str, db_path: str = None, excel_path: str = None, fi
             print(f"第 {batch_num} 批次完成，生成 {len(batch_test_cases)} 条，累计 {len(all_test_cases)} 条，耗时 {batch_elapsed:.2f} 秒")
             
             # 记录批次性能
-            performance_monitor.record_batch(batch_num, len(batch_test_cases), batch_elapsed)
+            record_batch(batch_num, len(batch_test_cases), batch_elapsed)
+            
+            # 流式模式下每个批次完成后立即落盘
+            if stream:
+                await flush_to_excel(all_test_cases)
+            await save_checkpoint(batch_num, batch_test_cases)
             
             # 如果达到目标数量，结束
             if len(all_test_cases) >= target_count:
@@ -531,10 +854,12 @@ async def run_agent(prompt: str, db_path: str = None, excel_path: str = None, fi
             batch_num += 1
             
             # 防止无限循环
-            if batch_num > BATCH_CONFIG["max_batch_limit"]:  # 使用配置的最大批次限制
+            if batch_num > batch_limit:  # 使用配置的最大批次限制（自适应模式下按最小批次放宽）
                 print("达到最大批次限制，结束分批")
                 break
                 
+        except ExcelWriteError:
+            raise
         except Exception as e:
             print(f"第 {batch_num} 批次失败: {e}，结束分批")
             break
@@ -543,17 +868,14 @@ async def run_agent(prompt: str, db_path: str = None, excel_path: str = None, fi
     print(f"分批模式完成，总共生成 {len(all_test_cases)} 条测试用例，总耗时 {total_elapsed:.2f} 秒")
     
     # 打印性能总结
-    print(performance_monitor.get_summary())
+    print(registry.format_summary("testcase"))
+    if controller:
+        print(f"自适应批次状态: {controller.stats()}")
     
     final_test_cases = all_test_cases[:target_count]  # 截取到目标数量
     
-    # 一次性写入Excel文件，避免频繁I/O
-    if excel_path and final_test_cases:
-        try:
-            await write_test_cases_to_excel(final_test_cases, excel_path)
-            print(f"测试用例已成功写入Excel文件: {excel_path}")
-        except Exception as e:
-            print(f"写入Excel文件失败: {e}")
+    # 一次性写入Excel文件，避免频繁I/O（流式模式下只写入尚未落盘的部分）
+    await flush_to_excel(final_test_cases)
     
     return final_test_cases
 
@@ -0,0 +1,130 @@
+"""
+常驻后台事件循环
+
+GUI 原来的每个工作线程都用 asyncio.run 新建并销毁一个事件循环，每条对话消息都要重建一次：
+llms.py 中模块级的 httpx.AsyncClient、db_pool 的连接池等与事件循环绑定的资源无法复用，
+keep-alive 连接每次都被丢弃。
+
+AsyncRuntime 在一个守护线程中运行唯一的事件循环（run_forever），所有协程都提交到这个循环执行：
+- submit() 线程安全，返回 concurrent.futures.Future，可在任意线程等待结果或添加完成回调
+- 取消 Future 会取消循环中对应的任务（协程内收到 CancelledError）
+- HTTP 连接、数据库连接池、缓存在多次请求之间保持可用
+- shutdown() 取消剩余任务、关闭连接池后停止循环
+
+本模块不依赖 PyQt，Qt 信号的桥接见 qt_async.py。
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Awaitable, Optional
+
+from db_pool import close_all_pools
+
+
+class AsyncRuntime:
+    """在后台线程中常驻运行的事件循环"""
+
+    def __init__(self, name: str = "async-runtime"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """后台事件循环（首次访问时启动）"""
+        self.start()
+        return self._loop
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """启动后台线程（已启动时不做任何事）"""
+        with self._lock:
+            if self.is_running():
+                return
+            ready = threading.Event()
+
+            def run():
+                self._loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(self._loop)
+                self._loop.call_soon(ready.set)
+                try:
+                    self._loop.run_forever()
+                finally:
+                    self._loop.close()
+
+            self._thread = threading.Thread(target=run, name=self.name, daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def submit(self, coro: Awaitable[Any]) -> concurrent.futures.Future:
+        """
+        把协程提交到后台事件循环执行（可从任意线程调用）
+        Args:
+            coro: 协程
+        Returns:
+            concurrent.futures.Future，cancel() 会取消循环中的任务
+        """
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("不能在后台事件循环线程内调用 submit()，请直接 await 或使用 asyncio.create_task")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """提交协程并阻塞等待结果（超时后取消任务并抛出 TimeoutError）"""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def shutdown(self, timeout: float = 10.0):
+        """取消剩余任务、关闭数据库连接池，然后停止事件循环"""
+        with self._lock:
+            if not self.is_running():
+                return
+            loop, thread = self._loop, self._thread
+
+        async def drain():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await close_all_pools()
+
+        try:
+            asyncio.run_coroutine_threadsafe(drain(), loop).result(timeout)
+        except Exception as e:
+            print(f"关闭后台事件循环时出错: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        with self._lock:
+            self._thread = None
+            self._loop = None
+
+
+_runtime: Optional[AsyncRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime() -> AsyncRuntime:
+    """进程内共享的后台事件循环（首次调用时创建并启动）"""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = AsyncRuntime()
+        _runtime.start()
+        return _runtime
+
+
+def shutdown_runtime(timeout: float = 10.0):
+    """停止共享的后台事件循环（程序退出时调用）"""
+    global _runtime
+    with _runtime_lock:
+        runtime, _runtime = _runtime, None
+    if runtime is not None:
+        runtime.shutdown(timeout)
@@ -0,0 +1,151 @@
+"""
+自适应批次大小控制（AIMD）
+
+DocAGTest 和 Testcase_agent 分批生成时，批次越大往返次数越少，但过大的批次会让模型输出被截断。
+控制器根据每个批次的观测结果调整下一批的大小：
+- 输出完整、产出达标且耗时正常：加性增大（+increase_step）
+- 输出被截断或产出明显不足：乘性减小（×decrease_factor），并把本次请求的大小记为截断上限
+- 耗时超过 target_latency：乘性减小
+增大时不会超过截断上限；在上限之下连续稳定 probe_after 次后，才再次尝试提高上限。
+这样批次大小会收敛到不截断的最大值。
+
+控制器按运行隔离（get_batch_controller）：同一次运行内的多次调用（如流水线模式下各分组的测试用例生成）
+共享学到的大小，不同运行之间互不影响。调用方的 max_batch_size 只是起始大小，批次可以增大到自适应上限。
+"""
+
+import math
+import weakref
+from typing import Any, Dict, List, Optional
+
+
+class AdaptiveBatchSizer:
+    """AIMD 批次大小控制器"""
+
+    def __init__(self, initial: int, min_size: int = 3, max_size: int = 50, increase_step: int = 2,
+                 decrease_factor: float = 0.5, target_latency: Optional[float] = None,
+                 min_yield_ratio: float = 0.5, probe_after: int = 3):
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size)
+        self.size = max(min_size, min(initial, self.max_size))
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.target_latency = target_latency
+        self.min_yield_ratio = min_yield_ratio
+        self.probe_after = probe_after
+        # 观测到截断时的请求大小，增大时不超过它
+        self.ceiling: Optional[int] = None
+        self._stable = 0
+        self.history: List[Dict] = []
+
+    def reseed(self, min_size: int, max_size: int):
+        """
+        按新的调用参数重新设定范围：已学到的大小保留，但限制在新的范围内
+        Args:
+            min_size: 最小批次
+            max_size: 最大批次
+        """
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size)
+        self.size = max(self.min_size, min(self.size, self.max_size))
+
+    def next_size(self, remaining: Optional[int] = None) -> int:
+        """下一批的大小（不超过剩余数量）"""
+        if remaining is None:
+            return self.size
+        return max(1, min(self.size, remaining))
+
+    def max_rounds(self, remaining: int, floor: int = 0) -> int:
+        """按最小批次估算完成 remaining 条最多需要的轮数（用作分批的安全上限）"""
+        return max(floor, math.ceil(remaining / self.min_size) + 1)
+
+    def note_truncation(self, requested: int):
+        """
+        记录一次非分批请求（如一次性生成全部）的截断：只收紧上限，不按 AIMD 缩小当前批次
+        Args:
+            requested: 被截断的请求条数
+        """
+        self.ceiling = requested if self.ceiling is None else min(self.ceiling, requested)
+        self.size = max(self.min_size, min(self.size, requested - 1))
+
+    def observe(self, requested: int, produced: int, elapsed: float, truncated: bool = False) -> int:
+        """
+        记录一个批次的结果并调整批次大小
+        Args:
+            requested: 本批请求的条数
+            produced: 实际产出的条数
+            elapsed: 耗时（秒）
+            truncated: 输出是否被截断
+        Returns:
+            调整后的批次大小
+        """
+        previous = self.size
+        short = requested > 0 and produced < requested * self.min_yield_ratio
+        slow = self.target_latency is not None and elapsed > self.target_latency
+        if truncated or short:
+            self.ceiling = requested if self.ceiling is None else min(self.ceiling, requested)
+            self.size = max(self.min_size, math.floor(min(self.size, requested) * self.decrease_factor))
+            self._stable = 0
+            reason = "截断" if truncated else "产出不足"
+        elif slow:
+            self.size = max(self.min_size, math.floor(self.size * self.decrease_factor))
+            self._stable = 0
+            reason = "耗时过长"
+        else:
+            limit = self.max_size
+            if self.ceiling is not None:
+                if self.size >= self.ceiling - 1:
+                    self._stable += 1
+                    if self._stable >= self.probe_after:
+                        # 在上限之下稳定了一段时间，重新试探更大的批次
+                        self.ceiling += self.increase_step
+                        self._stable = 0
+                limit = min(limit, self.ceiling - 1)
+            # 只有请求了完整批次时才增大（最后一批通常只请求剩余数量）
+            if requested >= self.size:
+                self.size = max(self.min_size, min(limit, self.size + self.increase_step))
+            reason = "正常"
+        self.history.append({"requested": requested, "produced": produced, "elapsed": round(elapsed, 3),
+                             "truncated": truncated, "reason": reason, "size": self.size})
+        if self.size != previous:
+            print(f"批次大小调整（{reason}）：{previous} -> {self.size}")
+        return self.size
+
+    def stats(self) -> Dict:
+        """返回控制器状态"""
+        observed = len(self.history)
+        truncations = sum(1 for item in self.history if item["truncated"])
+        return {
+            "size": self.size,
+            "ceiling": self.ceiling,
+            "observed": observed,
+            "truncation_rate": truncations / observed if observed else 0.0,
+        }
+
+
+# 运行（检查点对象）-> {阶段: 控制器}；运行结束、检查点被回收后自动释放
+_controllers: "weakref.WeakKeyDictionary[Any, Dict[str, AdaptiveBatchSizer]]" = weakref.WeakKeyDictionary()
+
+
+def get_batch_controller(stage: str, initial: int, owner: Any = None, min_size: int = 3, max_size: int = 50,
+                         **kwargs) -> AdaptiveBatchSizer:
+    """
+    获取指定运行、指定阶段的批次控制器
+    Args:
+        stage: 阶段名称（doc / testcase）
+        initial: 起始批次大小（调用方的 max_batch_size），仅创建时生效
+        owner: 所属运行（通常是检查点对象），为 None 时每次创建新的控制器
+        min_size: 最小批次（不超过 initial）
+        max_size: 自适应上限（不低于 initial）
+        kwargs: 其他 AdaptiveBatchSizer 参数（仅创建时生效）
+    Returns:
+        批次控制器
+    """
+    min_size = min(min_size, initial)
+    max_size = max(max_size, initial)
+    stages = _controllers.setdefault(owner, {}) if owner is not None else {}
+    controller = stages.get(stage)
+    if controller is None:
+        controller = stages[stage] = AdaptiveBatchSizer(initial, min_size=min_size, max_size=max_size, **kwargs)
+    else:
+        controller.reseed(min_size, max_size)
+    return controller
@@ -0,0 +1,350 @@
+"""
+流水线性能基准测试
+
+包含两类测试，结果输出为 JSON：
+1. pipeline：按 pipeline.run_pipeline 的顺序依次驱动 DocAGTest、Sql_agent、Testcase_agent
+   三个阶段。大模型由 llm_standin.py 的回放替身服务模拟（脚本响应，可配置首包延迟和输出速度），
+   不需要网络和 API key
+2. 微基准：
+   - parse：测试用例解析吞吐（MB/秒）：完整输出、256 字符分段流式输入、带注释的输出、截断的输出
+   - excel：写入 1k / 10k / 100k 行的耗时，以及向这些文件追加 1k 行的耗时（ExcelSink 分片 vs 加载工作簿追加）
+   - sql：SQLite 查询延迟（规则快速通道生成的 SQL、全文检索、Sql_agent.run_agent 整体）
+
+对比模式：--baseline 指定之前保存的结果文件，超过容差（--tolerance）的退化会被标记，
+并以退出码 1 结束，便于在 CI 中使用。
+
+用法：
+    python benchmark.py --output bench.json
+    python benchmark.py --suite parse,sql --baseline bench.json --tolerance 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+BENCH_DIR = tempfile.mkdtemp(prefix="testcase_bench_")
+DEFAULT_DOC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "doc",
+                           "ERP（资源协同）管理平台需求说明书（商品管理部分）.doc")
+
+SUITES = ("pipeline", "parse", "excel", "sql")
+
+CASE_FIELDS = ["模块名称", "功能项", "用例说明", "前置条件", "输入", "执行步骤", "预期结果", "重要程度"]
+
+
+def make_cases(count: int) -> List[Dict]:
+    """生成字段齐全的模拟测试用例"""
+    return [{
+        "模块名称": "商品管理",
+        "功能项": f"商品列表-{i % 20}",
+        "用例说明": f"验证商品列表第 {i} 个场景的查询与展示是否正确",
+        "前置条件": "用户已登录系统，并具有商品管理权限",
+        "输入": f"商品名称=测试商品{i}，分类=日用品，价格={i % 100}.00",
+        "执行步骤": "1. 打开商品管理页面\n2. 输入查询条件\n3. 点击查询按钮",
+        "预期结果": "列表正确展示符合条件的商品，分页信息正确",
+        "重要程度": "高中低"[i % 3],
+    } for i in range(count)]
+
+
+def make_requirements(count: int) -> List[Dict]:
+    """生成模拟需求记录"""
+    modules = ["商品管理", "商品品牌", "商品分类", "库存管理", "订单管理"]
+    return [{
+        "requirements": f"{modules[i % len(modules)]}第 {i} 条需求：列表页支持按名称、状态筛选并分页展示",
+        "importance": "高中低"[i % 3],
+        "moduleName": modules[i % len(modules)],
+        "submitter": ["田老师", "助教小姐姐", "但问智能"][i % 3],
+    } for i in range(count)]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """返回以毫秒为单位的延迟分位数"""
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))] * 1000
+
+    return {
+        "p50_ms": round(percentile(0.50), 3),
+        "p95_ms": round(percentile(0.95), 3),
+        "p99_ms": round(percentile(0.99), 3),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+    }
+
+
+def configure_simulated_model(args):
+    """配置回放替身服务的环境变量（必须在导入 llms 之前调用）"""
+    rules = [
+        {"match": "写入数据库", "tool_call": {"arguments": {"requirements": make_requirements(args.requirements)}}},
+        {"match": ".*", "content": json.dumps(make_cases(args.cases_per_response), ensure_ascii=False)},
+    ]
+    script_path = os.path.join(BENCH_DIR, "rules.json")
+    with open(script_path, "w", encoding="utf-8") as f:
+        json.dump(rules, f, ensure_ascii=False)
+    os.environ.update({
+        "LLM_STANDIN": "replay",
+        "LLM_STANDIN_SCRIPT": script_path,
+        "LLM_STANDIN_CASSETTE": os.path.join(BENCH_DIR, "cassettes.jsonl"),
+        "LLM_STANDIN_LATENCY": str(args.latency),
+        "LLM_STANDIN_TOKEN_RATE": str(args.token_rate),
+        "LLM_CACHE_MODE": "off",
+    })
+
+
+async def bench_pipeline(args) -> Dict[str, float]:
+    """按 pipeline.run_pipeline 的顺序运行三个阶段"""
+    from DocAGTest import run_agent as doc_to_db
+    from Sql_agent import run_agent as sql_query_agent
+    from Testcase_agent import run_agent as testcase_gen_agent, BATCH_CONFIG
+    import llms
+
+    db_path = os.path.join(BENCH_DIR, "pipeline.sqlite")
+    excel_path = os.path.join(BENCH_DIR, "pipeline.xlsx")
+    sql_prompt = "获取商品管理模块的需求"
+    timings = {}
+
+    start = time.perf_counter()
+    rows = await doc_to_db("请将商品管理模块的需求写入数据库，id从1开始。", start_id=1,
+                           max_batch_size=args.batch_size, doc_path=args.doc, db_path=db_path)
+    timings["doc_stage_seconds"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    requirements_list = await sql_query_agent(sql_prompt, db_path=db_path, filter=sql_prompt, start_id=1 + len(rows))
+    timings["sql_stage_seconds"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cases = await testcase_gen_agent("请根据需求生成测试用例", db_path=db_path, excel_path=excel_path, filter=sql_prompt,
+                                     start_id=1 + len(rows) + len(requirements_list), target_count=args.target,
+                                     max_batch_size=args.batch_size, requirements_list=requirements_list,
+                                     stream=True, concurrency=BATCH_CONFIG["max_concurrency"])
+    timings["testcase_stage_seconds"] = time.perf_counter() - start
+
+    total = sum(timings.values())
+    return {
+        **{name: round(value, 4) for name, value in timings.items()},
+        "total_seconds": round(total, 4),
+        "requirements": len(rows),
+        "queried": len(requirements_list),
+        "cases": len(cases),
+        "cases_per_sec": round(len(cases) / total, 3) if total else 0.0,
+        "model_requests": llms.standin_server.stats["requests"],
+    }
+
+
+def bench_parse(args) -> Dict[str, Dict[str, float]]:
+    """测试用例解析吞吐"""
+    from Testcase_agent import extract_testcase_data
+    from json_stream import JSONObjectStream, parse_json_objects
+
+    body = json.dumps(make_cases(args.parse_cases), ensure_ascii=False, indent=2)
+    fenced = f"以下是生成的测试用例：\n```json\n{body}\n```\n"
+    commented = fenced.replace('"重要程度"', '// 重要程度取值：高/中/低\n    "重要程度"')
+    truncated = fenced[:len(fenced) * 2 // 3]
+
+    def streamed(text):
+        stream = JSONObjectStream()
+        for start in range(0, len(text), 256):
+            stream.feed(text[start:start + 256])
+
+    size_mb = len(fenced.encode("utf-8")) / (1024 * 1024)
+    results = {}
+    for name, func, text in (("extract_testcase_data", extract_testcase_data, fenced),
+                             ("stream_256_chars", streamed, fenced),
+                             ("commented", parse_json_objects, commented),
+                             ("truncated", parse_json_objects, truncated)):
+        samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            func(text)
+            samples.append(time.perf_counter() - start)
+        best = min(samples)
+        results[name] = {**summarize(samples), "input_mb": round(size_mb, 3),
+                         "mb_per_sec": round(size_mb / best, 3) if best else 0.0}
+    return results
+
+
+def bench_excel(args) -> Dict[str, Dict[str, float]]:
+    """Excel 写入耗时：新建文件，以及向已有文件追加（分片只写模式 vs 加载工作簿追加）"""
+    from Testcase_agent import write_test_cases_to_excel
+    from excel_sink import ExcelSink, existing_parts
+
+    results = {}
+    appended = make_cases(args.excel_append_rows)
+    for rows in args.excel_rows:
+        path = os.path.join(BENCH_DIR, f"excel_{rows}.xlsx")
+        for existing in existing_parts(path):
+            os.remove(existing)
+        cases = make_cases(rows)
+        start = time.perf_counter()
+        asyncio.run(write_test_cases_to_excel(cases, path))
+        elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        asyncio.run(ExcelSink(path).append(appended))
+        sink_elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        asyncio.run(write_test_cases_to_excel(appended, path))
+        legacy_elapsed = time.perf_counter() - start
+
+        results[f"rows_{rows}"] = {"write_seconds": round(elapsed, 4),
+                                   "rows_per_sec": round(rows / elapsed, 1) if elapsed else 0.0,
+                                   "append_sink_seconds": round(sink_elapsed, 4),
+                                   "append_legacy_seconds": round(legacy_elapsed, 4)}
+        print(f"Excel 写入 {rows} 行：{elapsed:.2f} 秒；追加 {len(appended)} 行：分片 {sink_elapsed:.2f} 秒，"
+              f"加载工作簿 {legacy_elapsed:.2f} 秒")
+    return results
+
+
+async def bench_sql(args) -> Dict[str, Dict[str, float]]:
+    """SQLite 查询延迟"""
+    from db_pool import get_pool
+    from db_migrations import fts_tokenizer, FTS_TABLE
+    from DocAGTest import connect_database, insert_requirements
+    from Sql_agent import run_agent as sql_query_agent
+    from sql_intent import RequirementFilterParser
+    from models import RequirementRecord
+
+    db_path = os.path.join(BENCH_DIR, "sql.sqlite")
+    records = [RequirementRecord(**row) for row in make_requirements(args.sql_rows)]
+    async with connect_database(db_path) as conn:
+        await insert_requirements(conn, records, 1)
+
+    prompts = ["获取商品管理模块的需求", "查询库存管理和订单管理模块中重要程度为高的未完成需求", "田老师提交的需求"]
+    results = {}
+    async with get_pool(db_path).reader() as conn:
+        parser = RequirementFilterParser(FTS_TABLE if await fts_tokenizer(conn) == "trigram" else None)
+        for index, prompt in enumerate(prompts):
+            sql_query, params = parser.parse(prompt)
+            samples = []
+            for _ in range(args.repeat * 10):
+                start = time.perf_counter()
+                async with conn.execute(sql_query, params) as cursor:
+                    await cursor.fetchall()
+                samples.append(time.perf_counter() - start)
+            results[f"query_{index + 1}"] = {**summarize(samples), "sql": sql_query}
+
+    samples = []
+    for _ in range(args.repeat * 10):
+        start = time.perf_counter()
+        await sql_query_agent(prompts[0], db_path=db_path, filter=prompts[0])
+        samples.append(time.perf_counter() - start)
+    results["sql_agent_fast_path"] = summarize(samples)
+    return results
+
+
+def lower_is_better(metric: str) -> bool:
+    return metric.endswith("_seconds") or metric.endswith("_ms")
+
+
+def higher_is_better(metric: str) -> bool:
+    return metric.endswith("_per_sec")
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float, prefix: str = "") -> List[Dict]:
+    """
+    对比两份结果，返回超过容差的退化项
+    Args:
+        current: 本次结果
+        baseline: 基线结果
+        tolerance: 允许的相对退化比例
+    Returns:
+        退化项列表
+    """
+    regressions = []
+    for key, value in current.items():
+        if key not in baseline:
+            continue
+        path = f"{prefix}{key}"
+        base = baseline[key]
+        if isinstance(value, dict) and isinstance(base, dict):
+            regressions += compare(value, base, tolerance, f"{path}.")
+            continue
+        if not isinstance(value, (int, float)) or not isinstance(base, (int, float)) or not base:
+            continue
+        change = (value - base) / base
+        if (lower_is_better(key) and change > tolerance) or (higher_is_better(key) and -change > tolerance):
+            regressions.append({"metric": path, "baseline": base, "current": value, "change": round(change, 4)})
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="测试用例生成流水线性能基准测试")
+    parser.add_argument("--suite", default=",".join(SUITES), help=f"逗号分隔，可选: {','.join(SUITES)}")
+    parser.add_argument("--output", default=None, help="结果 JSON 文件路径（默认输出到标准输出）")
+    parser.add_argument("--baseline", default=None, help="对比用的基线结果文件")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的相对退化比例")
+    parser.add_argument("--latency", type=float, default=0.5, help="模拟模型首包延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="模拟模型输出速度（token/秒），0 表示不限速")
+    parser.add_argument("--doc", default=DEFAULT_DOC, help="需求文档路径")
+    parser.add_argument("--requirements", type=int, default=20, help="模拟模型每次返回的需求条数")
+    parser.add_argument("--cases-per-response", type=int, default=10, help="模拟模型每次返回的测试用例条数")
+    parser.add_argument("--target", type=int, default=50, help="测试用例目标数量")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--parse-cases", type=int, default=5000, help="解析基准的测试用例条数")
+    parser.add_argument("--excel-rows", default="1000,10000,100000", help="逗号分隔的 Excel 行数")
+    parser.add_argument("--excel-append-rows", type=int, default=1000, help="向已有 Excel 追加的行数")
+    parser.add_argument("--sql-rows", type=int, default=10000, help="SQL 基准的需求行数")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+    args.suite = [name.strip() for name in args.suite.split(",") if name.strip()]
+    unknown = set(args.suite) - set(SUITES)
+    if unknown:
+        parser.error(f"未知的测试项: {', '.join(sorted(unknown))}")
+    args.excel_rows = [int(rows) for rows in args.excel_rows.split(",") if rows.strip()]
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    configure_simulated_model(args)
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "latency": args.latency,
+            "token_rate": args.token_rate,
+        },
+    }
+    if "pipeline" in args.suite:
+        results["pipeline"] = asyncio.run(bench_pipeline(args))
+    if "parse" in args.suite:
+        results["parse"] = bench_parse(args)
+    if "excel" in args.suite:
+        results["excel"] = bench_excel(args)
+    if "sql" in args.suite:
+        results["sql"] = asyncio.run(bench_sql(args))
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare({k: v for k, v in results.items() if k != "meta"},
+                              {k: v for k, v in baseline.items() if k != "meta"}, args.tolerance)
+        results["regressions"] = regressions
+        for item in regressions:
+            print(f"性能退化: {item['metric']} {item['baseline']} -> {item['current']} ({item['change']:+.1%})")
+        if regressions:
+            exit_code = 1
+        else:
+            print(f"未发现超过 {args.tolerance:.0%} 的性能退化")
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"基准测试结果已写入: {args.output}")
+    else:
+        print(output)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
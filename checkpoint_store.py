@@ -0,0 +1,135 @@
+"""
+流水线运行检查点（断点续跑）
+
+GUI 关闭、网络中断或某个批次出错时，已经生成的需求和测试用例不会丢失：
+- 每次运行有一个运行 ID，运行参数保存在 pipeline_runs 表中
+- DocAGTest 和 Testcase_agent 每完成一个批次，就把该批次的产出写入 pipeline_run_batches
+- 每完成一个阶段（doc / sql / testcase），把阶段结果写入 pipeline_run_stages
+
+用同一个运行 ID 重新运行时：已完成的阶段直接读取结果跳过；未完成的阶段从最后一个
+已完成批次之后继续，已完成批次不会再次调用大模型。
+
+检查点与需求数据保存在同一个数据库中（表由 db_migrations 创建），通过 db_pool 的写连接写入。
+"""
+
+import json
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from db_pool import get_pool
+
+
+def new_run_id() -> str:
+    """生成新的运行 ID"""
+    return time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+
+
+class RunCheckpoint:
+    """单次运行的检查点"""
+
+    def __init__(self, db_path: str, run_id: Optional[str] = None):
+        self.db_path = db_path
+        self.run_id = run_id or new_run_id()
+        self.resumed = False
+
+    async def start(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        登记运行；运行 ID 已存在时视为续跑，以检查点中保存的参数为准
+        Args:
+            params: 本次运行参数
+        Returns:
+            实际使用的运行参数
+        """
+        now = time.time()
+        async with get_pool(self.db_path).writer() as conn:
+            async with conn.execute("SELECT params FROM pipeline_runs WHERE run_id = ?", (self.run_id,)) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                await conn.execute(
+                    "INSERT INTO pipeline_runs (run_id, params, status, created_at, updated_at) VALUES (?, ?, 'running', ?, ?)",
+                    (self.run_id, json.dumps(params, ensure_ascii=False), now, now))
+            else:
+                self.resumed = True
+                stored = json.loads(row[0])
+                changed = sorted(key for key in set(params) | set(stored) if params.get(key) != stored.get(key))
+                if changed:
+                    print(f"续跑运行 {self.run_id}：参数 {changed} 与检查点不一致，以检查点中的参数为准")
+                params = stored
+                await conn.execute("UPDATE pipeline_runs SET status = 'running', error = NULL, updated_at = ? WHERE run_id = ?",
+                                   (now, self.run_id))
+            await conn.commit()
+        return params
+
+    async def stage_result(self, stage: str) -> Optional[Any]:
+        """已完成阶段的结果，未完成时返回 None"""
+        async with get_pool(self.db_path).writer() as conn:
+            async with conn.execute("SELECT result FROM pipeline_run_stages WHERE run_id = ? AND stage = ?",
+                                    (self.run_id, stage)) as cursor:
+                row = await cursor.fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def complete_stage(self, stage: str, result: Any):
+        """记录阶段完成及其结果"""
+        now = time.time()
+        async with get_pool(self.db_path).writer() as conn:
+            await conn.execute("INSERT OR REPLACE INTO pipeline_run_stages (run_id, stage, result, finished_at) VALUES (?, ?, ?, ?)",
+                               (self.run_id, stage, json.dumps(result, ensure_ascii=False), now))
+            await conn.execute("UPDATE pipeline_runs SET updated_at = ? WHERE run_id = ?", (now, self.run_id))
+            await conn.commit()
+
+    async def load_batches(self, stage: str) -> Dict[int, Any]:
+        """
+        读取某阶段已完成的批次
+        Returns:
+            批次编号 -> 批次产出，按批次编号排序
+        """
+        async with get_pool(self.db_path).writer() as conn:
+            async with conn.execute(
+                    "SELECT batch_num, payload FROM pipeline_run_batches WHERE run_id = ? AND stage = ? ORDER BY batch_num",
+                    (self.run_id, stage)) as cursor:
+                rows = await cursor.fetchall()
+        return {batch_num: json.loads(payload) for batch_num, payload in rows}
+
+    async def save_batch(self, stage: str, batch_num: int, payload: Any):
+        """记录一个已完成的批次（同一批次重复写入时覆盖）"""
+        now = time.time()
+        async with get_pool(self.db_path).writer() as conn:
+            await conn.execute(
+                "INSERT OR REPLACE INTO pipeline_run_batches (run_id, stage, batch_num, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                (self.run_id, stage, batch_num, json.dumps(payload, ensure_ascii=False), now))
+            await conn.execute("UPDATE pipeline_runs SET updated_at = ? WHERE run_id = ?", (now, self.run_id))
+            await conn.commit()
+
+    async def finish(self, status: str = "done", error: Optional[str] = None):
+        """标记运行结束（done / failed / cancelled）"""
+        async with get_pool(self.db_path).writer() as conn:
+            await conn.execute("UPDATE pipeline_runs SET status = ?, error = ?, updated_at = ? WHERE run_id = ?",
+                               (status, error, time.time(), self.run_id))
+            await conn.commit()
+
+
+async def list_runs(db_path: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """
+    列出最近的运行及其完成的阶段
+    Args:
+        db_path: 数据库路径
+        limit: 最多返回条数
+    Returns:
+        运行信息列表（最近的在前）
+    """
+    async with get_pool(db_path).reader() as conn:
+        async with conn.execute(
+                "SELECT run_id, params, status, error, created_at, updated_at FROM pipeline_runs ORDER BY updated_at DESC LIMIT ?",
+                (limit,)) as cursor:
+            runs = await cursor.fetchall()
+        result = []
+        for run_id, params, status, error, created_at, updated_at in runs:
+            async with conn.execute("SELECT stage FROM pipeline_run_stages WHERE run_id = ?", (run_id,)) as cursor:
+                stages = [row[0] for row in await cursor.fetchall()]
+            async with conn.execute("SELECT COUNT(*) FROM pipeline_run_batches WHERE run_id = ?", (run_id,)) as cursor:
+                batches = (await cursor.fetchone())[0]
+            result.append({"run_id": run_id, "params": json.loads(params), "status": status, "error": error,
+                           "created_at": created_at, "updated_at": updated_at,
+                           "completed_stages": stages, "completed_batches": batches})
+    return result
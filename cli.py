@@ -0,0 +1,217 @@
+"""
+流水线命令行入口（无需 PyQt5，适合无界面的服务器和容器）
+
+单个任务，参数与 GUI 主界面一致：
+    python cli.py run --doc-path ./doc/需求.doc --total 50 --batch-size 10
+    python cli.py run --run-id 20250101-120000-abc123        # 续跑
+
+批量任务：清单中每个任务是一个参数对象（字段同 pipeline.PipelineParams，另可选 name / run_id），
+按 --workers 限制同时运行的任务数：
+    python cli.py batch nightly.json --workers 3
+
+清单可以是任务数组、每行一个任务的 JSON Lines，或 {"defaults": {...}, "jobs": [...]}（defaults 为各任务的公共参数）。
+
+标准输出每行一个 JSON 事件（job_started / log / case / stage / job_done / job_failed / job_cancelled / summary），
+智能体自身的打印输出转到标准错误。任一任务失败时退出码为 1。
+多个任务可以写入同一个数据库：需求 ID 接在表中已有的最大 ID 之后分配，各任务只查询自己写入的需求。
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import sys
+import time
+from dataclasses import asdict, fields
+from typing import Any, Dict, List, Optional, TextIO
+
+from checkpoint_store import new_run_id
+from db_pool import close_all_pools
+from metrics import registry
+from pipeline import PipelineParams, run_pipeline
+
+PARAM_FIELDS = {item.name for item in fields(PipelineParams)}
+JOB_FIELDS = PARAM_FIELDS | {"name", "run_id"}
+
+
+class JsonLinesReporter:
+    """把进度事件按 JSON 行写到标准输出"""
+
+    def __init__(self, stream: TextIO, logs: bool = True, cases: bool = True):
+        self.stream = stream
+        self.logs = logs
+        self.cases = cases
+
+    def emit(self, event: str, **data):
+        if (event == "log" and not self.logs) or (event == "case" and not self.cases):
+            return
+        record = {"event": event, "ts": round(time.time(), 3), **data}
+        self.stream.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self.stream.flush()
+
+
+def load_manifest(path: str) -> List[Dict[str, Any]]:
+    """
+    读取任务清单
+    Args:
+        path: 清单文件路径（JSON 数组 / JSON Lines / {"defaults", "jobs"}）
+    Returns:
+        合并公共参数后的任务列表
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = [json.loads(line) for line in text.splitlines() if line.strip()]
+    defaults: Dict[str, Any] = {}
+    if isinstance(data, dict):
+        defaults = data.get("defaults", {})
+        data = data.get("jobs", [])
+    if not isinstance(data, list):
+        raise ValueError("任务清单应为任务数组、JSON Lines 或包含 jobs 的对象")
+    jobs = []
+    for index, job in enumerate(data, 1):
+        merged = {**defaults, **job}
+        unknown = sorted(set(merged) - JOB_FIELDS)
+        if unknown:
+            raise ValueError(f"第 {index} 个任务包含未知字段: {unknown}")
+        merged.setdefault("name", f"job-{index}")
+        jobs.append(merged)
+    return jobs
+
+
+def job_params(job: Dict[str, Any]) -> PipelineParams:
+    return PipelineParams(**{key: value for key, value in job.items() if key in PARAM_FIELDS})
+
+
+async def run_job(job: Dict[str, Any], reporter: JsonLinesReporter) -> str:
+    """
+    运行一个任务并输出进度事件
+    Returns:
+        任务状态（done / failed / cancelled）
+    """
+    name = job["name"]
+    params = job_params(job)
+    run_id = job.get("run_id") or new_run_id()
+    started = time.perf_counter()
+    case_count = 0
+
+    def on_case(case: Dict):
+        nonlocal case_count
+        case_count += 1
+        reporter.emit("case", job=name, index=case_count, case=case)
+
+    reporter.emit("job_started", job=name, run_id=run_id, params=asdict(params))
+    try:
+        result = await run_pipeline(
+            params, run_id,
+            log=lambda message: reporter.emit("log", job=name, message=message),
+            on_case=on_case,
+            on_stage=lambda stage, status, count: reporter.emit("stage", job=name, stage=stage, status=status, count=count),
+            begin_metrics_run=False,
+        )
+    except asyncio.CancelledError:
+        reporter.emit("job_cancelled", job=name, run_id=run_id)
+        raise
+    except Exception as e:
+        reporter.emit("job_failed", job=name, run_id=run_id, error=str(e),
+                      seconds=round(time.perf_counter() - started, 3))
+        return "failed"
+    reporter.emit("job_done", job=name, run_id=result.run_id, resumed=result.resumed,
+                  requirements=len(result.requirement_rows), queried=len(result.requirements_list),
+                  cases=len(result.test_cases), seconds=round(time.perf_counter() - started, 3))
+    return "done"
+
+
+async def run_jobs(jobs: List[Dict[str, Any]], workers: int, reporter: JsonLinesReporter) -> Dict[str, int]:
+    """
+    以有限并发运行多个任务
+    Args:
+        jobs: 任务列表
+        workers: 同时运行的任务数上限
+        reporter: 进度输出
+    Returns:
+        各状态的任务数
+    """
+    registry.begin_run(f"命令行批量运行（{len(jobs)} 个任务）")
+    semaphore = asyncio.Semaphore(max(1, workers))
+    started = time.perf_counter()
+
+    counts = {"done": 0, "failed": 0, "cancelled": 0}
+
+    async def limited(job):
+        async with semaphore:
+            counts[await run_job(job, reporter)] += 1
+
+    try:
+        await asyncio.gather(*(limited(job) for job in jobs))
+    except asyncio.CancelledError:
+        counts["cancelled"] = len(jobs) - counts["done"] - counts["failed"]
+        raise
+    finally:
+        reporter.emit("summary", jobs=len(jobs), **counts, seconds=round(time.perf_counter() - started, 3),
+                      llm_calls=registry.total("llm_calls_total"),
+                      input_tokens=registry.total("llm_input_tokens_total"),
+                      output_tokens=registry.total("llm_output_tokens_total"))
+        await close_all_pools()
+    return counts
+
+
+def add_param_arguments(parser: argparse.ArgumentParser):
+    """与 GUI 主界面一致的流水线参数"""
+    defaults = PipelineParams()
+    parser.add_argument("--doc-path", default=defaults.doc_path, help="需求文档路径")
+    parser.add_argument("--db-path", default=defaults.db_path, help="数据库路径")
+    parser.add_argument("--excel-path", default=defaults.excel_path, help="Excel 输出路径")
+    parser.add_argument("--total", type=int, default=defaults.total, help="用例总数")
+    parser.add_argument("--batch-size", type=int, default=defaults.batch_size, help="单批生成数")
+    parser.add_argument("--doc-prompt", default=defaults.doc_prompt, help="需求写入数据库指令")
+    parser.add_argument("--sql-prompt", default=defaults.sql_prompt, help="SQL 生成指令")
+    parser.add_argument("--case-prompt", default=defaults.case_prompt, help="测试用例生成指令")
+    parser.add_argument("--start-id", type=int, default=defaults.start_id, help="需求 ID 最小起始值")
+    parser.add_argument("--pipelined", action="store_true", default=defaults.pipelined,
+                        help="流水线模式：需求提取、查询和测试用例生成同时进行")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="测试用例自动生成流水线（命令行）")
+    parser.add_argument("--no-logs", action="store_true", help="不输出 log 事件")
+    parser.add_argument("--no-cases", action="store_true", help="不输出每条测试用例的 case 事件")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="运行单个任务")
+    add_param_arguments(run)
+    run.add_argument("--run-id", default=None, help="续跑的运行 ID")
+    run.add_argument("--name", default="job-1", help="任务名称（用于进度事件）")
+
+    batch = subparsers.add_parser("batch", help="按清单批量运行")
+    batch.add_argument("manifest", help="任务清单（JSON / JSON Lines）")
+    batch.add_argument("--workers", type=int, default=2, help="同时运行的任务数")
+
+    args = parser.parse_args(argv)
+    reporter = JsonLinesReporter(sys.stdout, logs=not args.no_logs, cases=not args.no_cases)
+
+    if args.command == "run":
+        job = {name: getattr(args, name) for name in PARAM_FIELDS}
+        job.update(name=args.name, run_id=args.run_id)
+        jobs, workers = [job], 1
+    else:
+        try:
+            jobs = load_manifest(args.manifest)
+        except (OSError, ValueError) as e:
+            reporter.emit("error", message=f"读取任务清单失败: {e}")
+            return 2
+        workers = args.workers
+
+    # 智能体的打印输出转到标准错误，标准输出只保留 JSON 事件
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            counts = asyncio.run(run_jobs(jobs, workers, reporter))
+        except KeyboardInterrupt:
+            return 130
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
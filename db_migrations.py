@@ -0,0 +1,266 @@
+"""
+test_requirements 存储的表结构迁移
+
+通过 PRAGMA user_version 记录已执行到的版本，每次连接数据库时调用 migrate() 即可把库升级到最新：
+1. 创建需求表（与 DocAGTest/Sql_agent 中的 DB_SCHEMA 一致）
+2. 为 moduleName、importance、tag、date、submitter 创建二级索引
+3. 创建 FTS5 全文检索影子表 test_requirements_fts（覆盖 requirements、moduleName），
+   并通过触发器与主表保持同步；使用 trigram 分词以支持中文子串检索和 LIKE '%关键词%' 加速
+4. 创建 run_history 表，记录每次运行各阶段的 token 用量与成本（见 usage_tracker.py）
+5. 创建检查点表 pipeline_runs / pipeline_run_stages / pipeline_run_batches，
+   记录运行参数、已完成阶段的结果和已完成批次的产出，用于中断后续跑（见 checkpoint_store.py）
+6. 创建 service_jobs 表，记录任务服务收到的流水线任务及其状态和结果（见 job_service.py）
+7. 重建全文检索索引：此前 INSERT OR REPLACE 覆盖需求时没有触发删除触发器（recursive_triggers 未开启），
+   索引中残留了被覆盖的旧内容；db_pool 的连接现已开启 recursive_triggers
+
+当前 SQLite 未编译 FTS5 时跳过第 3 步，describe_schema() 也不会向模型宣告全文检索表。
+"""
+
+import re
+import sqlite3
+from typing import List, Optional, Tuple
+
+import aiosqlite
+
+FTS_TABLE = "test_requirements_fts"
+
+INDEXED_COLUMNS = ["moduleName", "importance", "tag", "date", "submitter"]
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS test_requirements (
+    ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    requirements TEXT NOT NULL,
+    tag INTEGER DEFAULT 0,
+    date TEXT NOT NULL,
+    submitter TEXT NOT NULL,
+    importance TEXT NOT NULL,
+    moduleName TEXT NOT NULL
+)
+"""
+
+_CREATE_INDEXES = [
+    f"CREATE INDEX IF NOT EXISTS idx_test_requirements_{column} ON test_requirements({column})"
+    for column in INDEXED_COLUMNS
+]
+
+_FTS_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS test_requirements_fts_ai AFTER INSERT ON test_requirements BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, requirements, moduleName) VALUES (new.ID, new.requirements, new.moduleName);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS test_requirements_fts_ad AFTER DELETE ON test_requirements BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, requirements, moduleName)
+        VALUES ('delete', old.ID, old.requirements, old.moduleName);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS test_requirements_fts_au AFTER UPDATE ON test_requirements BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, requirements, moduleName)
+        VALUES ('delete', old.ID, old.requirements, old.moduleName);
+        INSERT INTO {FTS_TABLE}(rowid, requirements, moduleName) VALUES (new.ID, new.requirements, new.moduleName);
+    END
+    """,
+]
+
+
+async def _create_fts(conn: aiosqlite.Connection):
+    """创建全文检索表；优先 trigram 分词，不支持时退回 unicode61，FTS5 不可用时跳过"""
+    for tokenizer in ("trigram", "unicode61"):
+        try:
+            await conn.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                f"requirements, moduleName, content='test_requirements', content_rowid='ID', tokenize='{tokenizer}')"
+            )
+            break
+        except sqlite3.OperationalError as e:
+            last_error = e
+    else:
+        print(f"当前 SQLite 不支持 FTS5，跳过全文检索表: {last_error}")
+        return
+    for trigger in _FTS_TRIGGERS:
+        await conn.execute(trigger)
+    # 回填已有数据
+    await conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+async def _create_table(conn: aiosqlite.Connection):
+    await conn.execute(_CREATE_TABLE)
+
+
+async def _create_indexes(conn: aiosqlite.Connection):
+    for statement in _CREATE_INDEXES:
+        await conn.execute(statement)
+
+
+_CREATE_RUN_HISTORY = """
+CREATE TABLE IF NOT EXISTS run_history (
+    ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_name TEXT,
+    started_at REAL NOT NULL,
+    finished_at REAL NOT NULL,
+    stage TEXT NOT NULL,            -- doc / sql / testcase / engineer / total
+    requests INTEGER DEFAULT 0,
+    input_tokens INTEGER DEFAULT 0,
+    output_tokens INTEGER DEFAULT 0,
+    items INTEGER DEFAULT 0,        -- 产出条数
+    cost REAL DEFAULT 0,            -- 估算成本（元）
+    items_per_1k_output_tokens REAL,
+    cost_per_case REAL              -- 仅 total 行
+)
+"""
+
+
+async def _create_run_history(conn: aiosqlite.Connection):
+    await conn.execute(_CREATE_RUN_HISTORY)
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_run_history_started_at ON run_history(started_at)")
+
+
+_CREATE_CHECKPOINT_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS pipeline_runs (
+        run_id TEXT PRIMARY KEY,
+        params TEXT NOT NULL,           -- 运行参数（JSON）
+        status TEXT NOT NULL,           -- running / done / failed
+        error TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS pipeline_run_stages (
+        run_id TEXT NOT NULL,
+        stage TEXT NOT NULL,            -- doc / sql / testcase
+        result TEXT NOT NULL,           -- 阶段结果（JSON）
+        finished_at REAL NOT NULL,
+        PRIMARY KEY (run_id, stage)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS pipeline_run_batches (
+        run_id TEXT NOT NULL,
+        stage TEXT NOT NULL,
+        batch_num INTEGER NOT NULL,
+        payload TEXT NOT NULL,          -- 批次产出（JSON）
+        created_at REAL NOT NULL,
+        PRIMARY KEY (run_id, stage, batch_num)
+    )
+    """,
+]
+
+
+async def _create_checkpoint_tables(conn: aiosqlite.Connection):
+    for statement in _CREATE_CHECKPOINT_TABLES:
+        await conn.execute(statement)
+
+
+_CREATE_SERVICE_JOBS = """
+CREATE TABLE IF NOT EXISTS service_jobs (
+    job_id TEXT PRIMARY KEY,
+    project TEXT NOT NULL,          -- 提交任务的项目（按项目轮流调度）
+    name TEXT NOT NULL,
+    params TEXT NOT NULL,           -- 流水线参数（JSON）
+    run_id TEXT NOT NULL,           -- 流水线检查点的运行 ID
+    status TEXT NOT NULL,           -- queued / running / done / failed / cancelled
+    error TEXT,
+    result TEXT,                    -- 运行结果（JSON）
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+)
+"""
+
+
+async def _create_service_jobs(conn: aiosqlite.Connection):
+    await conn.execute(_CREATE_SERVICE_JOBS)
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_service_jobs_status ON service_jobs(status, submitted_at)")
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_service_jobs_project ON service_jobs(project, submitted_at)")
+
+
+async def _rebuild_fts(conn: aiosqlite.Connection):
+    if await has_fts(conn):
+        await conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+# (版本号, 说明, 迁移函数)
+MIGRATIONS: List[Tuple[int, str, object]] = [
+    (1, "创建需求表", _create_table),
+    (2, "创建二级索引", _create_indexes),
+    (3, "创建全文检索表及同步触发器", _create_fts),
+    (4, "创建运行历史表（token 用量与成本）", _create_run_history),
+    (5, "创建运行检查点表", _create_checkpoint_tables),
+    (6, "创建任务服务表", _create_service_jobs),
+    (7, "重建全文检索索引", _rebuild_fts),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def migrate(conn: aiosqlite.Connection) -> int:
+    """
+    将数据库升级到最新版本
+    Args:
+        conn: 数据库连接
+    Returns:
+        迁移后的版本号
+    """
+    async with conn.execute("PRAGMA user_version") as cursor:
+        current = (await cursor.fetchone())[0]
+    if current >= LATEST_VERSION:
+        return current
+    for version, description, apply in MIGRATIONS:
+        if version <= current:
+            continue
+        await conn.execute("SAVEPOINT migrate")
+        try:
+            await apply(conn)
+            await conn.execute(f"PRAGMA user_version = {version}")
+        except Exception:
+            await conn.execute("ROLLBACK TO SAVEPOINT migrate")
+            await conn.execute("RELEASE SAVEPOINT migrate")
+            raise
+        await conn.execute("RELEASE SAVEPOINT migrate")
+        print(f"数据库迁移到版本 {version}: {description}")
+    await conn.commit()
+    return LATEST_VERSION
+
+
+async def has_fts(conn: aiosqlite.Connection) -> bool:
+    """全文检索表是否存在"""
+    async with conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE,)) as cursor:
+        return await cursor.fetchone() is not None
+
+
+async def fts_tokenizer(conn: aiosqlite.Connection) -> Optional[str]:
+    """
+    全文检索表实际使用的分词器（_create_fts 在不支持 trigram 时会退回 unicode61）
+    Returns:
+        分词器名称，全文检索表不存在时返回 None
+    """
+    async with conn.execute("SELECT sql FROM sqlite_master WHERE name = ?", (FTS_TABLE,)) as cursor:
+        row = await cursor.fetchone()
+    if row is None:
+        return None
+    match = re.search(r"tokenize\s*=\s*'(\w+)", row[0] or "")
+    return match.group(1) if match else "unicode61"
+
+
+def describe_schema(tokenizer: Optional[str] = "trigram") -> str:
+    """
+    返回给模型看的索引与全文检索说明，附加在表结构之后
+    Args:
+        tokenizer: 全文检索表的分词器（fts_tokenizer() 的结果），为 None 时表示全文检索表不可用
+    """
+    lines = ["-- 已建立索引（等值、范围查询可直接命中）：" + "、".join(INDEXED_COLUMNS)]
+    if tokenizer and tokenizer != "trigram":
+        # 非 trigram 分词只能按整词 MATCH，无法加速 LIKE 子串查找，不向模型推荐
+        lines.append(f"-- 全文检索表 {FTS_TABLE} 使用 {tokenizer} 分词，不支持子串匹配；"
+                     f"按需求内容或模块名模糊查找时直接对 test_requirements 使用 LIKE")
+    elif tokenizer:
+        lines += [
+            f"-- 全文检索表 {FTS_TABLE}(requirements, moduleName)，rowid 对应 test_requirements.ID，trigram 分词",
+            f"-- 按需求内容或模块名模糊查找时优先使用（关键词至少 3 个字），例如：",
+            f"-- SELECT * FROM test_requirements WHERE ID IN (SELECT rowid FROM {FTS_TABLE} WHERE requirements LIKE '%关键词%')",
+        ]
+    return "\n".join(lines)
@@ -0,0 +1,144 @@
+"""
+按数据库路径共享的 SQLite 连接池
+
+流水线三个阶段（DocAGTest 写入、Sql_agent 查询、Testcase_agent）过去各自打开、关闭
+aiosqlite 连接。这里为每个数据库路径维护一个连接池：
+- 一个写连接（写操作串行执行）和若干读连接；开启 WAL 后读不会被写阻塞
+- 每个连接设置 synchronous=NORMAL、mmap_size、busy_timeout 和 recursive_triggers，并开启较大的语句缓存，
+  连接在各阶段之间保持打开，预编译语句一直有效
+- 连接池首次打开时执行表结构迁移（db_migrations.migrate）
+
+连接池可以跨事件循环复用（GUI 每次运行都会创建新的事件循环），检测到循环变化时
+只重建锁和空闲队列，连接本身保持不变。
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+import aiosqlite
+
+from db_migrations import migrate
+
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024
+DEFAULT_CACHED_STATEMENTS = 256
+
+
+class SQLitePool:
+    """单个数据库文件的连接池：一个写连接 + 最多 max_readers 个读连接"""
+
+    def __init__(self, path: str, max_readers: int = 4, mmap_size: int = DEFAULT_MMAP_SIZE,
+                 cached_statements: int = DEFAULT_CACHED_STATEMENTS):
+        self.path = path
+        self.max_readers = max_readers
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._readers: List[aiosqlite.Connection] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self._writer_lock: Optional[asyncio.Lock] = None
+        self._open_lock: Optional[asyncio.Lock] = None
+        self._writer_owner: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _bind_loop(self):
+        """绑定到当前事件循环，循环变化时重建异步原语"""
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+        self._loop = loop
+        self._writer_lock = asyncio.Lock()
+        self._open_lock = asyncio.Lock()
+        self._writer_owner = None
+        self._idle = asyncio.Queue()
+        for reader in self._readers:
+            self._idle.put_nowait(reader)
+
+    async def _connect(self) -> aiosqlite.Connection:
+        connection = aiosqlite.connect(self.path, cached_statements=self.cached_statements)
+        # 连接池中的连接一直保持打开，工作线程设为守护线程，避免阻止进程退出
+        getattr(connection, "_thread", connection).daemon = True
+        conn = await connection
+        await conn.execute("PRAGMA journal_mode=WAL")
+        await conn.execute("PRAGMA synchronous=NORMAL")
+        await conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        await conn.execute("PRAGMA busy_timeout=5000")
+        # INSERT OR REPLACE 覆盖旧行时要触发删除触发器，否则全文检索表会残留旧内容
+        await conn.execute("PRAGMA recursive_triggers=ON")
+        return conn
+
+    async def open(self):
+        """打开写连接并执行迁移（重复调用无副作用）"""
+        self._bind_loop()
+        if self._writer is not None:
+            return
+        async with self._open_lock:
+            if self._writer is None:
+                writer = await self._connect()
+                await migrate(writer)
+                self._writer = writer
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        """独占写连接（同一任务内可重入，例如持有写连接时再写入检查点）"""
+        await self.open()
+        task = asyncio.current_task()
+        if self._writer_owner is task:
+            yield self._writer
+            return
+        async with self._writer_lock:
+            self._writer_owner = task
+            try:
+                yield self._writer
+            finally:
+                self._writer_owner = None
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """借出一个读连接，用完自动归还"""
+        await self.open()
+        if self._idle.empty() and len(self._readers) < self.max_readers:
+            conn = await self._connect()
+            self._readers.append(conn)
+        else:
+            conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put_nowait(conn)
+
+    async def close(self):
+        """关闭池中所有连接"""
+        for conn in self._readers:
+            await conn.close()
+        self._readers = []
+        if self._writer is not None:
+            await self._writer.close()
+            self._writer = None
+        self._loop = None
+
+
+_pools: Dict[str, SQLitePool] = {}
+
+
+def get_pool(path: str) -> SQLitePool:
+    """
+    获取（必要时创建）指定数据库路径的连接池
+    Args:
+        path: 数据库文件路径
+    Returns:
+        连接池
+    """
+    key = os.path.abspath(path)
+    pool = _pools.get(key)
+    if pool is None:
+        pool = _pools[key] = SQLitePool(key)
+    return pool
+
+
+async def close_all_pools():
+    """关闭全部连接池"""
+    for pool in list(_pools.values()):
+        await pool.close()
+    _pools.clear()
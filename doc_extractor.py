@@ -0,0 +1,424 @@
+"""
+需求文档文本提取器（纯 Python 实现）
+
+替代通过 win32com 启动 WPS/KWPS 进程读取文档的方式，可在 Linux 服务器上运行：
+- .doc：解析 OLE2 复合文档，读取 WordDocument 流中的 piece table（CLX）还原正文，
+  并根据段落样式（内置标题样式 sti 1-9）或大纲级别标出标题
+- .docx：以流式方式解析 zip 包中的 word/document.xml，根据 styles.xml 中的标题样式标出标题
+
+标题以 Markdown 形式输出（# 一级标题、## 二级标题 ...），表格单元格以制表符分隔。
+.doc 文件通过 mmap 读取，.docx 直接从 zip 成员流式解析；提取结果按（路径、修改时间、大小）缓存，重复调用不会重复解析。
+"""
+
+import mmap
+import os
+import re
+import struct
+import zipfile
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from xml.etree.ElementTree import iterparse
+
+OLE_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+ENDOFCHAIN = 0xFFFFFFFE
+FREESECT = 0xFFFFFFFF
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+class DocExtractionError(Exception):
+    """文档无法被原生解析（格式不支持、已加密或文件损坏）"""
+
+
+class OleFile:
+    """最小化的 OLE2（复合文件二进制格式）读取器，只支持按名称读取根存储下的流"""
+
+    def __init__(self, data):
+        if len(data) < 512 or data[:8] != OLE_SIGNATURE:
+            raise DocExtractionError("不是有效的 OLE2 复合文档")
+        self.data = data
+        self.sector_size = 1 << struct.unpack_from("<H", data, 0x1E)[0]
+        self.mini_sector_size = 1 << struct.unpack_from("<H", data, 0x20)[0]
+        first_dir_sector = struct.unpack_from("<I", data, 0x30)[0]
+        self.mini_cutoff = struct.unpack_from("<I", data, 0x38)[0]
+        first_minifat_sector = struct.unpack_from("<I", data, 0x3C)[0]
+        first_difat_sector, difat_count = struct.unpack_from("<II", data, 0x44)
+
+        self.fat = self._load_fat(first_difat_sector, difat_count)
+        self.directory = self._load_directory(first_dir_sector)
+        root = self.directory.get("Root Entry")
+        if root is None:
+            raise DocExtractionError("复合文档缺少根目录项")
+        self.mini_stream = self._read_chain(root[0], root[1])
+        self.minifat = []
+        if first_minifat_sector not in (ENDOFCHAIN, FREESECT):
+            raw = self._read_chain(first_minifat_sector)
+            self.minifat = list(struct.unpack_from(f"<{len(raw) // 4}I", raw))
+
+    def _sector(self, index: int) -> memoryview:
+        offset = (index + 1) * self.sector_size
+        return memoryview(self.data)[offset:offset + self.sector_size]
+
+    def _load_fat(self, difat_sector: int, difat_count: int) -> List[int]:
+        entries_per_sector = self.sector_size // 4
+        fat_sectors = [s for s in struct.unpack_from("<109I", self.data, 0x4C) if s != FREESECT]
+        for _ in range(difat_count):
+            if difat_sector in (ENDOFCHAIN, FREESECT):
+                break
+            values = struct.unpack_from(f"<{entries_per_sector}I", self._sector(difat_sector))
+            fat_sectors.extend(s for s in values[:-1] if s != FREESECT)
+            difat_sector = values[-1]
+        fat = []
+        for sector in fat_sectors:
+            fat.extend(struct.unpack_from(f"<{entries_per_sector}I", self._sector(sector)))
+        return fat
+
+    def _read_chain(self, start: int, size: Optional[int] = None) -> bytes:
+        chunks = []
+        sector = start
+        seen = 0
+        while sector not in (ENDOFCHAIN, FREESECT) and sector < len(self.fat):
+            chunks.append(self._sector(sector))
+            sector = self.fat[sector]
+            seen += 1
+            if seen > len(self.fat):
+                raise DocExtractionError("FAT 链存在循环")
+        data = b"".join(chunks)
+        return data[:size] if size is not None else data
+
+    def _read_mini_chain(self, start: int, size: int) -> bytes:
+        chunks = []
+        sector = start
+        while sector not in (ENDOFCHAIN, FREESECT) and sector < len(self.minifat):
+            offset = sector * self.mini_sector_size
+            chunks.append(self.mini_stream[offset:offset + self.mini_sector_size])
+            sector = self.minifat[sector]
+        return b"".join(chunks)[:size]
+
+    def _load_directory(self, first_sector: int) -> Dict[str, Tuple[int, int]]:
+        raw = self._read_chain(first_sector)
+        entries = {}
+        for offset in range(0, len(raw) - 127, 128):
+            name_len = struct.unpack_from("<H", raw, offset + 64)[0]
+            entry_type = raw[offset + 66]
+            if entry_type not in (1, 2, 5) or name_len < 2:
+                continue
+            name = raw[offset:offset + name_len - 2].decode("utf-16-le", errors="replace")
+            start, size = struct.unpack_from("<IQ", raw, offset + 116)
+            if self.sector_size == 512:
+                size &= 0xFFFFFFFF
+            entries.setdefault(name, (start, size))
+        return entries
+
+    def open_stream(self, name: str) -> bytes:
+        """读取指定名称的流"""
+        if name not in self.directory:
+            raise DocExtractionError(f"复合文档中不存在流: {name}")
+        start, size = self.directory[name]
+        if size < self.mini_cutoff:
+            return self._read_mini_chain(start, size)
+        return self._read_chain(start, size)
+
+
+# sprm 操作数长度（由 spra 决定），6 表示变长
+_SPRA_OPERAND_SIZE = {0: 1, 1: 1, 2: 2, 3: 4, 4: 2, 5: 2, 7: 3}
+SPRM_P_OUTLINE_LEVEL = 0x2640
+
+
+def _outline_level_from_grpprl(grpprl: bytes) -> Optional[int]:
+    """在段落属性 grpprl 中查找大纲级别（sprmPOutLvl），返回 0-8，找不到返回 None"""
+    pos = 0
+    while pos + 2 <= len(grpprl):
+        sprm = struct.unpack_from("<H", grpprl, pos)[0]
+        pos += 2
+        spra = sprm >> 13
+        if spra == 6:
+            if sprm == 0xD608 and pos + 2 <= len(grpprl):
+                size = struct.unpack_from("<H", grpprl, pos)[0] + 1
+            elif pos < len(grpprl):
+                size = grpprl[pos] + 1
+            else:
+                break
+        else:
+            size = _SPRA_OPERAND_SIZE[spra]
+        if sprm == SPRM_P_OUTLINE_LEVEL and pos < len(grpprl):
+            level = grpprl[pos]
+            return level if level < 9 else None
+        pos += size
+    return None
+
+
+class WordBinaryDocument:
+    """Word 97-2003 二进制文档（.doc）正文与段落样式解析"""
+
+    def __init__(self, ole: OleFile):
+        self.word = ole.open_stream("WordDocument")
+        fib = self.word
+        if struct.unpack_from("<H", fib, 0)[0] != 0xA5EC:
+            raise DocExtractionError("WordDocument 流标识无效")
+        flags = struct.unpack_from("<H", fib, 0x0A)[0]
+        if flags & 0x0100:
+            raise DocExtractionError("文档已加密，无法原生解析")
+        table_name = "1Table" if flags & 0x0200 else "0Table"
+        self.table = ole.open_stream(table_name)
+
+        # 定位 FibRgLw97 与 FibRgFcLcb97
+        pos = 32
+        csw = struct.unpack_from("<H", fib, pos)[0]
+        pos += 2 + csw * 2
+        cslw = struct.unpack_from("<H", fib, pos)[0]
+        rg_lw = pos + 2
+        pos = rg_lw + cslw * 4
+        self.fc_lcb = pos + 2
+        self.ccp_text = struct.unpack_from("<i", fib, rg_lw + 12)[0]
+
+    def _fc_lcb(self, index: int) -> Tuple[int, int]:
+        return struct.unpack_from("<II", self.word, self.fc_lcb + index * 8)
+
+    def pieces(self) -> List[Tuple[int, int, int, bool]]:
+        """解析 CLX 中的 piece table，返回 (cp_start, cp_end, fc, 是否压缩) 列表"""
+        fc_clx, lcb_clx = self._fc_lcb(33)
+        clx = self.table[fc_clx:fc_clx + lcb_clx]
+        pos = 0
+        while pos < len(clx) and clx[pos] == 0x01:
+            pos += 3 + struct.unpack_from("<H", clx, pos + 1)[0]
+        if pos >= len(clx) or clx[pos] != 0x02:
+            raise DocExtractionError("未找到 piece table")
+        lcb = struct.unpack_from("<I", clx, pos + 1)[0]
+        plc = clx[pos + 5:pos + 5 + lcb]
+        count = (lcb - 4) // 12
+        cps = struct.unpack_from(f"<{count + 1}I", plc)
+        result = []
+        for i in range(count):
+            fc_value = struct.unpack_from("<I", plc, (count + 1) * 4 + i * 8 + 2)[0]
+            compressed = bool(fc_value & 0x40000000)
+            fc = fc_value & 0x3FFFFFFF
+            if compressed:
+                fc //= 2
+            result.append((cps[i], cps[i + 1], fc, compressed))
+        return result
+
+    def heading_styles(self) -> Dict[int, int]:
+        """读取样式表，返回 {istd: 标题级别(1-9)}，只包含内置标题样式"""
+        fc, lcb = self._fc_lcb(1)
+        stsh = self.table[fc:fc + lcb]
+        if len(stsh) < 6:
+            return {}
+        cb_stshi = struct.unpack_from("<H", stsh, 0)[0]
+        cstd, cb_base = struct.unpack_from("<HH", stsh, 2)
+        pos = 2 + cb_stshi
+        levels = {}
+        for istd in range(cstd):
+            if pos + 2 > len(stsh):
+                break
+            cb_std = struct.unpack_from("<H", stsh, pos)[0]
+            if cb_std >= 2 and cb_base:
+                sti = struct.unpack_from("<H", stsh, pos + 2)[0] & 0x0FFF
+                if 1 <= sti <= 9:
+                    levels[istd] = sti
+            pos += 2 + cb_std
+        return levels
+
+    def paragraph_runs(self) -> Tuple[List[int], List[Tuple[int, int, Optional[int]]]]:
+        """
+        读取 PAPX FKP，返回按 FC 排序的段落属性区间
+        Returns:
+            (区间起始 FC 列表, [(区间结束 FC, istd, 大纲级别)])
+        """
+        fc, lcb = self._fc_lcb(13)
+        plc = self.table[fc:fc + lcb]
+        count = (lcb - 4) // 8
+        if count <= 0:
+            return [], []
+        pns = struct.unpack_from(f"<{count}I", plc, (count + 1) * 4)
+        starts, runs = [], []
+        for pn in pns:
+            page = self.word[(pn & 0x3FFFFF) * 512:((pn & 0x3FFFFF) + 1) * 512]
+            if len(page) < 512:
+                continue
+            crun = page[511]
+            rgfc = struct.unpack_from(f"<{crun + 1}I", page, 0)
+            for i in range(crun):
+                b_offset = page[(crun + 1) * 4 + i * 13] * 2
+                istd, level = 0, None
+                if b_offset:
+                    cb = page[b_offset]
+                    if cb == 0:
+                        size, start = page[b_offset + 1] * 2, b_offset + 2
+                    else:
+                        size, start = cb * 2 - 1, b_offset + 1
+                    papx = page[start:start + size]
+                    if len(papx) >= 2:
+                        istd = struct.unpack_from("<H", papx, 0)[0]
+                        level = _outline_level_from_grpprl(papx[2:])
+                starts.append(rgfc[i])
+                runs.append((rgfc[i + 1], istd, level))
+        order = sorted(range(len(starts)), key=starts.__getitem__)
+        return [starts[i] for i in order], [runs[i] for i in order]
+
+    def paragraphs(self) -> List[Tuple[str, int]]:
+        """返回 [(段落文本, 标题级别)]，正文段落的级别为 0"""
+        styles = self.heading_styles()
+        run_starts, runs = self.paragraph_runs()
+
+        def level_at(fc: int) -> int:
+            index = bisect_right(run_starts, fc) - 1
+            if index < 0 or fc >= runs[index][0]:
+                return 0
+            _, istd, outline = runs[index]
+            if outline is not None:
+                return outline + 1
+            return styles.get(istd, 0)
+
+        paragraphs = []
+        buffer = []
+        for cp_start, cp_end, fc, compressed in self.pieces():
+            if cp_start >= self.ccp_text:
+                break
+            cp_end = min(cp_end, self.ccp_text)
+            width = 1 if compressed else 2
+            raw = self.word[fc:fc + (cp_end - cp_start) * width]
+            text = raw.decode("cp1252" if compressed else "utf-16-le", errors="replace")
+            segment_start = 0
+            for match in re.finditer("\r", text):
+                buffer.append(text[segment_start:match.start()])
+                paragraphs.append(("".join(buffer), level_at(fc + match.start() * width)))
+                buffer = []
+                segment_start = match.end()
+            buffer.append(text[segment_start:])
+        if "".join(buffer).strip():
+            paragraphs.append(("".join(buffer), 0))
+        return paragraphs
+
+
+_FIELD_CODE = re.compile("\x13[^\x13\x14\x15]*\x14?|\x15")
+_CONTROL_CHARS = re.compile("[\x00-\x06\x08\x0e-\x12\x16-\x1d\x1f]")
+
+
+def _clean_doc_text(text: str) -> str:
+    """去掉域代码、嵌入对象占位符等控制字符，保留域结果文本"""
+    text = _FIELD_CODE.sub("", text)
+    text = text.replace("\x07", "\t").replace("\x0b", "\n").replace("\x0c", "\n").replace("\x1e", "-")
+    return _CONTROL_CHARS.sub("", text)
+
+
+def _format_paragraphs(paragraphs) -> str:
+    lines = []
+    for text, level in paragraphs:
+        text = text.strip()
+        if not text:
+            continue
+        lines.append(f"{'#' * level} {text}" if level else text)
+    return "\n".join(lines)
+
+
+def _extract_doc(data) -> str:
+    document = WordBinaryDocument(OleFile(data))
+    return _format_paragraphs((_clean_doc_text(text), level) for text, level in document.paragraphs())
+
+
+def _docx_heading_levels(archive: zipfile.ZipFile) -> Dict[str, int]:
+    """从 styles.xml 读取 {styleId: 标题级别}"""
+    try:
+        handle = archive.open("word/styles.xml")
+    except KeyError:
+        return {}
+    levels = {}
+    with handle:
+        for _, element in iterparse(handle):
+            if element.tag != f"{W_NS}style":
+                continue
+            style_id = element.get(f"{W_NS}styleId")
+            name = element.find(f"{W_NS}name")
+            outline = element.find(f"{W_NS}pPr/{W_NS}outlineLvl")
+            if outline is not None and outline.get(f"{W_NS}val", "").isdigit():
+                level = int(outline.get(f"{W_NS}val")) + 1
+                if level <= 9:
+                    levels[style_id] = level
+            elif name is not None:
+                match = re.fullmatch(r"(?:heading|标题)\s*(\d)", name.get(f"{W_NS}val", ""), re.IGNORECASE)
+                if match:
+                    levels[style_id] = int(match.group(1))
+            element.clear()
+    return levels
+
+
+def _extract_docx(data) -> str:
+    try:
+        archive = zipfile.ZipFile(data)
+    except zipfile.BadZipFile as e:
+        raise DocExtractionError(f"不是有效的 docx 文件: {e}") from e
+    with archive:
+        styles = _docx_heading_levels(archive)
+        paragraphs = []
+        row_cells: List[str] = []
+        texts: List[str] = []
+        level = 0
+        table_depth = 0
+        with archive.open("word/document.xml") as handle:
+            for event, element in iterparse(handle, events=("start", "end")):
+                tag = element.tag
+                if event == "start":
+                    if tag == f"{W_NS}tbl":
+                        table_depth += 1
+                    elif tag == f"{W_NS}p":
+                        texts, level = [], 0
+                    continue
+                if tag == f"{W_NS}t":
+                    texts.append(element.text or "")
+                elif tag == f"{W_NS}tab":
+                    texts.append("\t")
+                elif tag in (f"{W_NS}br", f"{W_NS}cr"):
+                    texts.append("\n")
+                elif tag == f"{W_NS}pStyle":
+                    level = styles.get(element.get(f"{W_NS}val"), level)
+                elif tag == f"{W_NS}outlineLvl" and element.get(f"{W_NS}val", "").isdigit():
+                    outline = int(element.get(f"{W_NS}val"))
+                    level = outline + 1 if outline < 9 else 0
+                elif tag == f"{W_NS}p":
+                    text = "".join(texts)
+                    if table_depth:
+                        row_cells.append(text)
+                    else:
+                        paragraphs.append((text, level))
+                    element.clear()
+                elif tag == f"{W_NS}tc":
+                    row_cells.append("\t")
+                elif tag == f"{W_NS}tr":
+                    row = " ".join("".join(row_cells).split(" ")).strip("\t")
+                    paragraphs.append((re.sub(r"\t+", "\t", row), 0))
+                    row_cells = []
+                    element.clear()
+                elif tag == f"{W_NS}tbl":
+                    table_depth -= 1
+        return _format_paragraphs(paragraphs)
+
+
+@lru_cache(maxsize=32)
+def _extract_cached(path: str, mtime_ns: int, size: int) -> str:
+    if size == 0:
+        raise DocExtractionError("文档为空")
+    with open(path, "rb") as f:
+        signature = f.read(8)
+        if signature == OLE_SIGNATURE:
+            # OLE2 扇区随机访问较多，使用内存映射避免整文件读入
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return _extract_doc(data)
+        if signature[:2] == b"PK":
+            f.seek(0)
+            return _extract_docx(f)
+    raise DocExtractionError(f"不支持的文档格式: {path}")
+
+
+def extract_text(file_path: str) -> str:
+    """
+    提取 .doc/.docx 文档正文
+    Args:
+        file_path: 文档路径
+    Returns:
+        文档文本，标题以 Markdown 的 # 前缀标注
+    """
+    path = os.path.abspath(file_path)
+    stat = os.stat(path)
+    return _extract_cached(path, stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,177 @@
+"""
+测试用例 Excel 输出（追加优化）
+
+原来的 write_test_cases_to_excel 在文件已存在时会 load_workbook 整个工作簿，逐行追加后再整体保存，
+文件越大每次写入越慢，而且阻塞事件循环。ExcelSink 不再读取已有文件：
+- 每次运行的测试用例写入独立的分片文件：目标文件不存在时直接写目标文件，
+  否则写入同目录下的 <文件名>.part0001.xlsx、.part0002.xlsx ...
+- 使用 openpyxl 只写模式（write_only）保存，每次 append() 只重写当前分片，
+  分片达到 max_rows_per_part 行后滚动到下一个分片，单次写入的开销与已有文件大小无关
+- 写入在线程池中执行，不阻塞事件循环；同一个 sink 的写入按顺序串行
+
+需要单个文件时用 merge_parts() 合并（只读模式流式读取、只写模式写出，超过单表行数上限时自动分表）：
+    python excel_sink.py merge ./Exel/new_cases.xlsx
+"""
+
+import argparse
+import asyncio
+import glob
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from openpyxl import Workbook, load_workbook
+
+# 测试用例的标准字段顺序
+TESTCASE_COLUMNS = ["模块名称", "功能项", "用例说明", "前置条件", "输入", "执行步骤", "预期结果", "重要程度"]
+
+EXCEL_CONFIG = {
+    "mode": "parts",  # parts：分片只写模式；append：加载已有工作簿追加（旧方式）
+    "max_rows_per_part": 1000,  # 单个分片的最大行数（限制每次重写的开销）
+    "max_rows_per_sheet": 1000000,  # 合并时单个工作表的最大行数（Excel 上限为 1048576）
+}
+
+_PART_PATTERN = re.compile(r"\.part(\d{4})\.xlsx$")
+
+
+def part_path(file_path: str, index: int) -> str:
+    """第 index 个分片的路径（0 为目标文件本身）"""
+    if index == 0:
+        return file_path
+    stem, _ = os.path.splitext(file_path)
+    return f"{stem}.part{index:04d}.xlsx"
+
+
+def existing_parts(file_path: str) -> List[str]:
+    """目标文件及其已有分片，按顺序排列"""
+    stem, _ = os.path.splitext(file_path)
+    parts = sorted(glob.glob(glob.escape(stem) + ".part[0-9][0-9][0-9][0-9].xlsx"))
+    return ([file_path] if os.path.isfile(file_path) else []) + parts
+
+
+def _reserve_part(file_path: str) -> str:
+    """占用下一个可用的分片路径（独占创建空文件，多个 sink 写同一目标时不会互相覆盖）"""
+    indexes = [int(match.group(1)) for match in map(_PART_PATTERN.search, existing_parts(file_path)) if match]
+    index = 0 if not indexes and not os.path.isfile(file_path) else max(indexes, default=0) + 1
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    while True:
+        path = part_path(file_path, index)
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return path
+        except FileExistsError:
+            index += 1
+
+
+def standardize(case: Dict) -> tuple:
+    """按标准字段顺序取出一条测试用例的各列"""
+    return tuple(case.get(column, "") for column in TESTCASE_COLUMNS)
+
+
+def _write_rows(path: str, rows: Iterable[tuple], max_rows_per_sheet: int) -> int:
+    """以只写模式写出（超过单表上限时自动分表），先写临时文件再替换，避免留下半个文件"""
+    workbook = Workbook(write_only=True)
+    sheet = None
+    count = 0
+    sheet_rows = 0
+    for row in rows:
+        if sheet is None or sheet_rows >= max_rows_per_sheet:
+            sheet = workbook.create_sheet("Sheet" if sheet is None else f"Sheet{len(workbook.sheetnames) + 1}")
+            sheet.append(TESTCASE_COLUMNS)
+            sheet_rows = 0
+        sheet.append(row)
+        sheet_rows += 1
+        count += 1
+    if sheet is None:
+        workbook.create_sheet("Sheet").append(TESTCASE_COLUMNS)
+    temp_path = f"{path}.tmp"
+    workbook.save(temp_path)
+    os.replace(temp_path, path)
+    return count
+
+
+class ExcelSink:
+    """按批次增量写入测试用例的 Excel 输出"""
+
+    def __init__(self, file_path: str, max_rows_per_part: Optional[int] = None):
+        self.file_path = file_path
+        self.max_rows_per_part = max_rows_per_part or EXCEL_CONFIG["max_rows_per_part"]
+        self.parts: List[str] = []  # 本次运行写出的分片
+        self.rows_written = 0
+        self._part_rows: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def _append(self, rows: List[tuple]):
+        with self._lock:
+            while rows:
+                if not self.parts or len(self._part_rows) >= self.max_rows_per_part:
+                    # 滚动到新分片
+                    self.parts.append(_reserve_part(self.file_path))
+                    self._part_rows = []
+                room = self.max_rows_per_part - len(self._part_rows)
+                self._part_rows.extend(rows[:room])
+                rows = rows[room:]
+                _write_rows(self.parts[-1], self._part_rows, EXCEL_CONFIG["max_rows_per_sheet"])
+
+    async def append(self, test_cases: List[Dict]):
+        """
+        追加一批测试用例并立即落盘（在线程池中执行）
+        Args:
+            test_cases: 测试用例列表
+        """
+        rows = [standardize(case) for case in test_cases]
+        if not rows:
+            return
+        await asyncio.to_thread(self._append, rows)
+        self.rows_written += len(rows)
+
+
+def merge_parts(file_path: str, output_path: Optional[str] = None, remove_parts: bool = True) -> int:
+    """
+    把目标文件及其分片合并为一个文件（流式读写，内存占用与行数无关）
+    Args:
+        file_path: 目标文件路径
+        output_path: 输出路径（默认覆盖目标文件）
+        remove_parts: 合并后是否删除分片
+    Returns:
+        合并的测试用例行数
+    """
+    # 跳过只占位、尚未写入内容的分片
+    paths = [path for path in existing_parts(file_path) if os.path.getsize(path) > 0]
+
+    def rows():
+        for path in paths:
+            workbook = load_workbook(path, read_only=True)
+            try:
+                for sheet in workbook.worksheets:
+                    for index, row in enumerate(sheet.iter_rows(values_only=True)):
+                        if index == 0 and list(row[:len(TESTCASE_COLUMNS)]) == TESTCASE_COLUMNS:
+                            continue
+                        yield row
+            finally:
+                workbook.close()
+
+    count = _write_rows(output_path or file_path, rows(), EXCEL_CONFIG["max_rows_per_sheet"])
+    if remove_parts:
+        for path in existing_parts(file_path):
+            if path != (output_path or file_path):
+                os.remove(path)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测试用例 Excel 分片工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    merge = subparsers.add_parser("merge", help="合并目标文件及其分片")
+    merge.add_argument("file_path", help="目标 Excel 文件")
+    merge.add_argument("--output", help="输出路径（默认覆盖目标文件）")
+    merge.add_argument("--keep-parts", action="store_true", help="合并后保留分片")
+    args = parser.parse_args()
+    if args.command == "merge":
+        count = merge_parts(args.file_path, args.output, remove_parts=not args.keep_parts)
+        print(f"已合并 {count} 行到 {args.output or args.file_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,76 +1,49 @@
 import sys
-import asyncio
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QLabel, QLineEdit, QPushButton, QTextEdit,
-    QFileDialog, QVBoxLayout, QHBoxLayout, QMessageBox, QSpinBox
+    QFileDialog, QVBoxLayout, QHBoxLayout, QMessageBox, QSpinBox, QCheckBox
 )
-from PyQt5.QtCore import QThread, pyqtSignal
-from DocAGTest import run_agent as doc_to_db
-from Sql_agent import run_agent as sql_query_agent
-from Testcase_agent import run_agent as testcase_gen_agent
+from PyQt5.QtCore import pyqtSignal
 from test_engineer_gui import TestEngineerMainWindow
+from pipeline import PipelineParams, run_pipeline
+from qt_async import AsyncWorker
+from async_runtime import shutdown_runtime
 
-class WorkerThread(QThread):
+class WorkerThread(AsyncWorker):
+    """流水线任务（在共享的后台事件循环中执行，可随时取消，已完成的批次保留在检查点中）"""
     log_signal = pyqtSignal(str)
     done_signal = pyqtSignal(str)
 
-    def __init__(self, doc_path, db_path, excel_path, total, batch_size, doc_prompt, sql_prompt, case_prompt, start_id=1):
+    def __init__(self, doc_path, db_path, excel_path, total, batch_size, doc_prompt, sql_prompt, case_prompt, start_id=1, run_id=None, pipelined=False):
         super().__init__()
-        self.doc_path = doc_path
-        self.db_path = db_path
-        self.excel_path = excel_path
-        self.total = total  # 用作目标生成数量
-        self.batch_size = batch_size  # 用作 max_batch_size
-        self.doc_prompt = doc_prompt
-        self.sql_prompt = sql_prompt
-        self.case_prompt = case_prompt
-        self.start_id = start_id
-
-    def run(self):
-        asyncio.run(self.run_all())
+        self.params = PipelineParams(doc_path=doc_path, db_path=db_path, excel_path=excel_path, total=total,
+                                     batch_size=batch_size, doc_prompt=doc_prompt, sql_prompt=sql_prompt,
+                                     case_prompt=case_prompt, start_id=start_id, pipelined=pipelined)
+        self.run_id = run_id  # 续跑的运行 ID，为空时开始新的运行
+
+    def on_error(self, error):
+        self.log_signal.emit(f'执行出错: {str(error)}')
+        self.done_signal.emit('执行过程中出错！')
+
+    async def run_async(self):
+        await self.run_all()
 
     async def run_all(self):
+        streamed_count = 0
+
+        def on_case(case):
+            # 流式模式：每解析出一条完整的测试用例就输出到日志
+            nonlocal streamed_count
+            streamed_count += 1
+            self.log_signal.emit(f'  [{streamed_count}] {case.get("模块名称", "")} - {case.get("用例说明", "")}')
+
         try:
-            self.log_signal.emit('【1/3】将需求文档内容写入数据库...')
-            self.log_signal.emit('智能分批模式：优先尝试一次性生成，如检测到截断将自动分批处理')
-            
-            # 文档入库，支持智能分批
-            all_sqls = await doc_to_db(self.doc_prompt, start_id=self.start_id, max_batch_size=self.batch_size)
-            self.log_signal.emit(f'需求写入数据库完成，共{len(all_sqls)}条。')
-
-            self.log_signal.emit('【2/3】自动生成需求查询SQL...')
-            # SQL 查询，传递当前 ID 范围
-            current_id = self.start_id + len(all_sqls)
-            requirements_list = await sql_query_agent(self.sql_prompt, db_path=self.db_path, filter=self.sql_prompt, start_id=current_id)
-            self.log_signal.emit(f'查询到的需求数据: 共{len(requirements_list)}条')
-            
-            # 打印前几条需求内容用于调试
-            if requirements_list:
-                self.log_signal.emit('需求内容示例:')
-                for i, req in enumerate(requirements_list[:3]):  # 显示前3条
-                    self.log_signal.emit(f'  {i+1}. {req[:50]}...')
-
-            self.log_signal.emit('【3/3】自动生成测试用例...')
-            # 测试用例生成，传递需求列表和当前 ID 范围，支持智能分批
-            current_id = current_id + len(requirements_list)
-            test_cases = await testcase_gen_agent(
-                self.case_prompt,
-                db_path=self.db_path,
-                excel_path=self.excel_path,
-                filter=self.sql_prompt,
-                start_id=current_id,
-                target_count=self.total,  # 使用用户设置的总数
-                requirements_list=requirements_list  # 传递具体需求列表
-            )
-            self.log_signal.emit(f'生成的测试用例: 共{len(test_cases)}条')
-
-            self.log_signal.emit('所有任务完成！数据已保存到相应文件中。')
-            self.done_signal.emit('测试用例生成完成！')
-        except Exception as e:
-            self.log_signal.emit(f'执行出错: {str(e)}')
-            import traceback
-            self.log_signal.emit(f'详细错误: {traceback.format_exc()}')
+            await run_pipeline(self.params, self.run_id, log=self.log_signal.emit, on_case=on_case)
+        except Exception:
+            # 错误详情已写入日志，检查点已标记为 failed
             self.done_signal.emit('执行过程中出错！')
+            return
+        self.done_signal.emit('测试用例生成完成！')
 
 class MainWindow(QWidget):
     def __init__(self):
@@ -78,29 +51,31 @@ class MainWindow(QWidget):
         self.setWindowTitle("测试用例自动生成系统")
         self.setGeometry(300, 200, 700, 600)
         self.test_engineer_window = None  # 初始化测试工程师窗口引用
+        self.worker = None
         self.init_ui()
 
     def init_ui(self):
         layout = QVBoxLayout()
+        defaults = PipelineParams()
 
         # 需求写入数据库指令
-        self.doc_prompt_edit = QLineEdit("请将商品管理模块的列表UI、新增需求写入数据库，id从1开始。")
+        self.doc_prompt_edit = QLineEdit(defaults.doc_prompt)
         layout.addWidget(QLabel("需求写入数据库指令:"))
         layout.addWidget(self.doc_prompt_edit)
 
         # SQL生成指令
-        self.sql_prompt_edit = QLineEdit("请创建一个 SELECT 查询来获取商品管理模块的需求。")
+        self.sql_prompt_edit = QLineEdit(defaults.sql_prompt)
         layout.addWidget(QLabel("SQL生成指令:"))
         layout.addWidget(self.sql_prompt_edit)
 
         # 测试用例生成指令
-        self.case_prompt_edit = QLineEdit("将需求列表中的列表UI、新增功能整理成测试用例。")
+        self.case_prompt_edit = QLineEdit(defaults.case_prompt)
         layout.addWidget(QLabel("测试用例生成指令:"))
         layout.addWidget(self.case_prompt_edit)
 
         # 文档路径
         doc_layout = QHBoxLayout()
-        self.doc_path_edit = QLineEdit("./doc/ERP（资源协同）管理平台需求说明书（商品管理部分）.doc")
+        self.doc_path_edit = QLineEdit(defaults.doc_path)
         doc_btn = QPushButton("选择需求文档")
         doc_btn.clicked.connect(self.choose_doc)
         doc_layout.addWidget(QLabel("需求文档路径:"))
@@ -110,7 +85,7 @@ class MainWindow(QWidget):
 
         # 数据库路径
         db_layout = QHBoxLayout()
-        self.db_path_edit = QLineEdit(".chat_app_db.sqlite")
+        self.db_path_edit = QLineEdit(defaults.db_path)
         db_btn = QPushButton("选择数据库")
         db_btn.clicked.connect(self.choose_db)
         db_layout.addWidget(QLabel("数据库路径:"))
@@ -120,7 +95,7 @@ class MainWindow(QWidget):
 
         # Excel路径
         excel_layout = QHBoxLayout()
-        self.excel_path_edit = QLineEdit("./Exel/new_cases.xlsx")
+        self.excel_path_edit = QLineEdit(defaults.excel_path)
         excel_btn = QPushButton("选择Excel输出")
         excel_btn.clicked.connect(self.choose_excel)
         excel_layout.addWidget(QLabel("Excel输出路径:"))
@@ -132,16 +107,26 @@ class MainWindow(QWidget):
         param_layout = QHBoxLayout()
         self.total_spin = QSpinBox()
         self.total_spin.setRange(1, 1000)
-        self.total_spin.setValue(25)
+        self.total_spin.setValue(defaults.total)
         self.batch_spin = QSpinBox()
         self.batch_spin.setRange(1, 100)
-        self.batch_spin.setValue(10)
+        self.batch_spin.setValue(defaults.batch_size)
         param_layout.addWidget(QLabel("用例总数:"))
         param_layout.addWidget(self.total_spin)
         param_layout.addWidget(QLabel("单批生成数:"))
         param_layout.addWidget(self.batch_spin)
+        self.pipelined_check = QCheckBox("流水线模式")
+        self.pipelined_check.setChecked(defaults.pipelined)
+        self.pipelined_check.setToolTip("需求每写入一批就开始查询和生成测试用例，三个阶段同时进行")
+        param_layout.addWidget(self.pipelined_check)
         layout.addLayout(param_layout)
 
+        # 续跑运行 ID
+        self.run_id_edit = QLineEdit()
+        self.run_id_edit.setPlaceholderText("留空开始新的运行；填入之前的运行 ID 可从最后完成的批次继续")
+        layout.addWidget(QLabel("续跑运行ID（可选）:"))
+        layout.addWidget(self.run_id_edit)
+
         # 日志窗口
         self.log_text = QTextEdit()
         self.log_text.setReadOnly(True)
@@ -155,6 +140,12 @@ class MainWindow(QWidget):
         self.run_btn = QPushButton("一键生成测试用例")
         self.run_btn.clicked.connect(self.run_all)
         button_layout.addWidget(self.run_btn)
+
+        # 停止按钮
+        self.stop_btn = QPushButton("停止")
+        self.stop_btn.setEnabled(False)
+        self.stop_btn.clicked.connect(self.stop_run)
+        button_layout.addWidget(self.stop_btn)
         
         # 添加测试工程师智能体按钮
         self.test_engineer_btn = QPushButton("🤖 测试工程师智能体")
@@ -201,6 +192,8 @@ class MainWindow(QWidget):
         doc_prompt = self.doc_prompt_edit.text().strip()
         sql_prompt = self.sql_prompt_edit.text().strip()
         case_prompt = self.case_prompt_edit.text().strip()
+        run_id = self.run_id_edit.text().strip() or None
+        pipelined = self.pipelined_check.isChecked()
 
         if not doc_path or not db_path or not excel_path:
             QMessageBox.warning(self, "参数错误", "请填写所有路径参数！")
@@ -210,10 +203,17 @@ class MainWindow(QWidget):
         self.log_text.clear()
         self.log_text.append("开始执行...")
 
-        self.worker = WorkerThread(doc_path, db_path, excel_path, total, batch_size, doc_prompt, sql_prompt, case_prompt)
+        self.worker = WorkerThread(doc_path, db_path, excel_path, total, batch_size, doc_prompt, sql_prompt, case_prompt, run_id=run_id, pipelined=pipelined)
         self.worker.log_signal.connect(self.log_text.append)
         self.worker.done_signal.connect(self.on_done)
+        self.worker.cancelled.connect(self.on_cancelled)
         self.worker.start()
+        self.stop_btn.setEnabled(True)
+
+    def stop_run(self):
+        """取消正在执行的流水线"""
+        if self.worker is not None and self.worker.cancel():
+            self.log_text.append("正在取消...")
         
     def open_test_engineer(self):
         """打开测试工程师智能体界面"""
@@ -224,10 +224,17 @@ class MainWindow(QWidget):
 
     def on_done(self, msg):
         self.run_btn.setEnabled(True)
+        self.stop_btn.setEnabled(False)
         QMessageBox.information(self, "完成", msg)
 
+    def on_cancelled(self):
+        self.run_btn.setEnabled(True)
+        self.stop_btn.setEnabled(False)
+        self.log_text.append("运行已取消。")
+
 if __name__ == '__main__':
     app = QApplication(sys.argv)
+    app.aboutToQuit.connect(shutdown_runtime)
     window = MainWindow()
     window.show()
     sys.exit(app.exec_()) 
\ No newline at end of file
@@ -0,0 +1,198 @@
+"""
+大模型 HTTP 连接池管理
+
+原来 llms.py 在导入时创建一个 httpx.AsyncClient（HTTP/1.1，最多保留 2 个空闲连接）：
+- 连接池绑定在第一次使用它的事件循环上，换一个事件循环后旧连接无法复用
+- 并发批次时大部分请求都要重新建立 TLS 连接
+
+LoopBoundTransport 为每个事件循环各建一个连接池（httpx.AsyncHTTPTransport），
+llms.py 中的 http_client 仍是同一个对象，实际请求交给当前事件循环对应的连接池：
+- 安装了 h2 时启用 HTTP/2，并发请求复用同一个连接（多路复用）；未安装时退回 HTTP/1.1
+- 连接池大小可通过环境变量配置（见 HTTP_POOL_CONFIG）
+- prewarm() 预先建立到 base_url 的连接（start_system 在启动画面期间调用）
+- LoopBoundTransport.stats() 返回各连接池的使用中 / 空闲连接数和建连耗时；
+  建连耗时和新建连接数同时记录到 metrics（http_connect_seconds / http_connections_opened_total）
+- LoopBoundTransport.limiter() 返回当前事件循环共享的并发信号量（大小为 max_connections），
+  同一事件循环中所有并发调用大模型的地方都经过它，总并发不会超过连接池上限
+"""
+
+import asyncio
+import importlib.util
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from metrics import registry
+
+# 连接池配置（可通过环境变量调整）
+HTTP_POOL_CONFIG = {
+    "max_connections": int(os.environ.get("LLM_MAX_CONNECTIONS", 10)),  # 每个事件循环的最大连接数
+    "max_keepalive_connections": int(os.environ.get("LLM_MAX_KEEPALIVE", 10)),  # 最多保留的空闲连接数
+    "keepalive_expiry": float(os.environ.get("LLM_KEEPALIVE_EXPIRY", 60)),  # 空闲连接保留时间（秒）
+    "http2": os.environ.get("LLM_HTTP2", "on") != "off",  # 是否启用 HTTP/2（需要安装 h2）
+    "timeout": float(os.environ.get("LLM_HTTP_TIMEOUT", 200)),  # 请求超时（秒）
+    "prewarm_connections": int(os.environ.get("LLM_PREWARM_CONNECTIONS", 2)),  # 预热时建立的连接数
+}
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+_h2_notice_shown = False
+
+
+class _PoolState:
+    """单个事件循环的连接池及其统计"""
+
+    def __init__(self, transport: httpx.AsyncHTTPTransport, http2: bool, max_connections: int):
+        self.transport = transport
+        self.http2 = http2
+        self.limiter = asyncio.Semaphore(max(1, max_connections))
+        self.created_at = time.time()
+        self.requests = 0
+        self.connects = 0
+        self.connect_seconds = 0.0
+        self.max_connect_seconds = 0.0
+
+
+class LoopBoundTransport(httpx.AsyncBaseTransport):
+    """按事件循环分配连接池的传输层"""
+
+    def __init__(self, config: Optional[Dict] = None):
+        self.config = dict(HTTP_POOL_CONFIG, **(config or {}))
+        self.http2 = bool(self.config["http2"]) and HTTP2_AVAILABLE
+        if self.config["http2"] and not HTTP2_AVAILABLE:
+            _show_h2_notice()
+        self._pools: Dict[asyncio.AbstractEventLoop, _PoolState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self) -> _PoolState:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._pools.get(loop)
+            if state is None:
+                # 已关闭的事件循环上的连接都已失效，直接丢弃
+                for closed in [item for item in self._pools if item.is_closed()]:
+                    del self._pools[closed]
+                transport = httpx.AsyncHTTPTransport(
+                    http2=self.http2,
+                    limits=httpx.Limits(
+                        max_connections=self.config["max_connections"],
+                        max_keepalive_connections=self.config["max_keepalive_connections"],
+                        keepalive_expiry=self.config["keepalive_expiry"],
+                    ),
+                )
+                state = self._pools[loop] = _PoolState(transport, self.http2, self.config["max_connections"])
+            return state
+
+    def limiter(self) -> asyncio.Semaphore:
+        """当前事件循环共享的并发信号量（须在该事件循环中调用）"""
+        return self._state().limiter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        state = self._state()
+        state.requests += 1
+        tls = request.url.scheme == "https"
+        request.extensions["trace"] = self._tracer(state, tls, request.extensions.get("trace"))
+        return await state.transport.handle_async_request(request)
+
+    @staticmethod
+    def _tracer(state: _PoolState, tls: bool, inner):
+        """记录新建连接的耗时（TCP 连接，https 时加上 TLS 握手）"""
+        started = None
+        complete = "connection.start_tls.complete" if tls else "connection.connect_tcp.complete"
+
+        async def trace(event_name: str, info: Dict):
+            nonlocal started
+            if event_name == "connection.connect_tcp.started":
+                started = time.perf_counter()
+            elif event_name == complete and started is not None:
+                elapsed = time.perf_counter() - started
+                started = None
+                state.connects += 1
+                state.connect_seconds += elapsed
+                state.max_connect_seconds = max(state.max_connect_seconds, elapsed)
+                registry.inc("http_connections_opened_total")
+                registry.observe("http_connect_seconds", elapsed)
+            if inner is not None:
+                await inner(event_name, info)
+
+        return trace
+
+    async def aclose(self):
+        """关闭当前事件循环的连接池"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._pools.pop(loop, None)
+        if state is not None:
+            await state.transport.aclose()
+
+    def stats(self) -> List[Dict]:
+        """各事件循环连接池的统计"""
+        with self._lock:
+            states = list(self._pools.values())
+        result = []
+        for state in states:
+            connections = list(state.transport._pool.connections)
+            idle = sum(1 for connection in connections if connection.is_idle())
+            result.append({
+                "http2": state.http2,
+                "connections": len(connections),
+                "in_use": len(connections) - idle,
+                "idle": idle,
+                "requests": state.requests,
+                "connects": state.connects,
+                "connect_seconds_avg": round(state.connect_seconds / state.connects, 4) if state.connects else 0.0,
+                "connect_seconds_max": round(state.max_connect_seconds, 4),
+            })
+        return result
+
+
+def _show_h2_notice():
+    """提示未安装 h2（每个进程只提示一次；输出到标准错误，不混入 cli 的 JSON 事件流）"""
+    global _h2_notice_shown
+    if not _h2_notice_shown:
+        _h2_notice_shown = True
+        print("未安装 h2，大模型请求使用 HTTP/1.1（pip install httpx[http2] 可启用 HTTP/2）", file=sys.stderr)
+
+
+async def prewarm(client: httpx.AsyncClient, base_url: str, connections: Optional[int] = None) -> int:
+    """
+    预先建立到 base_url 的连接（在之后发起请求的事件循环中调用）
+    Args:
+        client: 使用 LoopBoundTransport 的客户端
+        base_url: 大模型服务地址
+        connections: 建立的连接数（HTTP/2 时一个连接即可多路复用）
+    Returns:
+        成功建立（得到响应）的连接数
+    """
+    if connections is None:
+        connections = HTTP_POOL_CONFIG["prewarm_connections"]
+    transport = client._transport
+    if isinstance(transport, LoopBoundTransport) and transport.http2:
+        connections = 1
+
+    async def touch() -> bool:
+        try:
+            # 只为建立连接，响应状态码（401 / 404 等）无关紧要
+            await client.head(base_url, timeout=10)
+            return True
+        except httpx.HTTPError as e:
+            print(f"预热连接失败: {e}")
+            return False
+
+    results = await asyncio.gather(*(touch() for _ in range(max(0, connections))))
+    return sum(results)
+
+
+def format_pool_stats(stats: List[Dict]) -> str:
+    """生成适合打印或在 GUI 中展示的连接池摘要"""
+    if not stats:
+        return "🔌 HTTP 连接池: 尚未建立连接"
+    lines = ["🔌 HTTP 连接池:"]
+    for index, item in enumerate(stats, 1):
+        lines.append(f"   - 池 {index}（{'HTTP/2' if item['http2'] else 'HTTP/1.1'}）: 使用中 {item['in_use']}，空闲 {item['idle']}，"
+                     f"请求 {item['requests']} 次，新建连接 {item['connects']} 次，"
+                     f"建连耗时 平均 {item['connect_seconds_avg'] * 1000:.0f}ms / 最大 {item['connect_seconds_max'] * 1000:.0f}ms")
+    return "\n".join(lines)
@@ -0,0 +1,584 @@
+"""
+本地流水线任务服务（HTTP + JSON）
+
+多个测试人员共用一个部署提交生成任务，不必各自打开 GUI 逐个运行：
+- 任务保存在 SQLite 的 service_jobs 表中（db_migrations 第 6 版），服务重启后排队中的任务继续执行，
+  运行中被打断的任务重新排队，并用同一个运行 ID 从检查点续跑
+- 最多 workers 个任务同时运行，共用同一个事件循环中的 HTTP 连接池、数据库连接池和查询计划缓存
+- 排队的任务按项目轮流调度：每个项目依次取一个任务，某个项目一次提交很多任务也不会占满全部工作位
+- 每个任务使用自己的需求数据库和 Excel 文件（位于 data_dir/<project>/ 下，由服务分配）；
+  需求文档路径相对项目目录 data_dir/<project> 解析，不能指向项目目录之外
+
+接口（默认只监听 127.0.0.1）：
+    POST   /jobs                 提交任务，body 为 {"project": ..., "name": ..., "doc_path": ..., 以及 PipelineParams 的其他字段}
+    GET    /jobs                 任务列表（可选 ?project=&status=&limit=）
+    GET    /jobs/<job_id>        任务状态（运行中的任务附带阶段进度、已生成用例数和最近的日志）
+    GET    /jobs/<job_id>/result 任务结果（测试用例），任务未结束时返回 409
+    POST   /jobs/<job_id>/cancel 取消任务（DELETE /jobs/<job_id> 同义）
+    GET    /health               工作位、各项目排队数和 HTTP 连接池统计
+
+启动：
+    python job_service.py --port 8770 --workers 4
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import signal
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from checkpoint_store import new_run_id
+from db_pool import get_pool, close_all_pools
+from http_pool import format_pool_stats
+from llms import http_transport
+from metrics import registry
+from pipeline import PipelineParams, run_pipeline
+
+# 服务配置（可通过环境变量调整）
+SERVICE_CONFIG = {
+    "host": os.environ.get("JOB_SERVICE_HOST", "127.0.0.1"),
+    "port": int(os.environ.get("JOB_SERVICE_PORT", 8770)),  # 与 llm_standin 的默认端口 8765 错开
+    "workers": int(os.environ.get("JOB_SERVICE_WORKERS", 4)),  # 同时运行的任务数
+    "db_path": os.environ.get("JOB_SERVICE_DB", ".job_service.sqlite"),  # 任务表所在数据库
+    "data_dir": os.environ.get("JOB_SERVICE_DATA_DIR", "./service_data"),  # 默认的需求数据库和 Excel 输出目录
+    "max_queued_per_project": int(os.environ.get("JOB_SERVICE_MAX_QUEUED", 100)),  # 每个项目最多排队的任务数
+    "max_body_bytes": 1024 * 1024,
+    "log_lines": 50,  # 任务状态中保留的最近日志行数
+}
+
+PARAM_FIELDS = {item.name for item in fields(PipelineParams)}
+SERVICE_PATH_FIELDS = {"db_path", "excel_path"}  # 由服务为每个任务分配，客户端不能指定
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+PROJECT_PATTERN = re.compile(r"^[\w\-.]{1,64}$")
+# PipelineParams 字段的类型（按默认值推断），提交时校验，避免类型错误在工作协程深处才暴露
+PARAM_TYPES = {item.name: type(item.default) for item in fields(PipelineParams)}
+
+
+class HttpError(Exception):
+    """返回给客户端的错误（状态码 + 信息）"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def validate_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    校验并规范化提交的流水线参数：整数字段接受整数或整数形式的字符串且必须为正数，
+    布尔字段只接受 true / false，字符串字段只接受字符串
+    Args:
+        params: PipelineParams 字段子集
+    Returns:
+        类型规范化后的参数
+    Raises:
+        HttpError: 参数类型或取值不合法（400）
+    """
+    result = {}
+    for key, value in params.items():
+        expected = PARAM_TYPES[key]
+        if expected is bool:
+            if not isinstance(value, bool):
+                raise HttpError(400, f"{key} 必须是 true 或 false")
+        elif expected is int:
+            if isinstance(value, str) and re.fullmatch(r"\s*\d+\s*", value):
+                value = int(value)
+            elif isinstance(value, float) and value.is_integer():
+                value = int(value)
+            if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+                raise HttpError(400, f"{key} 必须是正整数")
+        elif not isinstance(value, expected):
+            raise HttpError(400, f"{key} 必须是字符串")
+        result[key] = value
+    return result
+
+
+@dataclass
+class Job:
+    """一个流水线任务"""
+    job_id: str
+    project: str
+    name: str
+    params: Dict[str, Any]
+    run_id: str
+    status: str = "queued"
+    error: Optional[str] = None
+    submitted_at: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
+@dataclass
+class JobProgress:
+    """运行中任务的进度（只保存在内存中）"""
+    stages: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    cases: int = 0
+    logs: Deque[str] = field(default_factory=lambda: deque(maxlen=SERVICE_CONFIG["log_lines"]))
+
+    def log(self, message: str):
+        self.logs.append(message)
+
+    def case(self, case: Dict):
+        self.cases += 1
+
+    def stage(self, stage: str, status: str, count: int):
+        self.stages[stage] = {"status": status, "count": count}
+
+
+class JobStore:
+    """service_jobs 表的读写"""
+
+    _COLUMNS = "job_id, project, name, params, run_id, status, error, submitted_at, started_at, finished_at"
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    @staticmethod
+    def _job(row) -> Job:
+        job_id, project, name, params, run_id, status, error, submitted_at, started_at, finished_at = row
+        return Job(job_id, project, name, json.loads(params), run_id, status, error, submitted_at, started_at, finished_at)
+
+    async def insert(self, job: Job):
+        async with get_pool(self.db_path).writer() as conn:
+            await conn.execute(
+                f"INSERT INTO service_jobs ({self._COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.job_id, job.project, job.name, json.dumps(job.params, ensure_ascii=False), job.run_id,
+                 job.status, job.error, job.submitted_at, job.started_at, job.finished_at))
+            await conn.commit()
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        async with get_pool(self.db_path).reader() as conn:
+            async with conn.execute(f"SELECT {self._COLUMNS} FROM service_jobs WHERE job_id = ?", (job_id,)) as cursor:
+                row = await cursor.fetchone()
+        return self._job(row) if row else None
+
+    async def result(self, job_id: str) -> Optional[Any]:
+        async with get_pool(self.db_path).reader() as conn:
+            async with conn.execute("SELECT result FROM service_jobs WHERE job_id = ?", (job_id,)) as cursor:
+                row = await cursor.fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    async def list(self, project: Optional[str] = None, status: Optional[str] = None, limit: int = 50) -> List[Job]:
+        """按提交时间倒序列出任务"""
+        conditions, args = [], []
+        if project:
+            conditions.append("project = ?")
+            args.append(project)
+        if status:
+            conditions.append("status = ?")
+            args.append(status)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        async with get_pool(self.db_path).reader() as conn:
+            async with conn.execute(f"SELECT {self._COLUMNS} FROM service_jobs {where} ORDER BY submitted_at DESC LIMIT ?",
+                                    (*args, limit)) as cursor:
+                rows = await cursor.fetchall()
+        return [self._job(row) for row in rows]
+
+    async def pending(self) -> List[Job]:
+        """
+        服务启动时需要继续执行的任务：排队中的任务，以及上次运行中被打断的任务（改回排队，按同一运行 ID 续跑）
+        Returns:
+            按提交时间排序的任务列表
+        """
+        async with get_pool(self.db_path).writer() as conn:
+            await conn.execute("UPDATE service_jobs SET status = 'queued', started_at = NULL WHERE status = 'running'")
+            await conn.commit()
+            async with conn.execute(f"SELECT {self._COLUMNS} FROM service_jobs WHERE status = 'queued' ORDER BY submitted_at") as cursor:
+                rows = await cursor.fetchall()
+        return [self._job(row) for row in rows]
+
+    async def update(self, job: Job, result: Any = None):
+        """保存任务状态（result 不为空时一并保存结果）"""
+        async with get_pool(self.db_path).writer() as conn:
+            await conn.execute(
+                "UPDATE service_jobs SET status = ?, error = ?, started_at = ?, finished_at = ?, "
+                "result = COALESCE(?, result) WHERE job_id = ?",
+                (job.status, job.error, job.started_at, job.finished_at,
+                 json.dumps(result, ensure_ascii=False, default=str) if result is not None else None, job.job_id))
+            await conn.commit()
+
+
+class FairQueue:
+    """按项目轮流出队的任务队列：每轮每个项目取一个任务，项目内先提交先运行"""
+
+    def __init__(self):
+        self._projects: "OrderedDict[str, Deque[Job]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return sum(len(jobs) for jobs in self._projects.values())
+
+    def push(self, job: Job):
+        self._projects.setdefault(job.project, deque()).append(job)
+
+    def pop(self) -> Optional[Job]:
+        """取出下一个任务（队列为空时返回 None）"""
+        if not self._projects:
+            return None
+        # 取过任务的项目排到最后，其他项目优先
+        project, jobs = self._projects.popitem(last=False)
+        job = jobs.popleft()
+        if jobs:
+            self._projects[project] = jobs
+        return job
+
+    def remove(self, job_id: str) -> Optional[Job]:
+        for project, jobs in list(self._projects.items()):
+            for job in jobs:
+                if job.job_id == job_id:
+                    jobs.remove(job)
+                    if not jobs:
+                        del self._projects[project]
+                    return job
+        return None
+
+    def position(self, job_id: str) -> Optional[int]:
+        """按轮流顺序估计的排队位置（从 1 开始）"""
+        queues = [list(jobs) for jobs in self._projects.values()]
+        rounds = max((len(jobs) for jobs in queues), default=0)
+        order = [jobs[n] for n in range(rounds) for jobs in queues if n < len(jobs)]
+        for index, job in enumerate(order, 1):
+            if job.job_id == job_id:
+                return index
+        return None
+
+    def counts(self) -> Dict[str, int]:
+        return {project: len(jobs) for project, jobs in self._projects.items()}
+
+
+class JobService:
+    """任务调度：排队、按工作位数量运行、取消"""
+
+    def __init__(self, db_path: str = None, workers: int = None, data_dir: str = None):
+        self.store = JobStore(db_path or SERVICE_CONFIG["db_path"])
+        self.workers = max(1, workers or SERVICE_CONFIG["workers"])
+        self.data_dir = data_dir or SERVICE_CONFIG["data_dir"]
+        self.queue = FairQueue()
+        self._wakeup = asyncio.Condition()
+        self._running: Dict[str, asyncio.Task] = {}
+        self._running_jobs: Dict[str, Job] = {}
+        self._progress: Dict[str, JobProgress] = {}
+        self._cancel_requested: Set[str] = set()
+        self._worker_tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+    async def start(self):
+        """恢复未完成的任务并启动工作协程"""
+        registry.begin_run("任务服务")
+        pending = await self.store.pending()
+        for job in pending:
+            self.queue.push(job)
+        if pending:
+            print(f"恢复 {len(pending)} 个未完成的任务")
+        self._worker_tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """停止服务：运行中的任务被打断，下次启动时按同一运行 ID 续跑"""
+        self._stopping = True
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def project_dir(self, project: str) -> str:
+        return os.path.realpath(os.path.join(self.data_dir, project))
+
+    def resolve_document(self, project: str, doc_path: Any) -> str:
+        """
+        解析需求文档路径：相对项目目录解析，结果必须是项目目录内已存在的文件
+        Args:
+            project: 项目名
+            doc_path: 客户端提交的路径
+        Returns:
+            文档的绝对路径
+        """
+        base = self.project_dir(project)
+        if not isinstance(doc_path, str) or not doc_path:
+            raise HttpError(400, f"doc_path 必填（相对项目目录 {base} 的路径）")
+        path = os.path.realpath(os.path.join(base, doc_path))
+        if os.path.commonpath([base, path]) != base:
+            raise HttpError(400, f"doc_path 必须位于项目目录 {base} 内")
+        if not os.path.isfile(path):
+            raise HttpError(400, f"需求文档不存在: {doc_path}")
+        return path
+
+    async def submit(self, payload: Dict[str, Any]) -> Job:
+        """
+        提交任务
+        Args:
+            payload: {"project", "name"（可选）, PipelineParams 的字段}
+        Returns:
+            排队中的任务
+        """
+        project = str(payload.get("project") or "default")
+        if not PROJECT_PATTERN.match(project):
+            raise HttpError(400, "project 只能包含字母、数字、下划线、短横线和点，最长 64 个字符")
+        unknown = sorted(set(payload) - PARAM_FIELDS - {"project", "name"})
+        if unknown:
+            raise HttpError(400, f"未知字段: {unknown}")
+        reserved = sorted(SERVICE_PATH_FIELDS & set(payload))
+        if reserved:
+            raise HttpError(400, f"{reserved} 由服务分配，不能指定")
+        if self.queue.counts().get(project, 0) >= SERVICE_CONFIG["max_queued_per_project"]:
+            raise HttpError(429, f"项目 {project} 排队的任务已达上限 {SERVICE_CONFIG['max_queued_per_project']}")
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = os.path.join(self.project_dir(project), "jobs")
+        params = validate_params({key: value for key, value in payload.items() if key in PARAM_FIELDS})
+        params.update(
+            doc_path=self.resolve_document(project, payload.get("doc_path")),
+            # 每个任务一个数据库，任务之间的需求互不影响
+            db_path=os.path.join(job_dir, f"{job_id}.sqlite"),
+            excel_path=os.path.join(job_dir, f"{job_id}.xlsx"),
+        )
+        try:
+            params = asdict(PipelineParams(**params))
+        except TypeError as e:
+            raise HttpError(400, str(e))
+        os.makedirs(job_dir, exist_ok=True)
+        job = Job(job_id, project, str(payload.get("name") or job_id), params, new_run_id(), submitted_at=time.time())
+        await self.store.insert(job)
+        async with self._wakeup:
+            self.queue.push(job)
+            self._wakeup.notify()
+        return job
+
+    async def cancel(self, job_id: str) -> Job:
+        """取消排队中或运行中的任务；已结束的任务原样返回"""
+        async with self._wakeup:
+            job = self.queue.remove(job_id)
+        if job is not None:
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            await self.store.update(job)
+            return job
+        task = self._running.get(job_id)
+        if task is not None:
+            self._cancel_requested.add(job_id)
+            task.cancel()
+            # 等任务把检查点和状态写完
+            await asyncio.gather(task, return_exceptions=True)
+        job = await self.store.get(job_id)
+        if job is None:
+            raise HttpError(404, f"任务 {job_id} 不存在")
+        return job
+
+    async def status(self, job_id: str) -> Dict[str, Any]:
+        job = self._running_jobs.get(job_id) or await self.store.get(job_id)
+        if job is None:
+            raise HttpError(404, f"任务 {job_id} 不存在")
+        info = self.describe(job)
+        progress = self._progress.get(job_id)
+        if progress is not None:
+            info["progress"] = {"stages": progress.stages, "cases": progress.cases, "logs": list(progress.logs)}
+        return info
+
+    def describe(self, job: Job) -> Dict[str, Any]:
+        info = asdict(job)
+        if job.status == "queued":
+            info["position"] = self.queue.position(job.job_id)
+        return info
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "running": len(self._running),
+            "queued": len(self.queue),
+            "queued_by_project": self.queue.counts(),
+            "http_pools": http_transport.stats(),
+        }
+
+    async def _next_job(self) -> Job:
+        async with self._wakeup:
+            while True:
+                job = self.queue.pop()
+                if job is not None:
+                    return job
+                await self._wakeup.wait()
+
+    async def _worker(self):
+        while True:
+            job = await self._next_job()
+            task = asyncio.ensure_future(self._run(job))
+            self._running[job.job_id] = task
+            self._running_jobs[job.job_id] = job
+            try:
+                await task
+            except asyncio.CancelledError:
+                # 单个任务被取消时工作协程继续取下一个任务；服务停止时退出
+                if self._stopping:
+                    raise
+            except Exception as e:
+                print(f"任务 {job.job_id} 出错: {e}")
+            finally:
+                self._running.pop(job.job_id, None)
+                self._running_jobs.pop(job.job_id, None)
+                self._cancel_requested.discard(job.job_id)
+
+    async def _run(self, job: Job):
+        progress = self._progress[job.job_id] = JobProgress()
+        job.status = "running"
+        job.started_at = time.time()
+        await self.store.update(job)
+        print(f"开始任务 {job.job_id}（项目 {job.project}，{job.name}）")
+        try:
+            result = await run_pipeline(PipelineParams(**job.params), job.run_id, log=progress.log,
+                                        on_case=progress.case, on_stage=progress.stage, begin_metrics_run=False)
+        except asyncio.CancelledError:
+            if job.job_id in self._cancel_requested:
+                job.status, job.finished_at = "cancelled", time.time()
+            else:
+                # 服务停止：改回排队，下次启动时续跑
+                job.status, job.started_at = "queued", None
+            await self.store.update(job)
+            raise
+        except Exception as e:
+            job.status, job.error, job.finished_at = "failed", str(e), time.time()
+            await self.store.update(job)
+            print(f"任务 {job.job_id} 失败: {e}")
+            return
+        finally:
+            self._progress.pop(job.job_id, None)
+        job.status, job.finished_at = "done", time.time()
+        await self.store.update(job, result={
+            "run_id": result.run_id,
+            "resumed": result.resumed,
+            "requirements": len(result.requirement_rows),
+            "queried": len(result.requirements_list),
+            "excel_path": job.params.get("excel_path"),
+            "test_cases": result.test_cases,
+        })
+        print(f"任务 {job.job_id} 完成，生成 {len(result.test_cases)} 条测试用例")
+
+
+class JobServer:
+    """基于 asyncio.start_server 的最小 HTTP/1.1 服务（每个请求一个连接，JSON 收发）"""
+
+    REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               409: "Conflict", 413: "Payload Too Large", 429: "Too Many Requests", 500: "Internal Server Error"}
+
+    def __init__(self, service: JobService):
+        self.service = service
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                method, path, query, body = await asyncio.wait_for(self._read_request(reader), timeout=30)
+                status, payload = await self.route(method, path, query, body)
+            except HttpError as e:
+                status, payload = e.status, {"error": e.message}
+            except asyncio.TimeoutError:
+                status, payload = 400, {"error": "请求读取超时"}
+            except Exception as e:
+                status, payload = 500, {"error": str(e)}
+            data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+            writer.write(f"HTTP/1.1 {status} {self.REASONS.get(status, '')}\r\n"
+                         f"Content-Type: application/json; charset=utf-8\r\n"
+                         f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1") + data)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, List[str]], Any]:
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        parts = request_line.split(" ")
+        if len(parts) != 3:
+            raise HttpError(400, "无效的请求行")
+        method, target = parts[0].upper(), parts[1]
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if length > SERVICE_CONFIG["max_body_bytes"]:
+            raise HttpError(413, "请求体过大")
+        body = None
+        if length:
+            try:
+                body = json.loads(await reader.readexactly(length))
+            except ValueError:
+                raise HttpError(400, "请求体不是有效的 JSON")
+        url = urlsplit(target)
+        return method, url.path.rstrip("/") or "/", parse_qs(url.query), body
+
+    async def route(self, method: str, path: str, query: Dict[str, List[str]], body: Any) -> Tuple[int, Any]:
+        parts = [part for part in path.split("/") if part]
+        service = self.service
+        if parts == ["health"] and method == "GET":
+            return 200, service.health()
+        if parts == ["jobs"]:
+            if method == "POST":
+                if not isinstance(body, dict):
+                    raise HttpError(400, "请求体应为 JSON 对象")
+                return 201, service.describe(await service.submit(body))
+            if method == "GET":
+                project, status, limit = (query.get(key, [None])[0] for key in ("project", "status", "limit"))
+                try:
+                    limit = int(limit or 50)
+                except ValueError:
+                    raise HttpError(400, "limit 应为整数")
+                jobs = await service.store.list(project, status, limit)
+                return 200, {"jobs": [service.describe(job) for job in jobs]}
+            raise HttpError(405, f"不支持 {method} {path}")
+        if len(parts) >= 2 and parts[0] == "jobs":
+            job_id = parts[1]
+            if len(parts) == 2 and method == "GET":
+                return 200, await service.status(job_id)
+            if (len(parts) == 2 and method == "DELETE") or (parts[2:] == ["cancel"] and method == "POST"):
+                return 200, service.describe(await service.cancel(job_id))
+            if parts[2:] == ["result"] and method == "GET":
+                info = await service.status(job_id)
+                if info["status"] not in FINISHED_STATUSES:
+                    raise HttpError(409, f"任务尚未结束（{info['status']}）")
+                return 200, {**info, "result": await service.store.result(job_id)}
+        raise HttpError(404, f"未找到 {method} {path}")
+
+
+async def serve(host: str, port: int, service: JobService):
+    """启动任务服务，直到被取消"""
+    await service.start()
+    server = await asyncio.start_server(JobServer(service).handle, host, port)
+    print(f"任务服务已启动: http://{host}:{port}（工作位 {service.workers}，任务表 {service.store.db_path}）")
+    # 收到 SIGINT / SIGTERM 时停止服务（Windows 不支持，只能依赖 KeyboardInterrupt）
+    loop, main_task = asyncio.get_running_loop(), asyncio.current_task()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, main_task.cancel)
+        except (NotImplementedError, RuntimeError):
+            pass
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+        print(format_pool_stats(http_transport.stats()))
+        await close_all_pools()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="测试用例生成任务服务")
+    parser.add_argument("--host", default=SERVICE_CONFIG["host"], help="监听地址")
+    parser.add_argument("--port", type=int, default=SERVICE_CONFIG["port"], help="监听端口")
+    parser.add_argument("--workers", type=int, default=SERVICE_CONFIG["workers"], help="同时运行的任务数")
+    parser.add_argument("--db", default=SERVICE_CONFIG["db_path"], help="任务表所在数据库")
+    parser.add_argument("--data-dir", default=SERVICE_CONFIG["data_dir"], help="未指定路径的任务的数据目录")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, JobService(args.db, args.workers, args.data_dir)))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        print("任务服务已停止，运行中的任务将在下次启动时续跑")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,255 @@
+"""
+JSON 对象数组的增量解析
+
+模型流式输出测试用例时，文本是一段一段到达的。JSONObjectStream 在每个顶层对象的
+右大括号到达时立即解析并返回该对象，无需等待整个数组结束。
+
+对模型输出的常见问题做了容错，且不做按行的字符串替换（字符串值中的 URL、// 等保持原样）：
+- 对象外的任何文本（说明文字、markdown 代码块标记、数组括号和逗号）直接跳过
+- 字符串之外的 // 行注释和 /* */ 块注释会被去掉
+- 对象末尾多余的逗号
+输出被截断时，report() 给出最后一个完整对象结束的位置和未完成的文本，
+调用方只需要重新生成缺少的部分。
+
+一次性解析完整文本时使用 parse_json_objects()。完整的对象直接交给 C 实现的
+json 解码器（raw_decode），只有带注释或不完整的对象才逐字符扫描，多 MB 的输出也只需几十毫秒。
+"""
+
+import json
+import re
+from dataclasses import dataclass
+from typing import List, Tuple
+
+# 对象内需关心大括号、字符串起始引号和注释；字符串内只关心引号和转义
+_OBJECT_TOKEN = re.compile(r'[{}"/]')
+_STRING_TOKEN = re.compile(r'["\\]')
+# 对象外关心对象起始、数组括号和注释
+_OUTSIDE_TOKEN = re.compile(r'[{\[\]/]')
+_TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+
+_decoder = json.JSONDecoder()
+
+
+@dataclass
+class ParseReport:
+    """一次解析的结果概要"""
+    objects: int      # 解析出的完整对象数量
+    failed: int       # 大括号闭合但解析失败的对象数量
+    truncated: bool   # 输出是否在对象或数组中间结束
+    offset: int       # 最后一个完整对象结束的位置（字符偏移），截断时从这里开始的内容需要重新生成
+    pending: str      # 截断处未完成的对象文本
+
+
+class JSONObjectStream:
+    """增量解析 JSON 对象数组，每收到一个完整的顶层对象就返回它"""
+
+    def __init__(self):
+        self._pending = ""      # 当前未完成对象的文本（已去掉注释）
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._comment = None    # 正在跳过的注释："line" / "block"
+        self._slash = False     # 上一段文本以 "/" 结尾，需要看下一段的首字符
+        self._star = False      # 上一段文本在块注释中以 "*" 结尾
+        self._array_depth = 0
+        self._seen_array = False
+        self._fast = True       # 是否尝试快速路径
+        self._fast_failed = False  # 当前对象的快速路径失败（不是因为文本不完整）
+        self._irregular = False    # 当前对象含注释等非标准内容
+        self._chunk_start = 0      # 当前对象开始时所在文本段的起始位置
+        self._base = 0          # 当前文本段在整个输出中的起始位置
+        self.offset = 0         # 最后一个完整对象结束的位置
+        self.parsed = 0         # 成功解析的对象数量
+        self.failed = 0         # 大括号闭合但解析失败的对象数量
+
+    def feed(self, chunk: str) -> List[dict]:
+        """
+        输入一段新到达的文本
+        Args:
+            chunk: 增量文本
+        Returns:
+            本次新完成的对象列表
+        """
+        objects = []
+        pos = 0
+        length = len(chunk)
+        if self._slash and length:
+            self._slash = False
+            if chunk[0] in "/*":
+                self._comment = "line" if chunk[0] == "/" else "block"
+                pos = 1
+            elif self._depth:
+                self._pending += "/"
+        while pos < length:
+            if self._comment:
+                pos = self._skip_comment(chunk, pos)
+            elif self._depth == 0:
+                pos = self._scan_outside(chunk, pos, objects)
+            else:
+                pos = self._scan(chunk, pos, objects)
+        self._base += length
+        return objects
+
+    def report(self) -> ParseReport:
+        """到目前为止的解析概要（输出结束后调用可判断是否被截断）"""
+        truncated = self._depth > 0 or (self._seen_array and self._array_depth > 0)
+        return ParseReport(objects=self.parsed, failed=self.failed, truncated=truncated,
+                           offset=self.offset, pending=self._pending if self._depth else "")
+
+    def _skip_comment(self, chunk: str, pos: int) -> int:
+        """跳过注释，返回注释结束后的位置（注释未结束时返回文本末尾）"""
+        if self._comment == "line":
+            end = chunk.find("\n", pos)
+            if end < 0:
+                return len(chunk)
+            self._comment = None
+            return end + 1
+        if self._star and chunk[pos] == "/":
+            self._star = False
+            self._comment = None
+            return pos + 1
+        self._star = False
+        end = chunk.find("*/", pos)
+        if end < 0:
+            self._star = chunk.endswith("*")
+            return len(chunk)
+        self._comment = None
+        return end + 2
+
+    def _start_comment(self, chunk: str, slash: int) -> int:
+        """处理字符串外的 "/"：是注释开头时进入注释，返回继续扫描的位置"""
+        following = slash + 1
+        if following >= len(chunk):
+            self._slash = True
+            return following
+        if chunk[following] == "/":
+            self._comment = "line"
+        elif chunk[following] == "*":
+            self._comment = "block"
+        else:
+            return following
+        return following + 1
+
+    def _scan_outside(self, chunk: str, pos: int, objects: List[dict]) -> int:
+        """在对象外向前扫描，直到遇到对象开头"""
+        match = _OUTSIDE_TOKEN.search(chunk, pos)
+        if match is None:
+            return len(chunk)
+        start = match.start()
+        token = match.group()
+        if token == "[":
+            self._array_depth += 1
+            self._seen_array = True
+            return start + 1
+        if token == "]":
+            self._array_depth = max(0, self._array_depth - 1)
+            return start + 1
+        if token == "/":
+            return self._start_comment(chunk, start)
+        # 快速路径：整个对象都在本段文本中且是合法 JSON 时，直接交给 C 解码器。
+        # 解码失败时异常会从文本开头统计行号（与位置成正比），所以带注释的对象出现后
+        # 暂停快速路径，直到又扫描到一个标准对象
+        if not self._fast:
+            return self._begin_object(start)
+        try:
+            value, end = _decoder.raw_decode(chunk, start)
+        except ValueError:
+            self._fast_failed = True
+            return self._begin_object(start)
+        if isinstance(value, dict):
+            self.parsed += 1
+            self.offset = self._base + end
+            objects.append(value)
+        return end
+
+    def _begin_object(self, start: int) -> int:
+        """从对象开头进入逐字符扫描"""
+        self._depth = 1
+        self._in_string = False
+        self._irregular = False
+        self._pending = "{"
+        self._chunk_start = self._base
+        return start + 1
+
+    def _scan(self, chunk: str, pos: int, objects: List[dict]) -> int:
+        """在对象内部向前扫描，直到对象闭合、遇到注释或本段文本结束"""
+        segment_start = pos
+        length = len(chunk)
+        while pos < length:
+            if self._escape:
+                self._escape = False
+                pos += 1
+                continue
+            if self._in_string:
+                match = _STRING_TOKEN.search(chunk, pos)
+                if match is None:
+                    pos = length
+                    break
+                pos = match.end()
+                if match.group() == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+                continue
+            match = _OBJECT_TOKEN.search(chunk, pos)
+            if match is None:
+                pos = length
+                break
+            pos = match.end()
+            token = match.group()
+            if token == '"':
+                self._in_string = True
+            elif token == "/":
+                resume = self._start_comment(chunk, match.start())
+                if self._comment or self._slash:
+                    self._irregular = True
+                    self._pending += chunk[segment_start:match.start()]
+                    return resume
+            elif token == "{":
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._pending += chunk[segment_start:pos]
+                    self._emit(objects, self._base + pos)
+                    return pos
+        self._pending += chunk[segment_start:pos]
+        return pos
+
+    def _emit(self, objects: List[dict], end: int):
+        text, self._pending = self._pending, ""
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            self._irregular = True
+            try:
+                # 对象或数组末尾多余的逗号
+                value = json.loads(_TRAILING_COMMA.sub(r"\1", text))
+            except json.JSONDecodeError:
+                self.failed += 1
+                return
+        finally:
+            # 对象在快速路径失败的同一段文本内闭合，说明失败不是因为文本不完整：暂停快速路径；
+            # 扫描到标准对象后恢复
+            if self._fast_failed and self._chunk_start == self._base:
+                self._fast = False
+            elif not self._irregular:
+                self._fast = True
+            self._fast_failed = False
+        if isinstance(value, dict):
+            self.parsed += 1
+            self.offset = end
+            objects.append(value)
+
+
+def parse_json_objects(text: str) -> Tuple[List[dict], ParseReport]:
+    """
+    一次性解析完整的模型输出
+    Args:
+        text: 模型输出文本
+    Returns:
+        (完整对象列表, 解析概要)
+    """
+    stream = JSONObjectStream()
+    objects = stream.feed(text)
+    return objects, stream.report()
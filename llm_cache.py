@@ -0,0 +1,269 @@
+"""
+大模型响应缓存
+
+以内容寻址的方式缓存模型响应：缓存键由模型名称、渲染后的系统提示词、消息历史、
+结果结构（result tools / function tools）以及模型设置共同计算得出。
+文档、提示词和依赖都不变时，重复运行流水线会直接命中缓存，不再调用大模型。
+
+使用说明：
+- 缓存存放在本地 SQLite 文件中，按 TTL 过期，并按最近访问时间（LRU）淘汰超出容量的条目
+- 通过 mode 切换行为：on（读写缓存）、off（完全绕过）、refresh（忽略旧值并写入新值）
+- 通过 cache_mode() 上下文管理器可临时覆盖某一段代码的缓存模式
+- 流式请求（request_stream）不做缓存，直接透传给底层模型
+- 响应未通过校验时（下一次请求带有 RetryPromptPart），删除该响应的缓存，避免重复运行时再次命中无效响应
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter, ModelRequest, ModelResponse, RetryPromptPart
+from pydantic_ai.models import Model, ModelRequestParameters, StreamedResponse
+from pydantic_ai.settings import ModelSettings
+from pydantic_ai.usage import Usage
+
+CACHE_MODES = ("on", "off", "refresh")
+
+# 当前上下文的缓存模式覆盖（None 表示使用 CachedModel 自身的 mode）
+_mode_override: ContextVar[Optional[str]] = ContextVar("llm_cache_mode_override", default=None)
+
+
+@contextmanager
+def cache_mode(mode: str):
+    """
+    临时覆盖当前上下文（包括其中创建的异步任务）的缓存模式
+    Args:
+        mode: on / off / refresh
+    """
+    if mode not in CACHE_MODES:
+        raise ValueError(f"未知的缓存模式: {mode}，可选值: {CACHE_MODES}")
+    token = _mode_override.set(mode)
+    try:
+        yield
+    finally:
+        _mode_override.reset(token)
+
+
+def _strip_volatile(value):
+    """递归去掉消息中的时间戳等每次运行都会变化的字段"""
+    if isinstance(value, dict):
+        return {k: _strip_volatile(v) for k, v in value.items() if k != "timestamp"}
+    if isinstance(value, list):
+        return [_strip_volatile(v) for v in value]
+    return value
+
+
+def make_cache_key(
+    model_name: str,
+    messages: list,
+    model_settings: Optional[ModelSettings],
+    model_request_parameters: ModelRequestParameters,
+) -> str:
+    """
+    计算请求的内容寻址缓存键
+    Args:
+        model_name: 模型名称
+        messages: 消息历史（包含渲染后的系统提示词）
+        model_settings: 模型设置
+        model_request_parameters: 工具与结果结构定义
+    Returns:
+        sha256 十六进制字符串
+    """
+    payload = {
+        "model": model_name,
+        "messages": _strip_volatile(ModelMessagesTypeAdapter.dump_python(messages, mode="json")),
+        "settings": dict(model_settings or {}),
+        "params": asdict(model_request_parameters),
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """基于 SQLite 的响应缓存存储，支持 TTL 过期与 LRU 容量淘汰"""
+
+    def __init__(self, path: str = ".llm_cache.sqlite", ttl_seconds: float = 7 * 24 * 3600,
+                 max_bytes: int = 200 * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model_name TEXT NOT NULL,
+                response TEXT NOT NULL,
+                usage TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+
+    def get(self, key: str) -> Optional[Tuple[ModelResponse, Usage]]:
+        """读取缓存，未命中或已过期时返回 None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, usage, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            response_json, usage_json, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        response = ModelMessagesTypeAdapter.validate_json(response_json)[0]
+        return response, Usage(**json.loads(usage_json))
+
+    def put(self, key: str, model_name: str, response: ModelResponse, usage: Usage):
+        """写入缓存，并在超出容量时按 LRU 淘汰"""
+        response_json = ModelMessagesTypeAdapter.dump_json([response]).decode("utf-8")
+        usage_json = json.dumps(asdict(usage))
+        size = len(response_json) + len(usage_json)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model_name, response, usage, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model_name, response_json, usage_json, size, now, now),
+            )
+            self.writes += 1
+            self._evict(now)
+
+    def delete(self, key: str) -> bool:
+        """删除一条缓存，返回是否存在"""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+        return cursor.rowcount > 0
+
+    def _evict(self, now: float):
+        """删除过期条目，然后按最近访问时间淘汰，直到总大小不超过 max_bytes"""
+        if self.ttl_seconds:
+            cursor = self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            self.evictions += max(cursor.rowcount, 0)
+        if not self.max_bytes:
+            return
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> Dict[str, float]:
+        """返回命中/未命中等计数"""
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class CachedModel(Model):
+    """包装任意 pydantic-ai 模型，为非流式请求提供响应缓存"""
+
+    def __init__(self, wrapped: Model, cache: LLMResponseCache, mode: str = "on"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"未知的缓存模式: {mode}，可选值: {CACHE_MODES}")
+        self.wrapped = wrapped
+        self.cache = cache
+        self.mode = mode
+
+    @property
+    def model_name(self) -> str:
+        return self.wrapped.model_name
+
+    @property
+    def system(self) -> Optional[str]:
+        return self.wrapped.system
+
+    def name(self) -> str:
+        return self.wrapped.name()
+
+    async def request(
+        self,
+        messages: list[ModelMessage],
+        model_settings: Optional[ModelSettings],
+        model_request_parameters: ModelRequestParameters,
+    ) -> Tuple[ModelResponse, Usage]:
+        mode = _mode_override.get() or self.mode
+        if mode == "off":
+            return await self.wrapped.request(messages, model_settings, model_request_parameters)
+
+        self._drop_rejected(messages, model_settings, model_request_parameters)
+        key = make_cache_key(self.model_name, messages, model_settings, model_request_parameters)
+        if mode == "on":
+            cached = self.cache.get(key)
+            if cached is not None:
+                # 命中缓存时没有实际消耗 token，用量记为 0
+                return cached[0], Usage()
+
+        response, usage = await self.wrapped.request(messages, model_settings, model_request_parameters)
+        self.cache.put(key, self.model_name, response, usage)
+        return response, usage
+
+    def _drop_rejected(
+        self,
+        messages: list[ModelMessage],
+        model_settings: Optional[ModelSettings],
+        model_request_parameters: ModelRequestParameters,
+    ):
+        """
+        本次请求是对上一个响应的重试（结果校验失败或工具要求重试）时，删除上一个响应的缓存
+        上一个响应由 messages[:-2] 请求得到，messages[-2] 是该响应，messages[-1] 是重试提示
+        """
+        last = messages[-1] if messages else None
+        if len(messages) < 3 or not isinstance(last, ModelRequest):
+            return
+        if not any(isinstance(part, RetryPromptPart) for part in last.parts):
+            return
+        rejected = make_cache_key(self.model_name, messages[:-2], model_settings, model_request_parameters)
+        if self.cache.delete(rejected):
+            print("上一个响应未通过校验，已从缓存中删除")
+
+    @asynccontextmanager
+    async def request_stream(
+        self,
+        messages: list[ModelMessage],
+        model_settings: Optional[ModelSettings],
+        model_request_parameters: ModelRequestParameters,
+    ) -> AsyncIterator[StreamedResponse]:
+        async with self.wrapped.request_stream(messages, model_settings, model_request_parameters) as response:
+            yield response
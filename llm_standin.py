@@ -0,0 +1,498 @@
+"""
+OpenAI 兼容的本地替身服务（录制 / 回放）
+
+流水线默认直连 DashScope，离线或压测时无法运行。这个模块提供一个最小的
+OpenAI 兼容 HTTP 服务，只实现 POST .../chat/completions（含 SSE 流式输出）：
+- record：把请求转发给真实服务，原样返回，同时把请求和响应写入录像文件（JSON Lines）
+- replay：按请求内容从录像文件中取响应；录像中没有时按脚本规则生成响应；
+  可配置首包延迟、输出速度（token/秒）以及 429 / 500 错误注入比例，用于确定性地
+  压测 Testcase_agent 的分批、并发与重试逻辑
+
+在 llms.py 中设置环境变量 LLM_STANDIN=record 或 replay 即可在进程内启动替身服务
+并让模型改连本地地址；也可以单独运行：
+    python llm_standin.py --mode replay --port 8765 --latency 0.5 --token-rate 50
+
+脚本规则文件（LLM_STANDIN_SCRIPT）为 JSON 列表，按顺序匹配最后一条用户消息：
+    [{"match": "测试用例", "tool_call": {"arguments": {...}}},
+     {"match": ".*", "content": "好的"}]
+tool_call 未指定 name 时使用请求中的第一个工具（即 pydantic-ai 的结果工具）。
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from rate_limiter import estimate_text_tokens
+
+STANDIN_MODES = ("record", "replay")
+
+# 计算录像键时忽略的字段（流式与非流式请求共用同一条录像）
+_VOLATILE_FIELDS = ("stream", "stream_options", "user", "timeout")
+# 系统提示词中嵌入的当前日期（如 DocAGTest 的“当前的时间为”），计算录像键时替换掉，录像隔天仍可回放
+_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+_STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests",
+                500: "Internal Server Error", 502: "Bad Gateway"}
+
+
+@dataclass
+class StandInConfig:
+    """替身服务配置"""
+    mode: str = "replay"
+    cassette_path: str = ".llm_cassettes.jsonl"
+    script_path: Optional[str] = None
+    upstream_url: str = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+    host: str = "127.0.0.1"
+    port: int = 0
+    latency: float = 0.0          # 首包延迟（秒）
+    token_rate: float = 0.0       # 输出速度（token/秒），0 表示不限速
+    error_429_rate: float = 0.0   # 注入 429 的比例
+    error_500_rate: float = 0.0   # 注入 500 的比例
+    retry_after: float = 1.0      # 注入 429 时返回的 Retry-After（秒）
+    seed: int = 0                 # 错误注入的随机种子，保证可复现
+
+
+def config_from_env(mode: str, upstream_url: str) -> StandInConfig:
+    """
+    从环境变量读取替身服务配置
+    Args:
+        mode: record / replay
+        upstream_url: 录制模式下转发的真实服务地址
+    """
+    return StandInConfig(
+        mode=mode,
+        cassette_path=os.environ.get("LLM_STANDIN_CASSETTE", ".llm_cassettes.jsonl"),
+        script_path=os.environ.get("LLM_STANDIN_SCRIPT") or None,
+        upstream_url=upstream_url,
+        port=int(os.environ.get("LLM_STANDIN_PORT", 0)),
+        latency=float(os.environ.get("LLM_STANDIN_LATENCY", 0)),
+        token_rate=float(os.environ.get("LLM_STANDIN_TOKEN_RATE", 0)),
+        error_429_rate=float(os.environ.get("LLM_STANDIN_429_RATE", 0)),
+        error_500_rate=float(os.environ.get("LLM_STANDIN_500_RATE", 0)),
+        seed=int(os.environ.get("LLM_STANDIN_SEED", 0)),
+    )
+
+
+def request_key(body: Dict) -> str:
+    """由请求体计算录像键（忽略 stream 等与内容无关的字段，以及系统提示词中的日期）"""
+    stable = {k: v for k, v in body.items() if k not in _VOLATILE_FIELDS}
+    if isinstance(stable.get("messages"), list):
+        stable["messages"] = [
+            dict(message, content=_DATE.sub("<date>", message["content"]))
+            if message.get("role") == "system" and isinstance(message.get("content"), str) else message
+            for message in stable["messages"]
+        ]
+    return hashlib.sha256(json.dumps(stable, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def chunks_to_completion(chunks: List[Dict]) -> Dict:
+    """把流式响应的各个 chunk 合并为非流式的 chat.completion"""
+    content = None
+    tool_calls: Dict[int, Dict] = {}
+    finish_reason = None
+    usage = None
+    first = chunks[0] if chunks else {}
+    for chunk in chunks:
+        usage = chunk.get("usage") or usage
+        for choice in chunk.get("choices") or []:
+            delta = choice.get("delta") or {}
+            if delta.get("content") is not None:
+                content = (content or "") + delta["content"]
+            for call in delta.get("tool_calls") or []:
+                merged = tool_calls.setdefault(call["index"], {
+                    "id": None, "type": "function", "function": {"name": "", "arguments": ""}})
+                merged["id"] = call.get("id") or merged["id"]
+                function = call.get("function") or {}
+                merged["function"]["name"] += function.get("name") or ""
+                merged["function"]["arguments"] += function.get("arguments") or ""
+            finish_reason = choice.get("finish_reason") or finish_reason
+    message = {"role": "assistant", "content": content}
+    if tool_calls:
+        message["tool_calls"] = [tool_calls[index] for index in sorted(tool_calls)]
+    return {
+        "id": first.get("id", f"chatcmpl-{uuid.uuid4().hex}"),
+        "object": "chat.completion",
+        "created": first.get("created", int(time.time())),
+        "model": first.get("model", ""),
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason or "stop"}],
+        "usage": usage,
+    }
+
+
+def _split(text: str, size: int) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def completion_to_chunks(completion: Dict, piece_chars: int = 16) -> List[Dict]:
+    """把非流式 chat.completion 拆分为流式 chunk 序列（最后一个 chunk 携带用量）"""
+    base = {"id": completion.get("id", f"chatcmpl-{uuid.uuid4().hex}"), "object": "chat.completion.chunk",
+            "created": completion.get("created", int(time.time())), "model": completion.get("model", "")}
+
+    def chunk(delta, finish_reason=None):
+        return {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+    choice = completion["choices"][0]
+    message = choice.get("message") or {}
+    chunks = [chunk({"role": "assistant", "content": ""})]
+    if message.get("content"):
+        chunks += [chunk({"content": piece}) for piece in _split(message["content"], piece_chars)]
+    for index, call in enumerate(message.get("tool_calls") or []):
+        function = call.get("function") or {}
+        chunks.append(chunk({"tool_calls": [{"index": index, "id": call.get("id"), "type": "function",
+                                             "function": {"name": function.get("name", ""), "arguments": ""}}]}))
+        chunks += [chunk({"tool_calls": [{"index": index, "function": {"arguments": piece}}]})
+                   for piece in _split(function.get("arguments") or "", piece_chars)]
+    chunks.append(chunk({}, choice.get("finish_reason") or "stop"))
+    if completion.get("usage"):
+        chunks.append({**base, "choices": [], "usage": completion["usage"]})
+    return chunks
+
+
+def _chunk_tokens(chunk: Dict) -> int:
+    """估算单个 chunk 的输出 token 数（用于按速度回放）"""
+    text = ""
+    for choice in chunk.get("choices") or []:
+        delta = choice.get("delta") or {}
+        text += delta.get("content") or ""
+        for call in delta.get("tool_calls") or []:
+            text += (call.get("function") or {}).get("arguments") or ""
+    return estimate_text_tokens(text) if text else 0
+
+
+class CassetteStore:
+    """录像文件：每行一条 {key, request, response}，同一请求录制多次时按顺序轮流回放"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Dict[str, List[Dict]] = {}
+        self._cursor: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        # 按保存的请求重新计算键，旧版本录制的录像也按当前规则匹配
+                        key = request_key(entry["request"]) if "request" in entry else entry["key"]
+                        self._entries.setdefault(key, []).append(entry["response"])
+
+    def __len__(self) -> int:
+        return sum(len(responses) for responses in self._entries.values())
+
+    def lookup(self, key: str) -> Optional[Dict]:
+        """取一条录像响应（chat.completion 格式），没有时返回 None"""
+        with self._lock:
+            responses = self._entries.get(key)
+            if not responses:
+                return None
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+            return responses[index % len(responses)]
+
+    def append(self, key: str, request: Dict, response: Dict):
+        """追加一条录像"""
+        with self._lock:
+            self._entries.setdefault(key, []).append(response)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "request": request, "response": response}, ensure_ascii=False) + "\n")
+
+
+class ScriptedResponses:
+    """按正则匹配最后一条用户消息，生成脚本响应"""
+
+    def __init__(self, path: Optional[str] = None, rules: Optional[List[Dict]] = None):
+        if rules is None and path:
+            with open(path, "r", encoding="utf-8") as f:
+                rules = json.load(f)
+        self.rules = [(re.compile(rule.get("match", ".*"), re.S), rule) for rule in rules or []]
+
+    def respond(self, body: Dict) -> Optional[Dict]:
+        """生成 chat.completion，没有匹配的规则时返回 None"""
+        prompt = ""
+        for message in reversed(body.get("messages") or []):
+            if message.get("role") == "user":
+                content = message.get("content")
+                prompt = content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+                break
+        for pattern, rule in self.rules:
+            if not pattern.search(prompt):
+                continue
+            message = {"role": "assistant", "content": rule.get("content")}
+            output = rule.get("content") or ""
+            if "tool_call" in rule:
+                call = rule["tool_call"]
+                tools = body.get("tools") or [{}]
+                name = call.get("name") or tools[0].get("function", {}).get("name", "final_result")
+                arguments = call.get("arguments", {})
+                if not isinstance(arguments, str):
+                    arguments = json.dumps(arguments, ensure_ascii=False)
+                message["tool_calls"] = [{"id": f"call_{uuid.uuid4().hex[:24]}", "type": "function",
+                                          "function": {"name": name, "arguments": arguments}}]
+                output += arguments
+            prompt_tokens = estimate_text_tokens(json.dumps(body.get("messages"), ensure_ascii=False))
+            completion_tokens = estimate_text_tokens(output)
+            return {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", ""),
+                "choices": [{"index": 0, "message": message,
+                             "finish_reason": "tool_calls" if "tool_call" in rule else "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            }
+        return None
+
+
+class _HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class LLMStandInServer:
+    """基于 asyncio 的最小 OpenAI 兼容服务"""
+
+    def __init__(self, config: StandInConfig, scripted: Optional[ScriptedResponses] = None):
+        if config.mode not in STANDIN_MODES:
+            raise ValueError(f"未知的替身服务模式: {config.mode}，可选值: {STANDIN_MODES}")
+        self.config = config
+        self.cassettes = CassetteStore(config.cassette_path)
+        self.scripted = scripted or ScriptedResponses(config.script_path)
+        self.stats = {"requests": 0, "replayed": 0, "scripted": 0, "recorded": 0, "missing": 0,
+                      "injected_429": 0, "injected_500": 0}
+        self._random = random.Random(config.seed)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._upstream: Optional[httpx.AsyncClient] = None
+        self.port = config.port
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.config.host}:{self.port}/v1"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.config.host, self.config.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        if self.config.mode == "record":
+            self._upstream = httpx.AsyncClient(timeout=httpx.Timeout(200.0))
+        print(f"大模型替身服务已启动（{self.config.mode}）：{self.base_url}，录像 {len(self.cassettes)} 条", file=sys.stderr)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._upstream is not None:
+            await self._upstream.aclose()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                raw_body = await reader.readexactly(int(headers.get("content-length", 0)))
+                try:
+                    if method != "POST" or not path.split("?")[0].endswith("/chat/completions"):
+                        raise _HTTPError(404, f"不支持的接口: {method} {path}")
+                    await self._dispatch(json.loads(raw_body or b"{}"), headers, writer)
+                except _HTTPError as e:
+                    await self._send_json(writer, e.status, {"error": {"message": str(e), "type": "standin_error",
+                                                                        "code": e.status}}, e.headers)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, body: Dict, headers: Dict[str, str], writer: asyncio.StreamWriter):
+        self.stats["requests"] += 1
+        key = request_key(body)
+        stream = bool(body.get("stream"))
+
+        if self.config.mode == "record":
+            if stream:
+                chunks = await self._forward_stream(body, headers, writer)
+                self.cassettes.append(key, body, chunks_to_completion(chunks))
+            else:
+                completion = await self._forward(body, headers)
+                self.cassettes.append(key, body, completion)
+                await self._send_json(writer, 200, completion)
+            self.stats["recorded"] += 1
+            return
+
+        self._inject_errors()
+        completion = self.cassettes.lookup(key)
+        if completion is not None:
+            self.stats["replayed"] += 1
+        else:
+            completion = self.scripted.respond(body)
+            if completion is None:
+                self.stats["missing"] += 1
+                raise _HTTPError(404, "录像和脚本中都没有与该请求匹配的响应")
+            self.stats["scripted"] += 1
+
+        await asyncio.sleep(self.config.latency)
+        if stream:
+            await self._replay_stream(completion, writer)
+        else:
+            if self.config.token_rate:
+                tokens = (completion.get("usage") or {}).get("completion_tokens") or 0
+                await asyncio.sleep(tokens / self.config.token_rate)
+            await self._send_json(writer, 200, completion)
+
+    def _inject_errors(self):
+        roll = self._random.random()
+        if roll < self.config.error_429_rate:
+            self.stats["injected_429"] += 1
+            raise _HTTPError(429, "（注入）请求过于频繁", {"Retry-After": str(self.config.retry_after)})
+        if roll < self.config.error_429_rate + self.config.error_500_rate:
+            self.stats["injected_500"] += 1
+            raise _HTTPError(500, "（注入）服务内部错误")
+
+    def _upstream_headers(self, headers: Dict[str, str]) -> Dict[str, str]:
+        return {"Authorization": headers.get("authorization", ""), "Content-Type": "application/json"}
+
+    async def _forward(self, body: Dict, headers: Dict[str, str]) -> Dict:
+        response = await self._upstream.post(f"{self.config.upstream_url}/chat/completions", json=body,
+                                             headers=self._upstream_headers(headers))
+        if response.status_code != 200:
+            raise _HTTPError(response.status_code, response.text,
+                             {k: v for k, v in response.headers.items() if k.lower().startswith("retry-after")})
+        return response.json()
+
+    async def _forward_stream(self, body: Dict, headers: Dict[str, str], writer: asyncio.StreamWriter) -> List[Dict]:
+        chunks = []
+        async with self._upstream.stream("POST", f"{self.config.upstream_url}/chat/completions", json=body,
+                                         headers=self._upstream_headers(headers)) as response:
+            if response.status_code != 200:
+                text = (await response.aread()).decode("utf-8", "replace")
+                raise _HTTPError(response.status_code, text,
+                                 {k: v for k, v in response.headers.items() if k.lower().startswith("retry-after")})
+            await self._start_stream(writer)
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data != "[DONE]":
+                    chunks.append(json.loads(data))
+                await self._send_event(writer, data)
+        await self._end_stream(writer)
+        return chunks
+
+    async def _replay_stream(self, completion: Dict, writer: asyncio.StreamWriter):
+        await self._start_stream(writer)
+        for chunk in completion_to_chunks(completion):
+            if self.config.token_rate:
+                await asyncio.sleep(_chunk_tokens(chunk) / self.config.token_rate)
+            await self._send_event(writer, json.dumps(chunk, ensure_ascii=False))
+        await self._send_event(writer, "[DONE]")
+        await self._end_stream(writer)
+
+    @staticmethod
+    async def _send_json(writer: asyncio.StreamWriter, status: int, payload: Dict,
+                         extra_headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = [f"HTTP/1.1 {status} {_STATUS_TEXT.get(status, '')}", "Content-Type: application/json",
+                f"Content-Length: {len(body)}"]
+        head += [f"{name}: {value}" for name, value in (extra_headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    @staticmethod
+    async def _start_stream(writer: asyncio.StreamWriter):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    async def _send_event(writer: asyncio.StreamWriter, data: str):
+        payload = f"data: {data}\n\n".encode("utf-8")
+        writer.write(f"{len(payload):x}\r\n".encode("latin-1") + payload + b"\r\n")
+        await writer.drain()
+
+    @staticmethod
+    async def _end_stream(writer: asyncio.StreamWriter):
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def start_in_background(config: StandInConfig) -> LLMStandInServer:
+    """
+    在后台守护线程（独立事件循环）中启动替身服务
+    Args:
+        config: 服务配置
+    Returns:
+        已启动的服务（base_url 可直接作为 OpenAI 客户端地址）
+    """
+    server = LLMStandInServer(config)
+    ready = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(server.start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, name="llm-standin", daemon=True).start()
+    ready.wait()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的大模型录制/回放替身服务")
+    parser.add_argument("--mode", choices=STANDIN_MODES, default="replay")
+    parser.add_argument("--cassette", default=".llm_cassettes.jsonl", help="录像文件路径")
+    parser.add_argument("--script", default=None, help="脚本规则文件（JSON）")
+    parser.add_argument("--upstream", default=StandInConfig.upstream_url, help="录制模式下转发的真实服务地址")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="首包延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="输出速度（token/秒）")
+    parser.add_argument("--error-429-rate", type=float, default=0.0)
+    parser.add_argument("--error-500-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = StandInConfig(mode=args.mode, cassette_path=args.cassette, script_path=args.script,
+                           upstream_url=args.upstream, host=args.host, port=args.port, latency=args.latency,
+                           token_rate=args.token_rate, error_429_rate=args.error_429_rate,
+                           error_500_rate=args.error_500_rate, seed=args.seed)
+
+    async def serve():
+        server = LLMStandInServer(config)
+        await server.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
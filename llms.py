@@ -1,18 +1,59 @@
 from pydantic_ai.models.openai import OpenAIModel
 import httpx
 import asyncio
+import os
 from typing import Optional
+from llm_cache import LLMResponseCache, CachedModel
+from rate_limiter import RateLimiter, RateLimitedModel
+from metrics import MeteredModel
+from http_pool import HTTP_POOL_CONFIG, LoopBoundTransport
 
-# 创建带有超时配置的HTTP客户端
+# HTTP 连接池上限（LLM_MAX_CONNECTIONS），并发调用大模型时的并发数不应超过该值
+MAX_CONNECTIONS = HTTP_POOL_CONFIG["max_connections"]
+
+# 创建带有超时配置的HTTP客户端：每个事件循环各用一个连接池，支持 HTTP/2（见 http_pool.py）
+http_transport = LoopBoundTransport()
 http_client = httpx.AsyncClient(
-    timeout=httpx.Timeout(200.0),
-    limits=httpx.Limits(max_connections=10, max_keepalive_connections=2)
+    timeout=httpx.Timeout(HTTP_POOL_CONFIG["timeout"]),
+    transport=http_transport,
 )
 
-model = OpenAIModel(
+BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+
+# 离线运行 / 压测：LLM_STANDIN=record（录制真实流量）或 replay（回放录像）时，
+# 在进程内启动 OpenAI 兼容的替身服务并改连本地地址，其余配置见 llm_standin.py
+standin_server = None
+if os.environ.get("LLM_STANDIN"):
+    from llm_standin import config_from_env, start_in_background
+    standin_server = start_in_background(config_from_env(os.environ["LLM_STANDIN"], BASE_URL))
+
+base_url = standin_server.base_url if standin_server else BASE_URL
+
+openai_model = OpenAIModel(
     model_name="qwen-max",
     api_key="your api key",
-    base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+    base_url=base_url,
     http_client=http_client
 )
 
+# 响应缓存配置（可通过环境变量调整）
+# LLM_CACHE_MODE: on（默认，读写缓存） / off（绕过缓存） / refresh（强制刷新）
+llm_cache = LLMResponseCache(
+    path=os.environ.get("LLM_CACHE_PATH", ".llm_cache.sqlite"),
+    ttl_seconds=float(os.environ.get("LLM_CACHE_TTL", 7 * 24 * 3600)),
+    max_bytes=int(float(os.environ.get("LLM_CACHE_MAX_MB", 200)) * 1024 * 1024),
+)
+
+# 进程级限流（所有智能体共享），默认值略低于 qwen-max 的账号配额，设为 0 表示不限制
+# LLM_RPM: 每分钟请求数  LLM_TPM: 每分钟 token 数（输入 + 输出）
+rate_limiter = RateLimiter(
+    rpm=float(os.environ.get("LLM_RPM", 1000)),
+    tpm=float(os.environ.get("LLM_TPM", 900000)),
+)
+
+# 先查缓存，未命中的请求才经过限流器发往服务端；指标只统计实际发出的调用
+model = CachedModel(
+    RateLimitedModel(MeteredModel(openai_model), rate_limiter),
+    llm_cache,
+    mode=os.environ.get("LLM_CACHE_MODE", "on"),
+)
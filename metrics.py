@@ -0,0 +1,312 @@
+"""
+大模型调用与批次处理的指标统计
+
+覆盖项目中所有智能体的大模型调用和 Testcase_agent 的批次处理：
+- MeteredModel 包装 llms.py 中的模型，项目中每一次大模型调用（所有智能体）都会记录
+  耗时、输入/输出 token、输出速度（token/秒）和调用结果
+- 重试、输出截断、解析失败等事件由各智能体通过 registry.inc() 记录
+- 所有指标都带 stage（doc / sql / testcase / engineer）和 batch 标签，
+  由调用方通过 metric_labels() 设置，并发批次各自独立
+- 耗时类指标保留最近的样本，可计算 p50 / p95 / p99
+- registry.begin_run() 开始新一轮统计并保存上一轮快照；可导出为 JSON 或 Prometheus 文本格式
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from pydantic_ai.messages import ModelMessage, ModelResponse
+from pydantic_ai.models import Model, ModelRequestParameters, StreamedResponse
+from pydantic_ai.settings import ModelSettings
+from pydantic_ai.usage import Usage
+
+# 每个标签组合保留的最近样本数（用于计算分位数）
+MAX_SAMPLES = 2048
+# 保留的历史运行快照数
+MAX_RUNS = 20
+QUANTILES = (0.5, 0.95, 0.99)
+
+# 指标名称 -> (类型, 说明)
+METRICS = {
+    "llm_calls_total": ("counter", "大模型调用次数"),
+    "llm_errors_total": ("counter", "大模型调用失败次数"),
+    "llm_call_seconds": ("summary", "大模型调用耗时（秒）"),
+    "llm_input_tokens_total": ("counter", "输入 token 数"),
+    "llm_output_tokens_total": ("counter", "输出 token 数"),
+    "llm_output_tokens_per_second": ("summary", "输出速度（token/秒）"),
+    "llm_retries_total": ("counter", "重试次数"),
+    "llm_truncations_total": ("counter", "输出截断次数"),
+    "llm_parse_failures_total": ("counter", "结构化输出解析失败次数"),
+    "batch_seconds": ("summary", "批次耗时（秒）"),
+    "batch_cases_total": ("counter", "批次生成的条目数"),
+    "speculative_outcomes_total": ("counter", "投机模式的结果（outcome: one_shot / batches / merged）"),
+    "http_connections_opened_total": ("counter", "新建的大模型 HTTP 连接数"),
+    "http_connect_seconds": ("summary", "大模型 HTTP 建连耗时（TCP + TLS，秒）"),
+}
+
+_DEFAULT_LABELS = (("stage", "unknown"), ("batch", "-"))
+_labels: ContextVar[Tuple[Tuple[str, str], ...]] = ContextVar("metric_labels", default=_DEFAULT_LABELS)
+
+
+@contextmanager
+def metric_labels(stage: Optional[str] = None, batch=None):
+    """
+    设置当前上下文（包括其中创建的异步任务）中指标的 stage / batch 标签
+    Args:
+        stage: 阶段名称
+        batch: 批次编号
+    """
+    current = dict(_labels.get())
+    if stage is not None:
+        current["stage"] = stage
+    if batch is not None:
+        current["batch"] = str(batch)
+    token = _labels.set(tuple(current.items()))
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def current_labels() -> Dict[str, str]:
+    """当前上下文的标签"""
+    return dict(_labels.get())
+
+
+def _quantile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class _Summary:
+    """耗时类指标：累计总和与次数，并保留最近的样本用于计算分位数"""
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.samples: Deque[float] = deque(maxlen=MAX_SAMPLES)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def snapshot(self) -> Dict[str, float]:
+        ordered = sorted(self.samples)
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": round(_quantile(ordered, 0.5), 6),
+            "p95": round(_quantile(ordered, 0.95), 6),
+            "p99": round(_quantile(ordered, 0.99), 6),
+        }
+
+
+class MetricsRegistry:
+    """线程安全的指标注册表（GUI 中多个工作线程共用）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._summaries: Dict[Tuple[str, Tuple], _Summary] = {}
+        self.run_name = None
+        self.run_started = time.time()
+        self.runs: Deque[Dict] = deque(maxlen=MAX_RUNS)
+
+    @staticmethod
+    def _key(name: str, labels: Optional[Dict[str, str]]) -> Tuple[str, Tuple]:
+        if name not in METRICS:
+            raise KeyError(f"未注册的指标: {name}")
+        merged = current_labels()
+        merged.update({k: str(v) for k, v in (labels or {}).items()})
+        return name, tuple(sorted(merged.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """累加计数器（标签默认取当前上下文）"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """记录一个耗时类样本"""
+        key = self._key(name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = _Summary()
+            summary.observe(value)
+
+    def begin_run(self, name: Optional[str] = None):
+        """开始新一轮统计：保存上一轮快照并清空"""
+        with self._lock:
+            if self._counters or self._summaries:
+                self.runs.append(self._snapshot_locked())
+            self._counters.clear()
+            self._summaries.clear()
+            self.run_name = name
+            self.run_started = time.time()
+
+    def snapshot(self) -> Dict:
+        """当前一轮的指标快照"""
+        with self._lock:
+            return self._snapshot_locked()
+
+    def _snapshot_locked(self) -> Dict:
+        metrics: Dict[str, List[Dict]] = {}
+        for (name, labels), value in sorted(self._counters.items()):
+            metrics.setdefault(name, []).append({"labels": dict(labels), "value": value})
+        for (name, labels), summary in sorted(self._summaries.items(), key=lambda item: item[0]):
+            metrics.setdefault(name, []).append({"labels": dict(labels), **summary.snapshot()})
+        return {
+            "run": self.run_name,
+            "started_at": self.run_started,
+            "elapsed": round(time.time() - self.run_started, 3),
+            "metrics": metrics,
+        }
+
+    def total(self, name: str, **labels) -> float:
+        """按标签筛选后汇总计数器（或耗时类指标的样本数）"""
+        wanted = {k: str(v) for k, v in labels.items()}
+        with self._lock:
+            if METRICS[name][0] == "counter":
+                items = [(key, value) for key, value in self._counters.items() if key[0] == name]
+            else:
+                items = [(key, summary.count) for key, summary in self._summaries.items() if key[0] == name]
+        return sum(value for (_, key_labels), value in items if wanted.items() <= dict(key_labels).items())
+
+    def quantiles(self, name: str, **labels) -> Dict[str, float]:
+        """合并所有匹配标签的样本后计算分位数"""
+        wanted = {k: str(v) for k, v in labels.items()}
+        with self._lock:
+            samples = [value for (metric, key_labels), summary in self._summaries.items()
+                       if metric == name and wanted.items() <= dict(key_labels).items()
+                       for value in summary.samples]
+        ordered = sorted(samples)
+        return {f"p{int(q * 100)}": _quantile(ordered, q) for q in QUANTILES} | {"count": len(ordered)}
+
+    def to_json(self) -> str:
+        """导出为 JSON"""
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self) -> str:
+        """导出为 Prometheus 文本格式"""
+        def fmt(labels: Tuple, extra: Tuple = ()) -> str:
+            pairs = list(labels) + list(extra)
+            escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+        with self._lock:
+            lines = []
+            for name, (kind, help_text) in METRICS.items():
+                if kind == "counter":
+                    series = [(labels, value) for (metric, labels), value in sorted(self._counters.items())
+                              if metric == name]
+                    if not series:
+                        continue
+                    lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                    lines += [f"{name}{fmt(labels)} {value}" for labels, value in series]
+                else:
+                    series = [(labels, summary) for (metric, labels), summary in self._summaries.items()
+                              if metric == name]
+                    if not series:
+                        continue
+                    lines += [f"# HELP {name} {help_text}", f"# TYPE {name} summary"]
+                    for labels, summary in sorted(series, key=lambda item: item[0]):
+                        ordered = sorted(summary.samples)
+                        for q in QUANTILES:
+                            lines.append(f"{name}{fmt(labels, (('quantile', str(q)),))} {_quantile(ordered, q)}")
+                        lines.append(f"{name}_sum{fmt(labels)} {summary.sum}")
+                        lines.append(f"{name}_count{fmt(labels)} {summary.count}")
+            return "\n".join(lines) + "\n"
+
+    def format_summary(self, stage: Optional[str] = None) -> str:
+        """生成适合打印或在 GUI 中展示的摘要"""
+        labels = {"stage": stage} if stage else {}
+        latency = self.quantiles("llm_call_seconds", **labels)
+        speed = self.quantiles("llm_output_tokens_per_second", **labels)
+        batches = self.quantiles("batch_seconds", **labels)
+        lines = [
+            f"📊 {'阶段 ' + stage if stage else '全部阶段'}指标（本轮已运行 {time.time() - self.run_started:.1f} 秒）:",
+            f"   - 大模型调用: {self.total('llm_calls_total', **labels):.0f} 次，"
+            f"失败 {self.total('llm_errors_total', **labels):.0f} 次，重试 {self.total('llm_retries_total', **labels):.0f} 次",
+            f"   - 调用耗时: p50 {latency['p50']:.2f}s / p95 {latency['p95']:.2f}s / p99 {latency['p99']:.2f}s",
+            f"   - Token: 输入 {self.total('llm_input_tokens_total', **labels):.0f}，"
+            f"输出 {self.total('llm_output_tokens_total', **labels):.0f}，输出速度 p50 {speed['p50']:.1f} token/s",
+            f"   - 截断 {self.total('llm_truncations_total', **labels):.0f} 次，"
+            f"解析失败 {self.total('llm_parse_failures_total', **labels):.0f} 次",
+        ]
+        if batches["count"]:
+            lines.append(f"   - 批次: {batches['count']} 个，生成 {self.total('batch_cases_total', **labels):.0f} 条，"
+                         f"耗时 p50 {batches['p50']:.2f}s / p95 {batches['p95']:.2f}s")
+        return "\n".join(lines)
+
+
+# 全局指标注册表
+registry = MetricsRegistry()
+
+
+class MeteredModel(Model):
+    """包装任意 pydantic-ai 模型，记录每次调用的耗时、token 用量和结果"""
+
+    def __init__(self, wrapped: Model, metrics: MetricsRegistry = registry):
+        self.wrapped = wrapped
+        self.metrics = metrics
+
+    @property
+    def model_name(self) -> str:
+        return self.wrapped.model_name
+
+    @property
+    def system(self) -> Optional[str]:
+        return self.wrapped.system
+
+    def name(self) -> str:
+        return self.wrapped.name()
+
+    def _record(self, elapsed: float, usage: Optional[Usage], error: Optional[BaseException] = None):
+        self.metrics.inc("llm_calls_total")
+        if error is not None:
+            self.metrics.inc("llm_errors_total", error=type(error).__name__)
+            return
+        self.metrics.observe("llm_call_seconds", elapsed)
+        output_tokens = usage.response_tokens or 0
+        self.metrics.inc("llm_input_tokens_total", usage.request_tokens or 0)
+        self.metrics.inc("llm_output_tokens_total", output_tokens)
+        if elapsed > 0 and output_tokens:
+            self.metrics.observe("llm_output_tokens_per_second", output_tokens / elapsed)
+
+    async def request(
+        self,
+        messages: list[ModelMessage],
+        model_settings: Optional[ModelSettings],
+        model_request_parameters: ModelRequestParameters,
+    ) -> Tuple[ModelResponse, Usage]:
+        start = time.perf_counter()
+        try:
+            response, usage = await self.wrapped.request(messages, model_settings, model_request_parameters)
+        except Exception as e:
+            self._record(time.perf_counter() - start, None, e)
+            raise
+        self._record(time.perf_counter() - start, usage)
+        return response, usage
+
+    @asynccontextmanager
+    async def request_stream(
+        self,
+        messages: list[ModelMessage],
+        model_settings: Optional[ModelSettings],
+        model_request_parameters: ModelRequestParameters,
+    ) -> AsyncIterator[StreamedResponse]:
+        start = time.perf_counter()
+        try:
+            async with self.wrapped.request_stream(messages, model_settings, model_request_parameters) as response:
+                yield response
+        except Exception as e:
+            self._record(time.perf_counter() - start, None, e)
+            raise
+        self._record(time.perf_counter() - start, response.usage())
@@ -39,6 +39,21 @@ class InvalidRequest(BaseModel):
 
     error_message: str  # 错误消息
 
+class RequirementRecord(BaseModel):
+    """单条测试需求（ID、日期和完成状态由程序在写入数据库时分配）"""
+
+    requirements: str = Field(..., description="测试需求内容")
+    importance: str = Field(..., description="重要程度：高/中/低")
+    moduleName: str = Field(..., description="所属模块名称")
+    submitter: str = Field(..., description="提交人")
+
+
+class RequirementBatch(BaseModel):
+    """从需求说明书中整理出的测试需求列表"""
+
+    requirements: List[RequirementRecord] = Field(..., description="测试需求列表")
+
+
 @dataclass
 class DocAgentDeps:
     doc_path: str
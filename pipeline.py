@@ -0,0 +1,360 @@
+"""
+需求文档 → 数据库 → SQL 查询 → 测试用例 流水线
+
+原来流水线只写在 gui_main.WorkerThread.run_all 中，必须导入 PyQt5 才能运行。
+run_pipeline() 把三个阶段、检查点续跑和用量记录整理为不依赖界面的协程：
+- GUI（gui_main.WorkerThread）把日志转发到 Qt 信号
+- 命令行（cli.py）把日志和进度输出为 JSON 行，可在无界面的服务器或容器中运行
+
+默认逐阶段运行：全部需求写入数据库、查询完成后才开始生成测试用例。
+流水线模式（PipelineParams.pipelined）下三个阶段通过异步队列同时进行：
+- 查询 SQL 只依赖表结构，与需求提取同时生成
+- DocAGTest 每写入一批需求就交给查询阶段，按该批的 ID 范围执行查询
+- 每批匹配到的需求作为一个分组，立即开始生成测试用例（每条需求分配 cases_per_requirement 条，
+  达到用例总数为止）；需求全部处理完后仍不足总数时，再基于全部匹配需求补足
+各阶段的大模型调用相互重叠，端到端耗时接近最慢的阶段。每个分组在检查点中是独立的阶段（testcase:<首条需求 ID>），
+续跑时已完成的分组直接恢复。流水线模式只查询本次运行写入的需求。
+"""
+
+import asyncio
+import math
+import traceback
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from DocAGTest import run_agent as doc_to_db
+from Sql_agent import (run_agent as sql_query_agent, connect_database as sql_connect, plan_query, remember_plan,
+                       fetch_requirements_between, QueryPlan)
+from Testcase_agent import run_agent as testcase_gen_agent, BATCH_CONFIG
+from excel_sink import ExcelSink, EXCEL_CONFIG
+from metrics import registry
+from usage_tracker import usage_run, record_items, save_run_usage
+from db_pool import get_pool
+from checkpoint_store import RunCheckpoint
+
+PIPELINE_CONFIG = {
+    "cases_per_requirement": 2,  # 流水线模式下每条匹配需求分配的测试用例数
+    "max_group_concurrency": 2,  # 同时生成测试用例的需求分组数
+    "queue_size": 8,  # 阶段之间队列的容量（写满时上游等待下游）
+}
+
+
+@dataclass
+class PipelineParams:
+    """流水线参数（与 GUI 主界面的输入项一致）"""
+    doc_path: str = "./doc/ERP（资源协同）管理平台需求说明书（商品管理部分）.doc"
+    db_path: str = ".chat_app_db.sqlite"
+    excel_path: str = "./Exel/new_cases.xlsx"
+    total: int = 25  # 用作目标生成数量
+    batch_size: int = 10  # 用作 max_batch_size
+    doc_prompt: str = "请将商品管理模块的列表UI、新增需求写入数据库，id从1开始。"
+    sql_prompt: str = "请创建一个 SELECT 查询来获取商品管理模块的需求。"
+    case_prompt: str = "将需求列表中的列表UI、新增功能整理成测试用例。"
+    start_id: int = 1
+    pipelined: bool = False  # 三个阶段是否流水线执行
+
+    def checkpoint_params(self) -> Dict[str, Any]:
+        """随检查点保存的参数（续跑时恢复；数据库路径决定检查点所在位置，不保存）"""
+        params = asdict(self)
+        params.pop("db_path")
+        return params
+
+
+@dataclass
+class PipelineResult:
+    """一次流水线运行的结果"""
+    run_id: str
+    resumed: bool
+    requirement_rows: List = field(default_factory=list)
+    requirements_list: List = field(default_factory=list)
+    test_cases: List[Dict] = field(default_factory=list)
+
+
+async def run_stages(params: PipelineParams, checkpoint: RunCheckpoint, log: Callable[[str], Any],
+                     on_case: Optional[Callable[[Dict], Any]], stage_finished: Callable[[str, str, int], Any]) -> Tuple[List, List, List]:
+    """
+    逐阶段运行：需求全部写入数据库后查询，查询完成后生成测试用例
+    Returns:
+        (需求行, 查询到的需求文本, 测试用例)
+    """
+    log('【1/3】将需求文档内容写入数据库...')
+    requirement_rows = await checkpoint.stage_result('doc')
+    if requirement_rows is None:
+        log('智能分批模式：优先尝试一次性生成，如检测到截断将自动分批处理')
+
+        # 文档入库，支持智能分批
+        requirement_rows = await doc_to_db(params.doc_prompt, start_id=params.start_id, max_batch_size=params.batch_size,
+                                           doc_path=params.doc_path, db_path=params.db_path, checkpoint=checkpoint)
+        await checkpoint.complete_stage('doc', requirement_rows)
+        log(f'需求写入数据库完成，共{len(requirement_rows)}条。')
+        stage_finished('doc', 'done', len(requirement_rows))
+    else:
+        log(f'已从检查点恢复需求写入结果，共{len(requirement_rows)}条，跳过。')
+        stage_finished('doc', 'skipped', len(requirement_rows))
+
+    log('【2/3】自动生成需求查询SQL...')
+    # SQL 查询，传递当前 ID 范围
+    current_id = params.start_id + len(requirement_rows)
+    requirements_list = await checkpoint.stage_result('sql')
+    if requirements_list is None:
+        # 只查询本次运行写入的需求，表中之前运行留下的需求不参与
+        requirements_list = await sql_query_agent(params.sql_prompt, db_path=params.db_path, filter=params.sql_prompt,
+                                                  start_id=current_id, ids=[row['ID'] for row in requirement_rows])
+        await checkpoint.complete_stage('sql', requirements_list)
+        log(f'查询到的需求数据: 共{len(requirements_list)}条')
+        stage_finished('sql', 'done', len(requirements_list))
+    else:
+        log(f'已从检查点恢复查询结果，共{len(requirements_list)}条，跳过。')
+        stage_finished('sql', 'skipped', len(requirements_list))
+
+    # 打印前几条需求内容用于调试
+    if requirements_list:
+        log('需求内容示例:')
+        for i, req in enumerate(requirements_list[:3]):  # 显示前3条
+            log(f'  {i+1}. {req[:50]}...')
+
+    log('【3/3】自动生成测试用例...')
+    # 测试用例生成，传递需求列表和当前 ID 范围，支持智能分批
+    current_id = current_id + len(requirements_list)
+    test_cases = await checkpoint.stage_result('testcase')
+    if test_cases is None:
+        test_cases = await testcase_gen_agent(
+            params.case_prompt,
+            db_path=params.db_path,
+            excel_path=params.excel_path,
+            filter=params.sql_prompt,
+            start_id=current_id,
+            target_count=params.total,  # 使用用户设置的总数
+            max_batch_size=params.batch_size,
+            requirements_list=requirements_list,  # 传递具体需求列表
+            stream=True,
+            on_case=on_case,
+            concurrency=BATCH_CONFIG["max_concurrency"],  # 剩余批次并发生成
+            checkpoint=checkpoint
+        )
+        await checkpoint.complete_stage('testcase', test_cases)
+        stage_finished('testcase', 'done', len(test_cases))
+    else:
+        stage_finished('testcase', 'skipped', len(test_cases))
+    return requirement_rows, requirements_list, test_cases
+
+
+async def gather_or_cancel(*aws: Awaitable) -> List:
+    """并发等待全部任务；任一任务出错（或调用方被取消）时取消其余任务后再抛出"""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def run_stages_pipelined(params: PipelineParams, checkpoint: RunCheckpoint, log: Callable[[str], Any],
+                               on_case: Optional[Callable[[Dict], Any]],
+                               stage_finished: Callable[[str, str, int], Any]) -> Tuple[List, List, List]:
+    """
+    流水线运行：需求批次 → 查询队列 → 按批筛选 → 分组队列 → 测试用例生成
+    Returns:
+        (需求行, 查询到的需求文本, 测试用例)
+    """
+    stored = [await checkpoint.stage_result(stage) for stage in ('doc', 'sql', 'testcase')]
+    if None not in stored:
+        for stage, result in zip(('doc', 'sql', 'testcase'), stored):
+            stage_finished(stage, 'skipped', len(result))
+        log('已从检查点恢复全部阶段的结果，跳过。')
+        return tuple(stored)
+
+    rows_queue: asyncio.Queue = asyncio.Queue(PIPELINE_CONFIG["queue_size"])
+    groups_queue: asyncio.Queue = asyncio.Queue(PIPELINE_CONFIG["queue_size"])
+    requirement_rows: List[dict] = []
+    requirements_list: List[str] = []
+    groups: List[Tuple[str, List[str]]] = []  # 按分发顺序排列的 (分组键, 需求文本)
+    group_cases: Dict[str, List[Dict]] = {}
+    # 各分组写入同一组 Excel 分片
+    sink = ExcelSink(params.excel_path) if params.excel_path and EXCEL_CONFIG["mode"] == "parts" else None
+
+    async def prepare_plan() -> Optional[QueryPlan]:
+        # 查询只依赖表结构，与需求提取同时生成；生成结果写入检查点，续跑时按同一查询筛选
+        saved = await checkpoint.stage_result('sql_plan')
+        if saved:
+            return QueryPlan(sql=saved['sql'], params=tuple(saved['params']), source=saved['source'],
+                             cache_key=saved.get('cache_key', ''))
+        async with sql_connect(params.db_path) as conn:
+            plan = await plan_query(conn, params.sql_prompt, params.sql_prompt, params.start_id)
+        if plan is not None:
+            await checkpoint.complete_stage('sql_plan', asdict(plan))
+            log(f'查询已生成（{plan.source}）: {plan.sql}')
+        else:
+            log('未能生成查询，测试用例将基于过滤条件生成')
+        return plan
+
+    plan_task = asyncio.ensure_future(prepare_plan())
+
+    async def extract():
+        """阶段 1：需求写入数据库，每写入一批就放入查询队列"""
+        log('【1/3】将需求文档内容写入数据库（每写入一批即开始查询）...')
+        rows = await doc_to_db(params.doc_prompt, start_id=params.start_id, max_batch_size=params.batch_size,
+                               doc_path=params.doc_path, db_path=params.db_path, checkpoint=checkpoint,
+                               on_rows=rows_queue.put)
+        requirement_rows.extend(rows)
+        await checkpoint.complete_stage('doc', rows)
+        log(f'需求写入数据库完成，共{len(rows)}条。')
+        stage_finished('doc', 'done', len(rows))
+        await rows_queue.put(None)
+
+    async def select():
+        """阶段 2：按批次的 ID 范围执行查询，匹配到的需求作为一个分组放入生成队列"""
+        log('【2/3】按需求批次执行查询，匹配的需求分组交给测试用例生成...')
+        plan = await plan_task
+        remembered = False
+        while (rows := await rows_queue.get()) is not None:
+            ids = [row['ID'] for row in rows]
+            if plan is None:
+                texts = []
+            else:
+                async with sql_connect(params.db_path) as conn:
+                    texts = await fetch_requirements_between(conn, plan, min(ids), max(ids))
+                if not remembered:
+                    remember_plan(plan, params.sql_prompt, params.sql_prompt)
+                    remembered = True
+            log(f'需求 ID {min(ids)}-{max(ids)}：匹配 {len(texts)} 条')
+            if texts:
+                requirements_list.extend(texts)
+                await groups_queue.put((str(min(ids)), texts))
+        await checkpoint.complete_stage('sql', requirements_list)
+        log(f'查询到的需求数据: 共{len(requirements_list)}条')
+        stage_finished('sql', 'done', len(requirements_list))
+        await groups_queue.put(None)
+
+    semaphore = asyncio.Semaphore(max(1, PIPELINE_CONFIG["max_group_concurrency"]))
+
+    async def generate_group(key: str, texts: List[str], quota: int, start_id: int):
+        async with semaphore:
+            log(f'需求分组 {key}：生成 {quota} 条测试用例（{len(texts)} 条需求）')
+            group_cases[key] = await testcase_gen_agent(
+                params.case_prompt,
+                db_path=params.db_path,
+                excel_path=params.excel_path,
+                filter=params.sql_prompt,
+                start_id=start_id,
+                target_count=quota,
+                max_batch_size=params.batch_size,
+                requirements_list=texts,
+                stream=True,
+                on_case=on_case,
+                concurrency=BATCH_CONFIG["max_concurrency"],
+                checkpoint=checkpoint,
+                checkpoint_stage=f'testcase:{key}',
+                sink=sink,
+            )
+
+    async def generate():
+        """阶段 3：每收到一个需求分组立即生成测试用例，需求全部处理完后补足总数"""
+        log('【3/3】收到匹配的需求后立即生成测试用例...')
+        remaining = params.total
+        tasks = []
+
+        async def dispatch():
+            nonlocal remaining
+            while (item := await groups_queue.get()) is not None:
+                key, texts = item
+                quota = min(remaining, math.ceil(len(texts) * PIPELINE_CONFIG["cases_per_requirement"]))
+                if quota <= 0:
+                    log(f'需求分组 {key}：已达到用例总数，跳过 {len(texts)} 条需求')
+                    continue
+                remaining -= quota
+                groups.append((key, texts))
+                tasks.append(asyncio.ensure_future(generate_group(key, texts, quota, int(key))))
+
+        await gather_or_cancel(dispatch())
+        await gather_or_cancel(*tasks)
+        produced = sum(len(cases) for cases in group_cases.values())
+        if produced < params.total:
+            # 分组配额之和或实际生成数不足总数：基于全部匹配需求补足
+            groups.append(('topup', requirements_list))
+            await generate_group('topup', requirements_list, params.total - produced, params.start_id)
+
+    try:
+        await gather_or_cancel(extract(), select(), generate())
+    finally:
+        if not plan_task.done():
+            plan_task.cancel()
+    test_cases = [case for key, _ in groups for case in group_cases.get(key, [])][:params.total]
+    await checkpoint.complete_stage('testcase', test_cases)
+    stage_finished('testcase', 'done', len(test_cases))
+    return requirement_rows, requirements_list, test_cases
+
+
+async def run_pipeline(params: PipelineParams, run_id: Optional[str] = None,
+                       log: Callable[[str], Any] = print,
+                       on_case: Optional[Callable[[Dict], Any]] = None,
+                       on_stage: Optional[Callable[[str, str, int], Any]] = None,
+                       begin_metrics_run: bool = True) -> PipelineResult:
+    """
+    运行三个阶段（逐阶段或流水线模式），每个批次写入检查点
+    Args:
+        params: 流水线参数（续跑时以检查点中保存的参数为准，会就地更新）
+        run_id: 续跑的运行 ID，为空时开始新的运行
+        log: 日志输出函数
+        on_case: 每生成一条测试用例时调用
+        on_stage: 阶段完成时调用 (阶段 doc / sql / testcase, 状态 done / skipped, 产出条数)
+        begin_metrics_run: 是否开始新一轮指标统计（多个流水线并发运行时由调用方统一开始）
+    Returns:
+        PipelineResult；出错或被取消时检查点标记为 failed / cancelled 后重新抛出异常
+    """
+    if begin_metrics_run:
+        registry.begin_run(f'流水线运行 {params.doc_path}')
+    checkpoint = RunCheckpoint(params.db_path, run_id)
+
+    def stage_finished(stage: str, status: str, count: int):
+        if on_stage is not None:
+            on_stage(stage, status, count)
+
+    with usage_run(f'流水线运行 {params.doc_path}') as run_usage:
+        try:
+            # 登记运行参数；续跑时以检查点中保存的参数为准
+            for name, value in (await checkpoint.start(params.checkpoint_params())).items():
+                setattr(params, name, value)
+            if checkpoint.resumed:
+                log(f'续跑运行 {checkpoint.run_id}：已完成的阶段和批次将直接跳过')
+            else:
+                log(f'运行 ID: {checkpoint.run_id}（中断后填入该 ID 可从最后完成的批次继续）')
+
+            if params.pipelined:
+                log('流水线模式：需求提取、查询和测试用例生成同时进行')
+                requirement_rows, requirements_list, test_cases = await run_stages_pipelined(
+                    params, checkpoint, log, on_case, stage_finished)
+            else:
+                requirement_rows, requirements_list, test_cases = await run_stages(
+                    params, checkpoint, log, on_case, stage_finished)
+            record_items('doc', len(requirement_rows))
+            record_items('sql', len(requirements_list))
+            log(f'生成的测试用例: 共{len(test_cases)}条')
+            record_items('testcase', len(test_cases))
+            log(registry.format_summary())
+            log(run_usage.format_summary())
+            # 用量写入运行历史表，便于按历史数据调整批次大小和提示词
+            async with get_pool(params.db_path).writer() as conn:
+                await save_run_usage(conn, run_usage)
+            await checkpoint.finish()
+            log('所有任务完成！数据已保存到相应文件中。')
+            return PipelineResult(checkpoint.run_id, checkpoint.resumed, requirement_rows, requirements_list, test_cases)
+        except asyncio.CancelledError:
+            # 被取消：已完成的批次保留在检查点中，可用同一运行 ID 续跑
+            log(f'运行已取消，可填入运行 ID {checkpoint.run_id} 续跑')
+            try:
+                await asyncio.shield(checkpoint.finish('cancelled'))
+            except Exception:
+                pass
+            raise
+        except Exception as e:
+            log(f'执行出错: {str(e)}')
+            log(f'详细错误: {traceback.format_exc()}')
+            try:
+                await checkpoint.finish('failed', str(e))
+                log(f'已完成的批次已保存，可填入运行 ID {checkpoint.run_id} 续跑')
+            except Exception:
+                pass
+            raise
@@ -0,0 +1,62 @@
+"""
+Qt 与后台事件循环的桥接
+
+AsyncWorker 替代原来"每个任务一个 QThread + asyncio.run"的写法：start() 把 run_async()
+提交到 async_runtime 的共享事件循环，任务结束时通过 Qt 信号通知界面。
+
+在非 Qt 线程中 emit 的信号，会按接收对象所在线程自动排队（QueuedConnection），
+槽函数总是在界面线程中执行，因此协程中可以直接 emit 子类定义的信号。
+"""
+
+import abc
+import concurrent.futures
+import traceback
+from typing import Optional
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from async_runtime import get_runtime
+
+
+class _QABCMeta(type(QObject), abc.ABCMeta):
+    """QObject 的元类（sip.wrappertype）与 ABCMeta 的组合，使 QObject 子类可以声明抽象方法"""
+
+
+class AsyncWorker(QObject, metaclass=_QABCMeta):
+    """在共享事件循环中执行一个协程的工作对象，接口与 QThread 保持一致（start / isRunning / finished）"""
+    finished = pyqtSignal()
+    cancelled = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._future: Optional[concurrent.futures.Future] = None
+
+    @abc.abstractmethod
+    async def run_async(self):
+        """子类实现：要执行的协程"""
+
+    def start(self):
+        """提交到后台事件循环（重复调用时忽略）"""
+        if self.isRunning():
+            return
+        self._future = get_runtime().submit(self.run_async())
+        self._future.add_done_callback(self._on_done)
+
+    def cancel(self) -> bool:
+        """取消正在执行的任务，协程内会收到 CancelledError"""
+        return self._future is not None and self._future.cancel()
+
+    def isRunning(self) -> bool:
+        return self._future is not None and not self._future.done()
+
+    def on_error(self, error: BaseException):
+        """协程抛出未处理的异常时调用（在事件循环线程中），子类可改为发出错误信号"""
+        print(f"后台任务出错: {error}")
+        print(''.join(traceback.format_exception(type(error), error, error.__traceback__)))
+
+    def _on_done(self, future: concurrent.futures.Future):
+        if future.cancelled():
+            self.cancelled.emit()
+        elif future.exception() is not None:
+            self.on_error(future.exception())
+        self.finished.emit()
@@ -0,0 +1,233 @@
+"""
+大模型调用的令牌桶限流
+
+所有智能体共用 llms.py 中的同一个模型对象，这里在模型层做进程级限流：
+- 两个令牌桶：每分钟请求数（RPM）和每分钟 token 数（TPM）
+- 请求发出前按渲染后的提示词（系统提示词、消息历史、结果结构）估算 token 数，
+  两个桶都有余量才发出；余量不足时在当前事件循环中等待，而不是等到服务端返回 429
+- 请求完成后用实际用量校正 TPM 桶
+- 仍然收到 429 时按 Retry-After 暂停所有调用方，再由 RateLimitedModel 自动重试
+
+令牌桶使用线程锁保护，GUI 中多个工作线程（各自的事件循环）共享同一份配额。
+"""
+
+import asyncio
+import json
+import re
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from openai import RateLimitError
+from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter, ModelResponse
+from pydantic_ai.models import Model, ModelRequestParameters, StreamedResponse
+from pydantic_ai.settings import ModelSettings
+from pydantic_ai.usage import Usage
+
+from metrics import registry
+
+# 未设置 max_tokens 时，预估的单次输出 token 数（请求完成后按实际用量校正）
+DEFAULT_COMPLETION_TOKENS = 1024
+
+_CJK = re.compile(r"[　-〿一-鿿＀-￯]")
+
+
+def estimate_text_tokens(text: str) -> int:
+    """粗略估算文本 token 数：中文约 1 字 1 token，其他字符约 4 个 1 token"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def estimate_request_tokens(
+    messages: list[ModelMessage],
+    model_settings: Optional[ModelSettings],
+    model_request_parameters: ModelRequestParameters,
+) -> int:
+    """
+    按渲染后的提示词估算一次请求消耗的 token 数（输入 + 预期输出）
+    Args:
+        messages: 消息历史（含系统提示词）
+        model_settings: 模型设置
+        model_request_parameters: 结果结构与工具定义
+    Returns:
+        估算的 token 数
+    """
+    rendered = ModelMessagesTypeAdapter.dump_json(messages).decode("utf-8")
+    tools = json.dumps(asdict(model_request_parameters), ensure_ascii=False, default=str)
+    completion = (model_settings or {}).get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+    return estimate_text_tokens(rendered) + estimate_text_tokens(tools) + completion
+
+
+class TokenBucket:
+    """线程安全的令牌桶，按每分钟速率匀速补充，允许预支（预支后调用方需等待补齐）"""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        预订 amount 个令牌
+        Returns:
+            需要等待的秒数（0 表示可以立即执行）
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self.rate)
+
+    def refund(self, amount: float):
+        """归还（amount 为负时追加扣除）令牌"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    def drain(self, seconds: float):
+        """清空令牌并预支 seconds 秒的补充量（收到 429 时暂停所有调用方）"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class RateLimiter:
+    """RPM + TPM 双令牌桶限流器，rpm/tpm 为 0 时不限制对应维度"""
+
+    def __init__(self, rpm: float = 0, tpm: float = 0):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.acquired = 0
+        self.throttled = 0
+        self.wait_seconds = 0.0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+
+    async def acquire(self, estimated_tokens: int):
+        """在发出请求前调用，配额不足时等待"""
+        delay = 0.0
+        if self.requests:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens:
+            delay = max(delay, self.tokens.reserve(estimated_tokens))
+        with self._lock:
+            self.acquired += 1
+            if delay > 0:
+                self.throttled += 1
+                self.wait_seconds += delay
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def settle(self, estimated_tokens: int, actual_tokens: int):
+        """请求完成后按实际用量校正 TPM 桶"""
+        if self.tokens and actual_tokens:
+            self.tokens.refund(estimated_tokens - actual_tokens)
+
+    def penalize(self, retry_after: float):
+        """服务端返回 429 时暂停所有调用方 retry_after 秒"""
+        with self._lock:
+            self.rate_limited += 1
+        for bucket in (self.requests, self.tokens):
+            if bucket:
+                bucket.drain(retry_after)
+
+    def stats(self) -> Dict[str, float]:
+        """返回限流统计"""
+        return {
+            "acquired": self.acquired,
+            "throttled": self.throttled,
+            "wait_seconds": round(self.wait_seconds, 3),
+            "rate_limited": self.rate_limited,
+            "requests_available": self.requests.available if self.requests else None,
+            "tokens_available": self.tokens.available if self.tokens else None,
+        }
+
+
+def retry_after_seconds(error: RateLimitError, default: float = 1.0) -> float:
+    """从 429 响应头中读取建议的等待时间"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for name in ("retry-after-ms", "retry-after"):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            seconds = float(value)
+        except ValueError:
+            continue
+        return seconds / 1000 if name == "retry-after-ms" else seconds
+    return default
+
+
+class RateLimitedModel(Model):
+    """包装任意 pydantic-ai 模型，所有请求先经过限流器；遇到 429 时暂停并重试"""
+
+    def __init__(self, wrapped: Model, limiter: RateLimiter, max_retries: int = 3):
+        self.wrapped = wrapped
+        self.limiter = limiter
+        self.max_retries = max_retries
+
+    @property
+    def model_name(self) -> str:
+        return self.wrapped.model_name
+
+    @property
+    def system(self) -> Optional[str]:
+        return self.wrapped.system
+
+    def name(self) -> str:
+        return self.wrapped.name()
+
+    async def request(
+        self,
+        messages: list[ModelMessage],
+        model_settings: Optional[ModelSettings],
+        model_request_parameters: ModelRequestParameters,
+    ) -> Tuple[ModelResponse, Usage]:
+        estimated = estimate_request_tokens(messages, model_settings, model_request_parameters)
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(estimated)
+            try:
+                response, usage = await self.wrapped.request(messages, model_settings, model_request_parameters)
+            except RateLimitError as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = retry_after_seconds(e)
+                print(f"触发服务端限流 (尝试 {attempt + 1}/{self.max_retries + 1})，暂停 {delay:.1f} 秒后重试")
+                self.limiter.penalize(delay)
+                registry.inc("llm_retries_total")
+                continue
+            self.limiter.settle(estimated, usage.total_tokens or 0)
+            return response, usage
+
+    @asynccontextmanager
+    async def request_stream(
+        self,
+        messages: list[ModelMessage],
+        model_settings: Optional[ModelSettings],
+        model_request_parameters: ModelRequestParameters,
+    ) -> AsyncIterator[StreamedResponse]:
+        estimated = estimate_request_tokens(messages, model_settings, model_request_parameters)
+        # 流式请求一旦开始输出就无法透明重试，429 交给调用方处理
+        await self.limiter.acquire(estimated)
+        try:
+            async with self.wrapped.request_stream(messages, model_settings, model_request_parameters) as response:
+                yield response
+        except RateLimitError as e:
+            self.limiter.penalize(retry_after_seconds(e))
+            raise
+        self.limiter.settle(estimated, response.usage().total_tokens or 0)
@@ -7,6 +7,13 @@ CREATE TABLE test_requirements (
     importance TEXT NOT NULL,
     moduleName TEXT NOT NULL
 );
+-- 二级索引与全文检索（由 db_migrations.py 自动创建，这里仅供参考）
+CREATE INDEX IF NOT EXISTS idx_test_requirements_moduleName ON test_requirements(moduleName);
+CREATE INDEX IF NOT EXISTS idx_test_requirements_importance ON test_requirements(importance);
+CREATE INDEX IF NOT EXISTS idx_test_requirements_tag ON test_requirements(tag);
+CREATE INDEX IF NOT EXISTS idx_test_requirements_date ON test_requirements(date);
+CREATE INDEX IF NOT EXISTS idx_test_requirements_submitter ON test_requirements(submitter);
+CREATE VIRTUAL TABLE IF NOT EXISTS test_requirements_fts USING fts5(requirements, moduleName, content='test_requirements', content_rowid='ID', tokenize='trigram');
 -- INSERT INTO test_requirements (requirements, tag, date, submitter) VALUES ('验证用户注册功能是否正常', 0, '2024-09-15', '田老师');
 -- INSERT INTO test_requirements (requirements, tag, date, submitter) VALUES ('验证用户登录功能是否正常', 1, '2024-09-16', '助教小姐姐');
 -- INSERT INTO test_requirements (requirements, tag, date, submitter) VALUES ('验证用户密码重置功能是否正常', 0, '2024-09-17', '但问智能');
@@ -0,0 +1,189 @@
+"""
+需求筛选请求的规则解析（Sql_agent 快速通道）
+
+第二阶段的大部分请求只是对 test_requirements 的简单筛选：按模块、重要程度、完成状态、
+提交人或日期范围。这里用规则识别这些中文表述并直接生成参数化 SELECT，完全不调用大模型；
+只要请求里还有无法识别的内容，或者含有否定（“不属于”“除……以外”等），就返回 None，交由 Sql_agent 走大模型生成。
+
+示例：
+- “获取商品管理模块的需求” -> moduleName LIKE '%商品管理%'
+- “查询商品品牌和商品分类模块中重要程度为高的未完成需求”
+- “2024-09-01 到 2024-09-30 之间田老师提交的需求”
+"""
+
+import re
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+SELECT_PREFIX = "SELECT * FROM test_requirements"
+
+_NAME = r"[一-龥A-Za-z0-9_\-—]+"
+_DATE = r"\d{4}\s*[-/.年]\s*\d{1,2}\s*[-/.月]\s*\d{1,2}\s*日?|今天|今日"
+
+_MODULE = re.compile(rf"((?:{_NAME}\s*(?:和|与|及|、|,|，)\s*)*{_NAME})\s*模块")
+# 模块名、提交人前常见的动词/介词：只去掉开头的完整词，名称中间的字（如“来源管理”的“来”）不受影响
+_PREFIX = re.compile(r"^(?:(?:请|帮我|帮忙|从数据库中|数据库中|从|来?(?:获取|查询|查找|列出|筛选|显示|返回|统计|导出)|"
+                     r"关于|属于|所有|全部|来自|的)\s*)*")
+# 否定条件规则无法表达，交给大模型
+_NEGATION = re.compile(r"不|非|除|以外|之外")
+_MODULE_SPLIT = re.compile(r"\s*(?:和|与|及|、|,|，)\s*")
+
+_IMPORTANCE = [
+    re.compile(r"(?:重要程度|重要性|重要级别|优先级)\s*(?:为|是|=|:|：)?\s*(高|中|低)"),
+    re.compile(r"(高|中|低)\s*(?:重要程度|重要性|重要级别|优先级|重要)"),
+]
+_TAG = re.compile(r"(未完成|已完成)")
+_SUBMITTER = [
+    re.compile(r"(?:提交人|提交者)\s*(?:为|是|=|:|：)?\s*([一-龥A-Za-z0-9_]+?)(?=的|提交|$|\s|，|,|。|且|并且|和)"),
+    re.compile(r"由\s*([一-龥A-Za-z0-9_]+?)\s*提交"),
+    re.compile(r"([一-龥A-Za-z0-9_]{2,6}?)\s*提交的"),
+]
+_DATE_RANGE = re.compile(rf"({_DATE})\s*(?:到|至|~|～|-|—)\s*({_DATE})(?:\s*(?:之间|期间|内))?")
+_DATE_AFTER = re.compile(rf"({_DATE})\s*(?:之后|以后|起|后|及以后)")
+_DATE_BEFORE = re.compile(rf"({_DATE})\s*(?:之前|以前|前|及以前)")
+_DATE_EQUAL = re.compile(rf"(?:日期|提交日期|时间)?\s*(?:为|是|在)?\s*({_DATE})\s*(?:当天|提交)?")
+
+# 识别出所有条件后，剩余文本只能是这些无关紧要的词，否则认为无法解析
+_FILLER = re.compile(
+    r"请|帮我|帮忙|创建|编写|生成|写|一个|一条|select|sql|语句|查询|来|获取|查找|列出|筛选|显示|返回|"
+    r"所有|全部|的|测试需求|需求|数据|记录|列表|信息|内容|中|里|从|数据库|test_requirements|表|"
+    r"并且|而且|以及|且|和|与|及|同时|满足|条件|之间|期间|内|日期|时间|在|为|是"
+)
+_PUNCTUATION = re.compile(r"[\s。.!！?？;；,，、:：\"'“”‘’()（）\[\]【】*_-]+")
+
+
+def _strip_prefix(name: str) -> str:
+    return name[_PREFIX.match(name).end():]
+
+
+def _normalize_date(text: str) -> str:
+    if text in ("今天", "今日"):
+        return time.strftime("%Y-%m-%d")
+    year, month, day = re.findall(r"\d+", text)
+    return f"{int(year):04d}-{int(month):02d}-{int(day):02d}"
+
+
+@dataclass
+class ParsedQuery:
+    """规则解析得到的参数化查询"""
+    conditions: List[str] = field(default_factory=list)
+    params: List = field(default_factory=list)
+
+    @property
+    def sql(self) -> str:
+        if not self.conditions:
+            return f"{SELECT_PREFIX} ORDER BY ID"
+        return f"{SELECT_PREFIX} WHERE {' AND '.join(self.conditions)} ORDER BY ID"
+
+
+class RequirementFilterParser:
+    """需求筛选请求的规则解析器，带命中率计数"""
+
+    def __init__(self, fts_table: Optional[str] = None):
+        # 全文检索表（trigram 分词）可用时，模块名模糊匹配改走全文索引
+        self.fts_table = fts_table
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, *texts: str) -> Optional[Tuple[str, tuple]]:
+        """
+        解析一条或多条请求文本（条件取交集）
+        Args:
+            texts: 请求文本（例如用户提示和过滤条件）
+        Returns:
+            (参数化 SQL, 参数) ；无法完全解析时返回 None
+        """
+        query = ParsedQuery()
+        seen = set()
+        for text in texts:
+            text = unicodedata.normalize("NFKC", text or "").strip()
+            if not text or text in seen:
+                continue
+            seen.add(text)
+            if not self._parse_text(text, query):
+                self.misses += 1
+                return None
+        if not seen:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return query.sql, tuple(query.params)
+
+    def _parse_text(self, text: str, query: ParsedQuery) -> bool:
+        if _NEGATION.search(text):
+            return False
+        masked = [text]
+
+        def consume(match):
+            # 已识别的片段用空格覆盖，避免被后续规则重复识别，也便于最后检查剩余文本
+            start, end = match.span()
+            masked[0] = masked[0][:start] + " " * (end - start) + masked[0][end:]
+
+        match = _DATE_RANGE.search(masked[0])
+        if match:
+            consume(match)
+            query.conditions.append("date BETWEEN ? AND ?")
+            query.params.extend([_normalize_date(match.group(1)), _normalize_date(match.group(2))])
+        else:
+            for pattern, operator in ((_DATE_AFTER, ">="), (_DATE_BEFORE, "<="), (_DATE_EQUAL, "=")):
+                match = pattern.search(masked[0])
+                if match:
+                    consume(match)
+                    query.conditions.append(f"date {operator} ?")
+                    query.params.append(_normalize_date(match.group(1)))
+                    break
+
+        for match in list(_MODULE.finditer(masked[0])):
+            names = [name for name in _MODULE_SPLIT.split(_strip_prefix(match.group(1))) if name]
+            # 名称中仍有“的”说明前面还有其他修饰（例如“田老师提交的商品管理”），无法可靠拆分
+            if not names or any("的" in name for name in names):
+                return False
+            consume(match)
+            query.conditions.append("(" + " OR ".join(self._module_condition(name) for name in names) + ")")
+            query.params.extend(f"%{name}%" for name in names)
+
+        for pattern in _IMPORTANCE:
+            match = pattern.search(masked[0])
+            if match:
+                consume(match)
+                query.conditions.append("importance = ?")
+                query.params.append(match.group(1))
+                break
+
+        match = _TAG.search(masked[0])
+        if match:
+            consume(match)
+            query.conditions.append("tag = ?")
+            query.params.append(0 if match.group(1) == "未完成" else 1)
+
+        for pattern in _SUBMITTER:
+            match = pattern.search(masked[0])
+            if match:
+                name = _strip_prefix(match.group(1))
+                if not name:
+                    return False
+                consume(match)
+                query.conditions.append("submitter = ?")
+                query.params.append(name)
+                break
+
+        # 检查剩余部分是否只剩无关词
+        rest = _PUNCTUATION.sub("", masked[0].lower())
+        return _FILLER.sub("", rest) == ""
+
+    def _module_condition(self, name: str) -> str:
+        # trigram 索引只能加速至少 3 个字的关键词
+        if self.fts_table and len(name) >= 3:
+            return f"ID IN (SELECT rowid FROM {self.fts_table} WHERE moduleName LIKE ?)"
+        return "moduleName LIKE ?"
+
+    def stats(self) -> Dict[str, float]:
+        """返回快速通道命中计数"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,109 @@
+"""
+自然语言查询到 SQL 的计划缓存
+
+Sql_agent 对同一个筛选请求（如“获取商品管理模块的需求”）每次都要调用大模型并做
+EXPLAIN QUERY PLAN 校验。这里把“归一化后的请求文本 + 表结构哈希”映射到已经校验并
+成功执行过的 SQL，命中时直接执行，不再调用大模型。
+
+表结构（DB_SCHEMA）变化后哈希随之变化，旧条目在打开缓存时被清理。
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, Optional
+
+_TRAILING_PUNCTUATION = re.compile(r"[。.!！?？;；,，\s]+$")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_request(text: str) -> str:
+    """
+    归一化请求文本：全角转半角、统一小写、合并空白、去掉末尾标点
+    Args:
+        text: 原始请求文本
+    Returns:
+        归一化后的文本
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower().strip()
+    text = _WHITESPACE.sub(" ", text)
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+
+def schema_hash(schema: str) -> str:
+    """计算表结构哈希（忽略空白差异）"""
+    return hashlib.sha256(_WHITESPACE.sub(" ", schema.strip()).encode("utf-8")).hexdigest()[:16]
+
+
+class SqlPlanCache:
+    """基于 SQLite 的查询计划缓存"""
+
+    def __init__(self, path: str, schema: str):
+        self.path = path
+        self.schema_hash = schema_hash(schema)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sql_plan_cache (
+                request_key TEXT NOT NULL,
+                schema_hash TEXT NOT NULL,
+                request_text TEXT NOT NULL,
+                sql_query TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                hit_count INTEGER DEFAULT 0,
+                PRIMARY KEY (request_key, schema_hash)
+            )
+        """)
+        # 表结构变化后旧的 SQL 不再可信，直接清理
+        self._conn.execute("DELETE FROM sql_plan_cache WHERE schema_hash != ?", (self.schema_hash,))
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """由若干请求文本片段计算缓存键"""
+        normalized = "\x1f".join(normalize_request(part) for part in parts)
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def get(self, request_key: str) -> Optional[str]:
+        """读取缓存的 SQL，未命中返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sql_query FROM sql_plan_cache WHERE request_key = ? AND schema_hash = ?",
+                (request_key, self.schema_hash),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE sql_plan_cache SET hit_count = hit_count + 1 WHERE request_key = ? AND schema_hash = ?",
+                (request_key, self.schema_hash),
+            )
+            self.hits += 1
+            return row[0]
+
+    def put(self, request_key: str, request_text: str, sql_query: str):
+        """写入已校验并成功执行的 SQL"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sql_plan_cache (request_key, schema_hash, request_text, sql_query, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (request_key, self.schema_hash, request_text, sql_query, time.time()),
+            )
+
+    def invalidate(self, request_key: str):
+        """删除一条缓存（例如缓存的 SQL 执行失败时）"""
+        with self._lock:
+            self._conn.execute("DELETE FROM sql_plan_cache WHERE request_key = ?", (request_key,))
+
+    def stats(self) -> Dict[str, float]:
+        """返回命中/未命中计数"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -47,6 +47,15 @@ def start_application():
         splash.showMessage("加载测试用例自动生成系统...", alignment=Qt.AlignCenter | Qt.AlignBottom, color=Qt.black)
         app.processEvents()
         
+        # 退出时停止共享的后台事件循环（关闭连接池等）
+        from async_runtime import get_runtime, shutdown_runtime
+        app.aboutToQuit.connect(shutdown_runtime)
+
+        # 启动画面显示期间，在界面任务共用的后台事件循环中预热到大模型服务的连接
+        import llms
+        from http_pool import prewarm
+        get_runtime().submit(prewarm(llms.http_client, llms.base_url))
+
         # 创建并显示主窗口
         window = MainWindow()
         
@@ -31,6 +31,8 @@ from pydantic_ai import Agent, RunContext
 from pydantic import BaseModel, Field
 from dataclasses import dataclass
 from llms import model
+from metrics import metric_labels
+from usage_tracker import record_usage
 import logfire
 
 logfire.configure(token="your logfire token")
@@ -236,7 +238,9 @@ class SoftwareTestEngineerAgent:
 }}
 """
         
-        result = await self.agent.run(prompt, deps=deps)
+        with metric_labels(stage="engineer"):
+            result = await self.agent.run(prompt, deps=deps)
+        record_usage("engineer", result.usage())
         return self._parse_consultation_result(result.data)
     
     async def review_testcases(self, test_cases: List[Dict]) -> TestCaseReview:
@@ -286,7 +290,9 @@ class SoftwareTestEngineerAgent:
 首先提供JSON格式的摘要，然后提供每个维度的详细评审，包括优点、不足和具体的改进建议。
 """
         
-        result = await self.agent.run(prompt, deps=deps)
+        with metric_labels(stage="engineer"):
+            result = await self.agent.run(prompt, deps=deps)
+        record_usage("engineer", result.usage())
         
         # 如果结果是字符串，可能是详细评审结果
         if isinstance(result.data, str):
@@ -330,7 +336,9 @@ class SoftwareTestEngineerAgent:
 }}
 """
         
-        result = await self.agent.run(prompt, deps=deps)
+        with metric_labels(stage="engineer"):
+            result = await self.agent.run(prompt, deps=deps)
+        record_usage("engineer", result.usage())
         return self._parse_strategy_result(result.data)
     
     async def chat(self, message: str) -> str:
@@ -353,7 +361,9 @@ class SoftwareTestEngineerAgent:
 如果用户询问的是测试用例生成系统相关问题，请强调您作为测试用例生成系统管理专家的专业性。
 """
         
-        result = await self.agent.run(prompt, deps=deps)
+        with metric_labels(stage="engineer"):
+            result = await self.agent.run(prompt, deps=deps)
+        record_usage("engineer", result.usage())
         return result.data
     
     def _parse_consultation_result(self, result_str: str) -> TestConsultation:
@@ -11,7 +11,6 @@
 """
 
 import sys
-import asyncio
 from datetime import datetime
 
 from PyQt5.QtWidgets import (
@@ -20,7 +19,7 @@ from PyQt5.QtWidgets import (
     QTableWidget, QTableWidgetItem, QFileDialog, QMessageBox,
     QSplitter, QGroupBox, QListWidget, QTextBrowser, QComboBox
 )
-from PyQt5.QtCore import QThread, pyqtSignal, Qt
+from PyQt5.QtCore import pyqtSignal, Qt, QTimer
 from PyQt5.QtGui import QFont, QTextCursor, QPixmap, QIcon
 
 # 导入测试工程师智能体模块
@@ -32,11 +31,17 @@ from test_engineer_agent import (
     review_my_testcases,
     TEST_KNOWLEDGE_BASE
 )
+from metrics import registry
+from qt_async import AsyncWorker
+from async_runtime import shutdown_runtime
+from http_pool import format_pool_stats
+import llms
+from usage_tracker import session_usage
 
 import pandas as pd
 
-class ChatWorkerThread(QThread):
-    """聊天工作线程"""
+class ChatWorkerThread(AsyncWorker):
+    """聊天任务（在共享的后台事件循环中执行，连接在多次对话之间复用）"""
     response_signal = pyqtSignal(str)
     error_signal = pyqtSignal(str)
 
@@ -45,13 +50,10 @@ class ChatWorkerThread(QThread):
         self.message = message
         self.chat_type = chat_type
 
-    def run(self):
-        try:
-            asyncio.run(self._async_chat())
-        except Exception as e:
-            self.error_signal.emit(f"对话出错: {str(e)}")
+    def on_error(self, error):
+        self.error_signal.emit(f"对话出错: {str(error)}")
 
-    async def _async_chat(self):
+    async def run_async(self):
         try:
             if self.chat_type == "chat":
                 response = await chat_with_test_engineer(self.message)
@@ -64,8 +66,8 @@ class ChatWorkerThread(QThread):
         except Exception as e:
             self.error_signal.emit(f"AI响应出错: {str(e)}")
 
-class TestCaseReviewWorkerThread(QThread):
-    """测试用例评审工作线程"""
+class TestCaseReviewWorkerThread(AsyncWorker):
+    """测试用例评审任务（在共享的后台事件循环中执行）"""
     result_signal = pyqtSignal(str)
     error_signal = pyqtSignal(str)
 
@@ -73,13 +75,10 @@ class TestCaseReviewWorkerThread(QThread):
         super().__init__()
         self.test_cases = test_cases
 
-    def run(self):
-        try:
-            asyncio.run(self._async_review())
-        except Exception as e:
-            self.error_signal.emit(f"评审出错: {str(e)}")
+    def on_error(self, error):
+        self.error_signal.emit(f"评审出错: {str(error)}")
 
-    async def _async_review(self):
+    async def run_async(self):
         try:
             print("开始评审测试用例...")
             result = await review_my_testcases(self.test_cases)
@@ -100,6 +99,8 @@ class TestEngineerMainWindow(QMainWindow):
         self.setWindowTitle("🤖 软件测试工程师智能体 - 专业测试咨询系统")
         self.setGeometry(100, 100, 1200, 800)
         self.chat_history = []
+        self.chat_worker = None
+        self.review_worker = None
         self.init_ui()
         self.apply_professional_style()
         
@@ -339,10 +340,15 @@ class TestEngineerMainWindow(QMainWindow):
         status_layout = QVBoxLayout(status_group)
         
         self.system_status = QTextBrowser()
-        self.system_status.setMaximumHeight(150)
+        self.system_status.setMaximumHeight(260)
         self.update_system_status()
         status_layout.addWidget(self.system_status)
         
+        # 定时刷新，实时显示大模型调用指标
+        self.status_timer = QTimer(self)
+        self.status_timer.timeout.connect(self.update_system_status)
+        self.status_timer.start(2000)
+        
         layout.addWidget(status_group)
         
         # 管理功能
@@ -464,12 +470,19 @@ class TestEngineerMainWindow(QMainWindow):
         # 获取对话模式
         chat_type = "consultation" if "咨询" in self.chat_mode_combo.currentText() else "chat"
         
-        # 启动聊天线程
+        # 提交聊天任务到后台事件循环
         self.chat_worker = ChatWorkerThread(message, chat_type)
         self.chat_worker.response_signal.connect(self.handle_chat_response)
         self.chat_worker.error_signal.connect(self.handle_chat_error)
         self.chat_worker.start()
 
+    def closeEvent(self, event):
+        """关闭窗口时取消未完成的对话和评审任务"""
+        for worker in (self.chat_worker, self.review_worker):
+            if worker is not None:
+                worker.cancel()
+        super().closeEvent(event)
+
     def handle_chat_response(self, response):
         """处理聊天响应"""
         self.add_message_to_chat("🤖 测试专家", response)
@@ -575,7 +588,9 @@ class TestEngineerMainWindow(QMainWindow):
                 case[headers[j]] = item.text() if item else ""
             test_cases.append(case)
         
-        # 启动评审线程
+        # 启动评审任务（上一次评审未完成时先取消）
+        if self.review_worker is not None:
+            self.review_worker.cancel()
         self.review_worker = TestCaseReviewWorkerThread(test_cases)
         self.review_worker.result_signal.connect(self.show_review_result)
         self.review_worker.error_signal.connect(self.show_review_error)
@@ -656,6 +671,12 @@ class TestEngineerMainWindow(QMainWindow):
 智能体版本: v1.0.0
 支持功能: 智能对话、用例评审、知识库查询
 当前会话: {len(self.chat_history)} 条消息
+
+{registry.format_summary()}
+
+{session_usage.format_summary()}
+
+{format_pool_stats(llms.http_transport.stats())}
 """
         self.system_status.setPlainText(status_text)
 
@@ -677,6 +698,7 @@ def main():
     """主函数"""
     app = QApplication(sys.argv)
     app.setApplicationName("软件测试工程师智能体")
+    app.aboutToQuit.connect(shutdown_runtime)
     
     # 设置应用图标（如果有的话）
     # app.setWindowIcon(QIcon("icon.png"))
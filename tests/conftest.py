@@ -0,0 +1,26 @@
+import asyncio
+
+import pytest
+
+from db_pool import close_all_pools
+
+
+@pytest.fixture
+def run():
+    """在新的事件循环中运行协程，结束后关闭数据库连接池"""
+
+    def runner(coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                await close_all_pools()
+
+        return asyncio.run(main())
+
+    return runner
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "requirements.sqlite")
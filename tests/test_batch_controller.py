@@ -0,0 +1,61 @@
+from batch_controller import AdaptiveBatchSizer, get_batch_controller
+
+
+class Run:
+    pass
+
+
+def test_additive_increase_and_multiplicative_decrease():
+    sizer = AdaptiveBatchSizer(10, min_size=3, max_size=20, increase_step=2, decrease_factor=0.5)
+    assert sizer.observe(10, 10, 1.0) == 12
+    assert sizer.observe(12, 12, 1.0) == 14
+    assert sizer.observe(14, 5, 1.0, truncated=True) == 7
+    assert sizer.ceiling == 14
+
+
+def test_growth_stops_below_truncation_ceiling_until_probe():
+    sizer = AdaptiveBatchSizer(10, min_size=3, max_size=40, increase_step=2, probe_after=2)
+    sizer.observe(10, 3, 1.0, truncated=True)
+    sizes = [sizer.observe(sizer.size, sizer.size, 1.0) for _ in range(5)]
+    assert sizes == [7, 9, 9, 11, 11]
+
+
+def test_short_yield_and_slow_batches_shrink():
+    sizer = AdaptiveBatchSizer(16, min_size=3, target_latency=10.0)
+    assert sizer.observe(16, 4, 1.0) == 8
+    assert sizer.observe(8, 8, 30.0) == 4
+    assert sizer.observe(4, 4, 30.0) == 3
+
+
+def test_controllers_are_not_shared_between_runs():
+    first, second = Run(), Run()
+    controller = get_batch_controller("testcase", initial=15, owner=first, min_size=3, max_size=40)
+    controller.observe(15, 15, 1.0)
+    assert get_batch_controller("testcase", initial=15, owner=second, min_size=3, max_size=40).next_size() == 15
+    assert get_batch_controller("testcase", initial=15, min_size=3, max_size=40) is not controller
+
+
+def test_grows_above_initial_after_complete_fast_batches():
+    controller = get_batch_controller("testcase", initial=10, owner=Run(), min_size=3, max_size=40)
+    for _ in range(5):
+        controller.observe(controller.size, controller.size, 1.0)
+    assert controller.next_size() == 20
+
+
+def test_reuse_within_a_run_keeps_learned_size():
+    run = Run()
+    controller = get_batch_controller("testcase", initial=15, owner=run, min_size=3, max_size=40)
+    for _ in range(3):
+        controller.observe(controller.size, controller.size, 1.0)
+    assert controller.next_size() == 21
+
+    again = get_batch_controller("testcase", initial=15, owner=run, min_size=3, max_size=18)
+    assert again is controller
+    assert again.next_size() == 18
+
+
+def test_reseed_keeps_smaller_learned_size():
+    run = Run()
+    controller = get_batch_controller("doc", initial=20, owner=run, min_size=5, max_size=60)
+    controller.observe(20, 2, 1.0, truncated=True)
+    assert get_batch_controller("doc", initial=20, owner=run, min_size=5, max_size=60).next_size() == 10
@@ -0,0 +1,28 @@
+import asyncio
+
+from http_pool import LoopBoundTransport
+
+
+def test_limiter_is_shared_within_an_event_loop():
+    transport = LoopBoundTransport({"max_connections": 2})
+    running = 0
+    peak = 0
+
+    async def call():
+        nonlocal running, peak
+        async with transport.limiter():
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    async def scenario():
+        # 两组互不知情的调用方（如两个批次执行器），合计并发仍不超过连接池上限
+        await asyncio.gather(*(call() for _ in range(5)), *(call() for _ in range(5)))
+        limiter = transport.limiter()
+        await transport.aclose()
+        return limiter
+
+    first = asyncio.run(scenario())
+    assert peak == 2
+    assert asyncio.run(scenario()) is not first
@@ -0,0 +1,51 @@
+from DocAGTest import connect_database, insert_requirements
+from Sql_agent import QueryPlan, fetch_requirements_in
+from db_pool import get_pool
+from models import RequirementRecord
+
+
+def records(prefix, count):
+    return [RequirementRecord(requirements=f"{prefix} {i}", importance="高", moduleName="商品管理", submitter="测试")
+            for i in range(count)]
+
+
+async def table(db_path):
+    async with get_pool(db_path).reader() as conn:
+        async with conn.execute("SELECT ID, requirements FROM test_requirements ORDER BY ID") as cursor:
+            return await cursor.fetchall()
+
+
+def test_new_run_does_not_overwrite_previous_rows(run, db_path):
+    async def scenario():
+        async with connect_database(db_path) as conn:
+            first = await insert_requirements(conn, records("第一次运行", 5), start_id=1)
+            second = await insert_requirements(conn, records("第二次运行", 3), start_id=1)
+        return first, second, await table(db_path)
+
+    first, second, rows = run(scenario())
+    assert [row["ID"] for row in first] == [1, 2, 3, 4, 5]
+    assert [row["ID"] for row in second] == [6, 7, 8]
+    assert [text for _, text in rows[:5]] == [f"第一次运行 {i}" for i in range(5)]
+    assert len(rows) == 8
+
+
+def test_start_id_is_a_lower_bound(run, db_path):
+    async def scenario():
+        async with connect_database(db_path) as conn:
+            await insert_requirements(conn, records("已有", 2), start_id=1)
+            return await insert_requirements(conn, records("新需求", 2), start_id=100)
+
+    assert [row["ID"] for row in run(scenario())] == [100, 101]
+
+
+def test_query_only_sees_this_runs_rows(run, db_path):
+    async def scenario():
+        async with connect_database(db_path) as conn:
+            await insert_requirements(conn, records("旧运行", 4), start_id=1)
+            current = await insert_requirements(conn, records("本次运行", 2), start_id=1)
+            plan = QueryPlan(sql="SELECT * FROM test_requirements WHERE moduleName = ?", params=("商品管理",))
+            return await fetch_requirements_in(conn, plan, [row["ID"] for row in current])
+
+    texts = run(scenario())
+    assert len(texts) == 2
+    assert all("本次运行" in text for text in texts)
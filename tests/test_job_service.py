@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from job_service import FairQueue, HttpError, Job, JobService
+
+
+def job(job_id, project):
+    return Job(job_id, project, job_id, {}, "run-" + job_id)
+
+
+def drain(queue):
+    order = []
+    while (item := queue.pop()) is not None:
+        order.append(item.job_id)
+    return order
+
+
+def test_fair_queue_round_robin_across_projects():
+    queue = FairQueue()
+    for job_id, project in [("a1", "A"), ("a2", "A"), ("a3", "A"), ("b1", "B"), ("b2", "B"), ("c1", "C")]:
+        queue.push(job(job_id, project))
+    assert queue.position("a2") == 4
+    assert queue.counts() == {"A": 3, "B": 2, "C": 1}
+    assert drain(queue) == ["a1", "b1", "c1", "a2", "b2", "a3"]
+
+
+def test_fair_queue_project_returning_after_pop_goes_last():
+    queue = FairQueue()
+    queue.push(job("a1", "A"))
+    queue.push(job("b1", "B"))
+    assert queue.pop().job_id == "a1"
+    queue.push(job("a2", "A"))
+    queue.push(job("c1", "C"))
+    assert drain(queue) == ["b1", "a2", "c1"]
+
+
+def test_fair_queue_remove():
+    queue = FairQueue()
+    queue.push(job("a1", "A"))
+    queue.push(job("b1", "B"))
+    assert queue.remove("a1").job_id == "a1"
+    assert queue.remove("missing") is None
+    assert drain(queue) == ["b1"]
+
+
+@pytest.fixture
+def service(tmp_path):
+    data_dir = tmp_path / "data"
+    (data_dir / "erp").mkdir(parents=True)
+    (data_dir / "erp" / "需求.doc").write_bytes(b"doc")
+    (tmp_path / "secret.doc").write_bytes(b"secret")
+    return JobService(str(tmp_path / "jobs.sqlite"), workers=1, data_dir=str(data_dir))
+
+
+@pytest.mark.parametrize("payload", [
+    {"project": "erp", "doc_path": "../../secret.doc"},
+    {"project": "erp", "doc_path": "/etc/passwd"},
+    {"project": "erp", "doc_path": "需求.doc", "db_path": "/tmp/x.sqlite"},
+    {"project": "erp", "doc_path": "需求.doc", "excel_path": "../../out.xlsx"},
+    {"project": "erp", "doc_path": "missing.doc"},
+    {"project": "erp"},
+    {"project": "../erp", "doc_path": "需求.doc"},
+    {"project": "erp", "doc_path": "需求.doc", "total": "很多"},
+    {"project": "erp", "doc_path": "需求.doc", "batch_size": 0},
+    {"project": "erp", "doc_path": "需求.doc", "total": True},
+    {"project": "erp", "doc_path": "需求.doc", "pipelined": "yes"},
+    {"project": "erp", "doc_path": "需求.doc", "case_prompt": ["列表"]},
+])
+def test_submit_rejects_invalid_params(run, service, payload):
+    with pytest.raises(HttpError) as error:
+        run(service.submit(payload))
+    assert error.value.status == 400
+
+
+def test_each_job_gets_its_own_database(run, service):
+    async def scenario():
+        first = await service.submit({"project": "erp", "doc_path": "需求.doc"})
+        second = await service.submit({"project": "erp", "doc_path": "需求.doc"})
+        return first, second
+
+    first, second = run(scenario())
+    project_dir = service.project_dir("erp")
+    assert first.params["doc_path"] == os.path.join(project_dir, "需求.doc")
+    assert first.params["db_path"] != second.params["db_path"]
+    for params in (first.params, second.params):
+        assert os.path.commonpath([project_dir, params["db_path"]]) == project_dir
+        assert os.path.commonpath([project_dir, params["excel_path"]]) == project_dir
+    assert [item.job_id for item in (service.queue.pop(), service.queue.pop())] == [first.job_id, second.job_id]
+
+
+def test_submit_coerces_numeric_strings(run, service):
+    job = run(service.submit({"project": "erp", "doc_path": "需求.doc", "total": "50", "batch_size": 8.0}))
+    assert (job.params["total"], job.params["batch_size"]) == (50, 8)
@@ -0,0 +1,76 @@
+import json
+import random
+
+import pytest
+
+from json_stream import JSONObjectStream, parse_json_objects
+
+OUTPUT = '''以下是生成的测试用例：
+```json
+[
+  {"功能项": "登录", "输入": "http://example.com/a//b", "预期结果": "提示\\"成功\\""},  // 第一条
+  /* 第二条 * 含嵌套对象 */
+  {"功能项": "搜索", "参数": {"关键字": "{手机}", "页码": 1}, "步骤": ["1", "2"],},
+  {"功能项": "下单", // 行内注释
+   "数量": 2}
+]
+```
+'''
+EXPECTED = [
+    {"功能项": "登录", "输入": "http://example.com/a//b", "预期结果": '提示"成功"'},
+    {"功能项": "搜索", "参数": {"关键字": "{手机}", "页码": 1}, "步骤": ["1", "2"]},
+    {"功能项": "下单", "数量": 2},
+]
+
+
+def feed_chunks(text, sizes):
+    stream = JSONObjectStream()
+    objects = []
+    pos = 0
+    for size in sizes:
+        objects.extend(stream.feed(text[pos:pos + size]))
+        pos += size
+    objects.extend(stream.feed(text[pos:]))
+    return objects, stream.report()
+
+
+def test_parses_model_output_with_comments_and_trailing_commas():
+    objects, report = parse_json_objects(OUTPUT)
+    assert objects == EXPECTED
+    assert (report.objects, report.failed, report.truncated) == (3, 0, False)
+
+
+@pytest.mark.parametrize("size", range(1, 12))
+def test_fixed_chunk_sizes_give_the_same_result(size):
+    objects, report = feed_chunks(OUTPUT, [size] * len(OUTPUT))
+    assert objects == EXPECTED
+    assert report == parse_json_objects(OUTPUT)[1]
+
+
+def test_random_chunking_gives_the_same_result():
+    rng = random.Random(7)
+    expected_report = parse_json_objects(OUTPUT)[1]
+    for _ in range(200):
+        sizes = [rng.randint(0, 8) for _ in range(len(OUTPUT))]
+        objects, report = feed_chunks(OUTPUT, sizes)
+        assert objects == EXPECTED
+        assert report == expected_report
+
+
+def test_truncation_reports_last_complete_object():
+    text = json.dumps(EXPECTED, ensure_ascii=False)
+    for cut in range(1, len(text)):
+        objects, report = parse_json_objects(text[:cut])
+        assert objects == EXPECTED[:len(objects)]
+        assert report.truncated
+        # 从 offset 开始的内容需要重新生成：之前的文本恰好包含已解析的对象
+        assert parse_json_objects(text[:report.offset])[0] == objects
+
+
+def test_object_cut_mid_string_keeps_pending_text():
+    text = '[{"功能项": "登录"}, {"功能项": "搜'
+    objects, report = parse_json_objects(text)
+    assert objects == [{"功能项": "登录"}]
+    assert report.truncated
+    assert report.offset == text.index("}") + 1
+    assert report.pending == '{"功能项": "搜'
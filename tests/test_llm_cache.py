@@ -0,0 +1,31 @@
+from pydantic import BaseModel
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+from pydantic_ai.models.function import FunctionModel
+
+from llm_cache import CachedModel, LLMResponseCache
+
+
+class Summary(BaseModel):
+    count: int
+
+
+def test_rejected_response_is_not_served_from_cache(run, tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite"))
+    replies = iter([{"count": "很多"}, {"count": 3}, {"count": 4}])
+    calls = []
+
+    async def respond(messages, info):
+        calls.append(len(messages))
+        return ModelResponse(parts=[ToolCallPart(info.result_tools[0].name, next(replies))])
+
+    agent = Agent(CachedModel(FunctionModel(respond), cache), result_type=Summary)
+
+    assert run(agent.run("统计")).data.count == 3
+    # 未通过校验的第一个响应已被删除，只保留重试后的有效响应
+    assert calls == [1, 3]
+    assert cache.stats()["entries"] == 1
+
+    # 再次运行时不会命中无效响应，重新请求模型
+    assert run(agent.run("统计")).data.count == 4
+    assert calls == [1, 3, 1]
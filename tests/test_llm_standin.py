@@ -0,0 +1,28 @@
+import json
+
+from llm_standin import CassetteStore, request_key
+
+
+def body(date, question="生成需求"):
+    return {"model": "qwen", "stream": True, "messages": [
+        {"role": "system", "content": f"你是测试工程师。当前的时间为：{date}"},
+        {"role": "user", "content": question},
+    ]}
+
+
+def test_key_ignores_date_in_system_prompt():
+    assert request_key(body("2026-10-17")) == request_key(body("2026-10-18"))
+    assert request_key(body("2026-10-17")) != request_key(body("2026-10-17", "生成测试用例"))
+    # 用户消息中的日期是查询条件，不能忽略
+    assert request_key(body("2026-10-17", "2024-09-01 的需求")) != request_key(body("2026-10-17", "2024-09-02 的需求"))
+
+
+def test_cassette_recorded_on_another_day_replays(tmp_path):
+    path = tmp_path / "cassettes.jsonl"
+    recorded = body("2026-10-16")
+    # 旧版本按完整请求体计算的键
+    entry = {"key": "stale-key", "request": recorded, "response": {"id": "chatcmpl-1"}}
+    path.write_text(json.dumps(entry, ensure_ascii=False) + "\n", encoding="utf-8")
+
+    store = CassetteStore(str(path))
+    assert store.lookup(request_key(body("2026-10-17"))) == {"id": "chatcmpl-1"}
@@ -0,0 +1,59 @@
+from db_migrations import FTS_TABLE, describe_schema, fts_tokenizer, has_fts
+from db_pool import get_pool
+
+INSERT = """
+INSERT OR REPLACE INTO test_requirements (ID, requirements, tag, date, submitter, importance, moduleName)
+VALUES (?, ?, 0, '2025-01-01', '测试', '高', ?)
+"""
+
+
+async def write(db_path, rows):
+    async with get_pool(db_path).writer() as conn:
+        await conn.executemany(INSERT, rows)
+        await conn.commit()
+
+
+async def match(db_path, keyword):
+    async with get_pool(db_path).reader() as conn:
+        async with conn.execute(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ? ORDER BY rowid",
+                                (f'"{keyword}"',)) as cursor:
+            return [row[0] for row in await cursor.fetchall()]
+
+
+async def integrity_check(db_path):
+    async with get_pool(db_path).writer() as conn:
+        await conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('integrity-check', 1)")
+
+
+def test_replacing_requirements_keeps_fts_in_sync(run, db_path):
+    async def scenario():
+        async with get_pool(db_path).writer() as conn:
+            assert await has_fts(conn)
+        await write(db_path, [(i, f"商品新增需求 {i}", "商品管理") for i in range(1, 4)])
+        assert await match(db_path, "商品新增") == [1, 2, 3]
+        # 同一批 ID 再写入一次，旧内容应从索引中删除
+        await write(db_path, [(i, f"订单查询需求 {i}", "订单管理") for i in range(1, 4)])
+        await integrity_check(db_path)
+        return await match(db_path, "商品新增"), await match(db_path, "订单查询")
+
+    old, new = run(scenario())
+    assert old == []
+    assert new == [1, 2, 3]
+
+
+def test_schema_description_follows_actual_tokenizer(run, db_path):
+    async def scenario():
+        async with get_pool(db_path).writer() as conn:
+            created = await fts_tokenizer(conn)
+            # 模拟不支持 trigram 的 SQLite：_create_fts 退回 unicode61
+            await conn.execute(f"DROP TABLE {FTS_TABLE}")
+            await conn.execute(f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(requirements, moduleName, "
+                               f"content='test_requirements', content_rowid='ID', tokenize='unicode61')")
+            return created, await fts_tokenizer(conn)
+
+    created, fallback = run(scenario())
+    assert created == "trigram"
+    assert fallback == "unicode61"
+    assert "trigram" in describe_schema(created)
+    assert "trigram" not in describe_schema(fallback) and "LIKE" in describe_schema(fallback)
+    assert FTS_TABLE not in describe_schema(None)
@@ -0,0 +1,34 @@
+import pytest
+
+from sql_intent import RequirementFilterParser
+
+BASE = "SELECT * FROM test_requirements"
+
+
+@pytest.mark.parametrize("text, sql, params", [
+    ("获取商品管理模块的需求", f"{BASE} WHERE (moduleName LIKE ?) ORDER BY ID", ("%商品管理%",)),
+    ("获取来源管理模块的需求", f"{BASE} WHERE (moduleName LIKE ?) ORDER BY ID", ("%来源管理%",)),
+    ("请创建一个 SELECT 查询来获取商品管理模块的需求。", f"{BASE} WHERE (moduleName LIKE ?) ORDER BY ID", ("%商品管理%",)),
+    ("获取所有属于商品管理模块的需求", f"{BASE} WHERE (moduleName LIKE ?) ORDER BY ID", ("%商品管理%",)),
+    ("查询商品品牌和商品分类模块中重要程度为高的未完成需求",
+     f"{BASE} WHERE (moduleName LIKE ? OR moduleName LIKE ?) AND importance = ? AND tag = ? ORDER BY ID",
+     ("%商品品牌%", "%商品分类%", "高", 0)),
+    ("获取2024-09-01到2024-09-30期间田老师提交的需求",
+     f"{BASE} WHERE date BETWEEN ? AND ? AND submitter = ? ORDER BY ID", ("2024-09-01", "2024-09-30", "田老师")),
+    ("查询提交人为田老师的需求", f"{BASE} WHERE submitter = ? ORDER BY ID", ("田老师",)),
+    ("获取所有需求", f"{BASE} ORDER BY ID", ()),
+])
+def test_parses_simple_filters(text, sql, params):
+    assert RequirementFilterParser().parse(text) == (sql, params)
+
+
+@pytest.mark.parametrize("text", [
+    "获取不属于商品管理模块的需求",
+    "获取非商品管理模块的需求",
+    "查询除商品管理模块以外的需求",
+    "排除商品管理模块后列出需求",
+    "获取田老师提交的商品管理模块的需求",
+    "帮我写一首诗",
+])
+def test_falls_back_to_llm(text):
+    assert RequirementFilterParser().parse(text) is None
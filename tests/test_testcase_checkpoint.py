@@ -0,0 +1,108 @@
+import json
+import re
+
+import pytest
+from pydantic_ai.messages import ModelResponse, TextPart
+from pydantic_ai.models.function import FunctionModel
+
+import Testcase_agent
+from checkpoint_store import RunCheckpoint
+
+
+def case(number):
+    return {"模块名称": "商品管理", "功能项": f"功能{number}", "用例说明": "说明", "前置条件": "无", "输入": "输入",
+            "执行步骤": "步骤", "预期结果": "结果", "重要程度": "高"}
+
+
+class FakeModel:
+    """一次性生成只返回 5 条，迫使进入分批模式；用例编号全局递增，便于检查重复写入"""
+
+    def __init__(self):
+        self.counter = 0
+
+    async def respond(self, messages, info):
+        prompt = messages[-1].parts[-1].content
+        count = 5 if "约" in prompt else int(re.search(r"请生成 (\d+) 条", prompt).group(1))
+        cases = [case(self.counter + i) for i in range(count)]
+        self.counter += count
+        return ModelResponse(parts=[TextPart(json.dumps(cases, ensure_ascii=False))])
+
+    async def stream(self, messages, info):
+        yield (await self.respond(messages, info)).parts[0].content
+
+    def function_model(self):
+        return FunctionModel(self.respond, stream_function=self.stream)
+
+
+class FakeExcel:
+    def __init__(self, fail_on=()):
+        self.rows = []
+        self.calls = 0
+        self.fail_on = set(fail_on)
+
+    async def write(self, cases, path):
+        self.calls += 1
+        if self.calls in self.fail_on:
+            raise PermissionError("文件被占用")
+        self.rows.extend(item["功能项"] for item in cases)
+
+
+@pytest.fixture
+def excel(monkeypatch):
+    def install(**kwargs):
+        fake = FakeExcel(**kwargs)
+        monkeypatch.setitem(Testcase_agent.EXCEL_CONFIG, "mode", "append")
+        monkeypatch.setattr(Testcase_agent, "write_test_cases_to_excel", fake.write)
+        return fake
+    monkeypatch.setitem(Testcase_agent.BATCH_CONFIG, "adaptive_batching", False)
+    monkeypatch.setitem(Testcase_agent.BATCH_CONFIG, "speculative", False)
+    return install
+
+
+async def generate(model, checkpoint, tmp_path, concurrency=1):
+    with Testcase_agent.testcase_agent.override(model=model.function_model()):
+        return await Testcase_agent.run_agent("生成测试用例", excel_path=str(tmp_path / "cases.xlsx"), target_count=25,
+                                              max_batch_size=10, stream=True, concurrency=concurrency,
+                                              checkpoint=checkpoint)
+
+
+def test_failed_flush_does_not_advance_checkpoint(run, db_path, tmp_path, excel):
+    model = FakeModel()
+    broken = excel(fail_on={2})
+
+    async def first_run():
+        checkpoint = RunCheckpoint(db_path)
+        await checkpoint.start({})
+        with pytest.raises(Testcase_agent.ExcelWriteError):
+            await generate(model, checkpoint, tmp_path)
+        return checkpoint.run_id, await checkpoint.load_batches("testcase")
+
+    run_id, batches = run(first_run())
+    # 第 2 批写入失败：只有第 1 批记入检查点，且记录的已写入条数与实际一致
+    assert list(batches) == [1]
+    assert batches[1]["written"] == len(broken.rows) == 5
+
+    fixed = excel()
+
+    async def resume():
+        checkpoint = RunCheckpoint(db_path, run_id)
+        await checkpoint.start({})
+        return await generate(model, checkpoint, tmp_path)
+
+    cases = run(resume())
+    assert len(cases) == 25
+    assert len(broken.rows + fixed.rows) == len(set(broken.rows + fixed.rows)) == 25
+
+
+def test_concurrent_flush_updates_written_count(run, db_path, tmp_path, excel):
+    fake = excel()
+
+    async def scenario():
+        checkpoint = RunCheckpoint(db_path)
+        await checkpoint.start({})
+        cases = await generate(FakeModel(), checkpoint, tmp_path, concurrency=2)
+        return cases, await checkpoint.load_batches("testcase")
+
+    cases, batches = run(scenario())
+    assert len(cases) == 25
+    assert batches[max(batches)]["written"] == len(fake.rows) == 25
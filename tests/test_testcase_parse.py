@@ -0,0 +1,14 @@
+from Testcase_agent import parse_testcase_output
+from metrics import registry
+
+
+def test_parse_failures_and_truncations_are_counted_per_stage():
+    failures = registry.total("llm_parse_failures_total", stage="testcase")
+    assert parse_testcase_output("模型没有返回 JSON")[0] == []
+    assert registry.total("llm_parse_failures_total", stage="testcase") == failures + 1
+
+    truncations = registry.total("llm_truncations_total", stage="testcase")
+    cases, truncated = parse_testcase_output('[{"功能项": "登录"}, {"功能项": "搜')
+
+    assert cases == [{"功能项": "登录"}] and truncated
+    assert registry.total("llm_truncations_total", stage="testcase") == truncations + 1
@@ -0,0 +1,38 @@
+import json
+
+import httpx
+from openai import APITimeoutError
+from pydantic_ai.messages import ModelResponse, TextPart
+from pydantic_ai.models.function import FunctionModel
+
+import Testcase_agent
+
+
+def case(number):
+    return {"模块名称": "商品管理", "功能项": f"功能{number}", "用例说明": "说明", "前置条件": "无", "输入": "输入",
+            "执行步骤": "步骤", "预期结果": "结果", "重要程度": "高"}
+
+
+def test_retried_stream_does_not_emit_cases_twice(run, monkeypatch):
+    monkeypatch.setitem(Testcase_agent.BATCH_CONFIG, "speculative", False)
+    monkeypatch.setitem(Testcase_agent.BATCH_CONFIG, "base_delay", 0)
+    attempts = []
+
+    async def respond(messages, info):
+        return ModelResponse(parts=[TextPart(json.dumps([case(i) for i in range(5)], ensure_ascii=False))])
+
+    async def stream(messages, info):
+        attempts.append(1)
+        text = json.dumps([case(i) for i in range(5)], ensure_ascii=False)
+        for i in range(0, len(text), 40):
+            # 第一次尝试在输出一半时超时，重试后完整输出
+            if len(attempts) == 1 and i > len(text) // 2:
+                raise APITimeoutError(httpx.Request("POST", "http://llm.test"))
+            yield text[i:i + 40]
+
+    received = []
+    with Testcase_agent.testcase_agent.override(model=FunctionModel(respond, stream_function=stream)):
+        cases = run(Testcase_agent.run_agent("生成测试用例", target_count=5, stream=True, on_case=received.append))
+
+    assert len(attempts) == 2
+    assert [item["功能项"] for item in received] == [item["功能项"] for item in cases] == [f"功能{i}" for i in range(5)]
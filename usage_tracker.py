@@ -0,0 +1,196 @@
+"""
+Token 用量与成本统计
+
+每个智能体在 agent.run 之后调用 record_usage(stage, result.usage())，用量会累加到：
+- 当前运行（usage_run() 上下文内，例如 GUI 的一次“一键生成测试用例”）
+- 进程级的会话累计 session_usage（测试工程师智能体等不属于流水线运行的调用也会计入）
+
+按阶段（doc / sql / testcase / engineer）汇总请求数、输入/输出 token 和产出条数，
+并计算每千输出 token 产出的条数和每条用例的成本。运行结束后通过 save_run_usage()
+写入数据库中的 run_history 表（每个阶段一行，另有一行 total），便于根据历史数据调整
+批次大小和提示词长度。
+
+单价通过环境变量配置（元 / 千 token），默认值为 qwen-max 的公开价格：
+    LLM_PRICE_INPUT_PER_1K=0.0024
+    LLM_PRICE_OUTPUT_PER_1K=0.0096
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import aiosqlite
+from pydantic_ai.usage import Usage
+
+PRICE_INPUT_PER_1K = float(os.environ.get("LLM_PRICE_INPUT_PER_1K", 0.0024))
+PRICE_OUTPUT_PER_1K = float(os.environ.get("LLM_PRICE_OUTPUT_PER_1K", 0.0096))
+
+# 计算每条成本时作为“产出”的阶段（测试用例）
+OUTPUT_STAGE = "testcase"
+
+
+@dataclass
+class StageUsage:
+    """单个阶段的用量"""
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    items: int = 0  # 产出条数（需求条数 / 查询到的需求数 / 测试用例条数）
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    @property
+    def cost(self) -> float:
+        return self.input_tokens / 1000 * PRICE_INPUT_PER_1K + self.output_tokens / 1000 * PRICE_OUTPUT_PER_1K
+
+    @property
+    def items_per_1k_output_tokens(self) -> float:
+        return self.items / (self.output_tokens / 1000) if self.output_tokens else 0.0
+
+    def add(self, other: "StageUsage"):
+        self.requests += other.requests
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.items += other.items
+
+
+@dataclass
+class RunUsage:
+    """一次运行（或整个会话）的用量，按阶段汇总"""
+    name: str = ""
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    stages: Dict[str, StageUsage] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add_usage(self, stage: str, usage: Usage):
+        with self._lock:
+            account = self.stages.setdefault(stage, StageUsage())
+            account.requests += usage.requests or 0
+            account.input_tokens += usage.request_tokens or 0
+            account.output_tokens += usage.response_tokens or 0
+
+    def add_items(self, stage: str, count: int):
+        with self._lock:
+            self.stages.setdefault(stage, StageUsage()).items += count
+
+    def total(self) -> StageUsage:
+        total = StageUsage()
+        with self._lock:
+            for account in self.stages.values():
+                total.add(account)
+        # 整体产出以最终生成的测试用例条数计
+        total.items = self.stages[OUTPUT_STAGE].items if OUTPUT_STAGE in self.stages else 0
+        return total
+
+    @property
+    def cost_per_case(self) -> float:
+        total = self.total()
+        return total.cost / total.items if total.items else 0.0
+
+    def summary(self) -> Dict:
+        """按阶段汇总的用量字典"""
+        def describe(account: StageUsage) -> Dict:
+            return {
+                "requests": account.requests,
+                "input_tokens": account.input_tokens,
+                "output_tokens": account.output_tokens,
+                "items": account.items,
+                "cost": round(account.cost, 6),
+                "items_per_1k_output_tokens": round(account.items_per_1k_output_tokens, 3),
+            }
+
+        with self._lock:
+            stages = {stage: describe(account) for stage, account in self.stages.items()}
+        return {
+            "name": self.name,
+            "elapsed": round((self.finished_at or time.time()) - self.started_at, 3),
+            "stages": stages,
+            "total": describe(self.total()),
+            "cost_per_case": round(self.cost_per_case, 6),
+        }
+
+    def format_summary(self) -> str:
+        """生成适合打印或在 GUI 中展示的摘要"""
+        lines = ["💰 Token 用量统计:"]
+        with self._lock:
+            items = list(self.stages.items())
+        for stage, account in items:
+            lines.append(f"   - {stage}: 请求 {account.requests} 次，输入 {account.input_tokens}，"
+                         f"输出 {account.output_tokens} token，产出 {account.items} 条，约 {account.cost:.4f} 元")
+        total = self.total()
+        lines.append(f"   - 合计: {total.total_tokens} token，约 {total.cost:.4f} 元；"
+                     f"每千输出 token 产出 {total.items_per_1k_output_tokens:.2f} 条用例，"
+                     f"每条用例 {self.cost_per_case:.4f} 元")
+        return "\n".join(lines)
+
+
+# 进程级的会话累计
+session_usage = RunUsage(name="session")
+
+_current_run: ContextVar[Optional[RunUsage]] = ContextVar("current_usage_run", default=None)
+
+
+@contextmanager
+def usage_run(name: str = ""):
+    """
+    开始一次运行的用量统计，上下文内（包括其中创建的异步任务）的 record_usage 都计入该运行
+    Args:
+        name: 运行名称
+    Returns:
+        RunUsage
+    """
+    run = RunUsage(name=name)
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        run.finished_at = time.time()
+        _current_run.reset(token)
+
+
+def _accounts() -> List[RunUsage]:
+    run = _current_run.get()
+    return [session_usage, run] if run is not None else [session_usage]
+
+
+def record_usage(stage: str, usage: Usage):
+    """记录一次 agent.run 的用量（result.usage()）"""
+    for account in _accounts():
+        account.add_usage(stage, usage)
+
+
+def record_items(stage: str, count: int):
+    """记录某阶段的产出条数"""
+    for account in _accounts():
+        account.add_items(stage, count)
+
+
+RUN_HISTORY_SQL = """
+INSERT INTO run_history (run_name, started_at, finished_at, stage, requests, input_tokens, output_tokens,
+                         items, cost, items_per_1k_output_tokens, cost_per_case)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+async def save_run_usage(conn: aiosqlite.Connection, run: RunUsage):
+    """
+    将一次运行的用量写入 run_history 表（每个阶段一行，另有一行 total）
+    Args:
+        conn: 数据库连接（表由 db_migrations 创建）
+        run: 运行用量
+    """
+    finished_at = run.finished_at or time.time()
+    rows = []
+    for stage, account in list(run.stages.items()) + [("total", run.total())]:
+        rows.append((run.name, run.started_at, finished_at, stage, account.requests, account.input_tokens,
+                     account.output_tokens, account.items, account.cost, account.items_per_1k_output_tokens,
+                     run.cost_per_case if stage == "total" else None))
+    await conn.executemany(RUN_HISTORY_SQL, rows)
+    await conn.commit()